@@ -0,0 +1,81 @@
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class DistanceCursorPagination(BasePagination):
+    # Forward-only keyset pagination for querysets ordered by (knn_distance, id). The cursor carries the last
+    # row's distance and id, so no page needs COUNT(*). The (distance, id) filter cannot seek into the GiST <->
+    # scan, though: the index still walks every row nearer than the cursor, so deep pages cost like OFFSET does.
+    # The distance round-trips through repr() so ties on it compare exactly equal on the next page.
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    distance_field = 'knn_distance'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            distance, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.distance_field}__gt': distance}) | Q(**{self.distance_field: distance, 'pk__gt': pk})
+            )
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(getattr(last, self.distance_field), last.pk)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, distance, pk):
+        return b64encode(f'{distance!r}:{pk}'.encode()).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            distance, pk = b64decode(encoded.encode('ascii')).decode('ascii').split(':')
+            return float(distance), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound('Invalid cursor')
+
+
+class ScheduleCursorPagination(CursorPagination):
+    # Keyset pages over (start, id); rows are streamed in start order without COUNT(*) or OFFSET
+    ordering = ('start', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,12 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class MVTRenderer(BaseRenderer):
+    media_type = 'application/vnd.mapbox-vector-tile'
+    format = 'mvt'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Error responses carry a dict; a tile client can only use the status code
+        return data if isinstance(data, bytes) else b''
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib.gis.geos import Point
 from rest_framework import serializers
 
+from app import services
 from app.models import AttractionSchedule, Booking, Itinerary, ItineraryItem, PointOfInterest, POITranslation, Review
 
 
@@ -11,7 +13,7 @@ class POITranslationSerializer(serializers.ModelSerializer):
 
 
 class PointOfInterestSerializer(serializers.ModelSerializer):
-    translations = POITranslationSerializer(many=True, read_only=True)
+    translations = serializers.SerializerMethodField()
     location = serializers.JSONField()
 
     class Meta:
@@ -19,6 +21,15 @@ class PointOfInterestSerializer(serializers.ModelSerializer):
         fields = ['id', 'location', 'name', 'operator', 'translations', 'created_at', 'updated_at']
         read_only_fields = ['operator']
 
+    def get_translations(self, instance):
+        languages = self.context.get('languages', ())
+        translations = getattr(instance, 'localized_translations', None)
+        if translations is None:
+            translations = instance.translations.all()
+            if languages:
+                translations = [t for t in translations if t.language_code.lower() in languages]
+        return POITranslationSerializer(translations, many=True).data
+
     def to_internal_value(self, data):
         ret = super().to_internal_value(data)
         location = data.get('location')
@@ -32,15 +43,66 @@ class PointOfInterestSerializer(serializers.ModelSerializer):
         loc = instance.location
         if isinstance(loc, Point):
             rep['location'] = {'type': 'Point', 'coordinates': [loc.x, loc.y]}
-        return rep
+        return localize_poi_data(rep, self.context.get('languages', ()))
+
+
+def localize_poi_data(data, languages):
+    # Name and description in the first language of the chain the POI has a translation for; works on
+    # language-neutral cached payloads too, which carry every translation
+    data = dict(data)
+    by_language = {t['language_code'].lower(): t for t in data['translations']}
+    matched = [by_language[language] for language in languages if language in by_language]
+    if languages:
+        data['translations'] = matched
+    translation = matched[0] if matched else None
+    data['default_name'] = data.get('default_name', data['name'])
+    data['name'] = translation['name'] if translation else data['default_name']
+    data['description'] = translation['description'] if translation else ''
+    data['language'] = translation['language_code'] if translation else None
+    return data
 
 
 class AttractionScheduleSerializer(serializers.ModelSerializer):
     poi = serializers.PrimaryKeyRelatedField(queryset=PointOfInterest.objects.all())
+    shard_count = serializers.IntegerField(min_value=0, max_value=64, required=False)
 
     class Meta:
         model = AttractionSchedule
-        fields = ['id', 'poi', 'start', 'end', 'total_capacity', 'remaining_capacity', 'is_active']
+        fields = ['id', 'poi', 'start', 'end', 'total_capacity', 'remaining_capacity', 'is_active', 'shard_count']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded schedules: the seats left in the shards, not the remaining_capacity snapshot
+        if instance.shard_count:
+            seats_left = getattr(instance, 'seats_left', None)
+            data['remaining_capacity'] = services.remaining_seats(instance) if seats_left is None else seats_left
+        return data
+
+
+class ScheduleRecurrenceSerializer(serializers.Serializer):
+    poi = serializers.PrimaryKeyRelatedField(queryset=PointOfInterest.objects.all())
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    every_minutes = serializers.IntegerField(min_value=5, max_value=1440)
+    duration_minutes = serializers.IntegerField(min_value=1, max_value=1440, required=False)
+    weekdays = serializers.ListField(child=serializers.IntegerField(min_value=0, max_value=6), required=False)
+    exclude_dates = serializers.ListField(child=serializers.DateField(), required=False, default=list)
+    total_capacity = serializers.IntegerField(min_value=1)
+    is_active = serializers.BooleanField(default=True)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError('end_date must not be before start_date')
+        if (attrs['end_date'] - attrs['start_date']).days >= settings.SCHEDULE_GENERATE_MAX_DAYS:
+            raise serializers.ValidationError(
+                f'A recurrence may span at most {settings.SCHEDULE_GENERATE_MAX_DAYS} days'
+            )
+        if attrs['end_time'] <= attrs['start_time']:
+            raise serializers.ValidationError('end_time must be after start_time')
+        return attrs
 
 
 class ItineraryItemSerializer(serializers.ModelSerializer):
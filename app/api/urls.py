@@ -4,9 +4,11 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     AttractionScheduleViewSet,
     BookingViewSet,
+    CacheStatsView,
     HealthCheckView,
     ItineraryItemViewSet,
     ItineraryViewSet,
+    POITileView,
     POIViewSet,
     ReviewViewSet,
 )
@@ -20,8 +22,10 @@ router.register('bookings', BookingViewSet)
 router.register('reviews', ReviewViewSet)
 
 urlpatterns = [
+    path('pois/tiles/<int:z>/<int:x>/<int:y>.mvt', POITileView.as_view(), name='poi-tile'),
     path('', include(router.urls)),
     path('health/', HealthCheckView.as_view(), name='health-check'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
 ]
 
 app_name = 'api'
@@ -1,19 +1,32 @@
+import gzip
+import hashlib
+import re
+from datetime import timedelta
 from functools import wraps
 
-from django.core.cache import cache
+from django.conf import settings
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import DatabaseError, connection
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ParseError
 from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from app import services
+from app import caching, generations, locales, services
+from app.holds import HoldNotFound
 from app.models import AttractionSchedule, Booking, Itinerary, ItineraryItem, PointOfInterest, Review
 
+from .pagination import DistanceCursorPagination, ScheduleCursorPagination
 from .permissions import IsOperatorOrReadOnly, IsOwnerOrReadOnly
+from .renderers import MVTRenderer
 from .serializers import (
     AttractionScheduleSerializer,
     BookingSerializer,
@@ -21,24 +34,58 @@ from .serializers import (
     ItinerarySerializer,
     PointOfInterestSerializer,
     ReviewSerializer,
+    ScheduleRecurrenceSerializer,
+    localize_poi_data,
 )
 
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
 
-def cache_response(timeout=60):
-    # Simple decorator for GET viewmethods with user-unaware cache
+
+def _parse_aware(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def cache_response(timeout=60, depends_on=(), localized=False):
+    # Simple decorator for GET viewmethods with user-unaware cache. ``depends_on`` lists generation tags, formatted
+    # with the view kwargs (e.g. 'poi:{pk}'); a write bumping one of them makes the cached entry unreachable.
+    # Expired entries are served stale while a single worker recomputes them (see app.caching).
+    # Entries hold the rendered (and gzipped) bytes with a strong ETag, so a hit never touches the serializer
+    # and a matching If-None-Match is answered with 304 before the view runs. ``localized`` responses are
+    # keyed on the Accept-Language fallback chain as well. Only JSON is cached: the browsable API's HTML carries
+    # the requesting user's name and CSRF token.
     def decorator(view_method):
+        view_name = caching.register(view_method.__qualname__.replace('.', ':'))
+
         @wraps(view_method)
         def _wrapped_view(self, request, *args, **kwargs):
-            if request.method != 'GET':
+            if request.method != 'GET' or not isinstance(request.accepted_renderer, JSONRenderer):
                 return view_method(self, request, *args, **kwargs)
-            cache_key = f'{self.__class__.__name__}:{view_method.__name__}:{request.get_full_path()}'
-            cached = cache.get(cache_key)
-            if cached is not None:
-                return Response(cached)
-            response = view_method(self, request, *args, **kwargs)
-            if response.status_code == 200:
-                # Only cache 200 OK JSONs
-                cache.set(cache_key, response.data, timeout=timeout)
+            tags = [tag.format(**kwargs) for tag in depends_on]
+            variant = request.accepted_renderer.format
+            if localized:
+                variant += ':' + locales.chain_key(locales.request_languages(request))
+            cache_key = f'{view_name}:{variant}:{generations.token(tags)}:{request.get_full_path()}'
+            response = None
+
+            def render():
+                nonlocal response
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return None
+                response = self.finalize_response(request, response, *args, **kwargs)
+                response.render()
+                return _rendered_entry(response)
+
+            # Only cache 200 OK responses
+            entry = caching.get_or_compute(view_name, cache_key, render, timeout, cacheable=lambda e: e is not None)
+            if entry is None:
+                return response
+            response = _serve_entry(request, entry, response)
+            if localized:
+                patch_vary_headers(response, ['Accept-Language'])
             return response
 
         return _wrapped_view
@@ -46,6 +93,40 @@ def cache_response(timeout=60):
     return decorator
 
 
+def _rendered_entry(response):
+    content = bytes(response.content)
+    etag = hashlib.sha256(content).hexdigest()[:32]
+    compressed = None
+    if settings.CACHE_RESPONSE_GZIP and len(content) >= settings.CACHE_RESPONSE_GZIP_MIN_BYTES:
+        compressed = gzip.compress(content, mtime=0)
+    return {'content': content, 'gzip': compressed, 'etag': etag, 'content_type': response['Content-Type']}
+
+
+def _serve_entry(request, entry, response=None):
+    # Both encodings share the digest; the gzip one carries its own strong ETag as a different representation
+    use_gzip = entry['gzip'] is not None and ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', ''))
+    etag = f'"{entry["etag"]}-gzip"' if use_gzip else f'"{entry["etag"]}"'
+    if_none_match = [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]
+    if '*' in if_none_match or any(tag.strip('"').removesuffix('-gzip') == entry['etag'] for tag in if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        if response is None:
+            response = HttpResponse(content_type=entry['content_type'])
+        response.content = entry['gzip'] if use_gzip else entry['content']
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(caching.stats())
+
+
 class HealthCheckView(APIView):
     def get(self, request):
         try:
@@ -58,39 +139,121 @@ class HealthCheckView(APIView):
 
 
 class POIViewSet(viewsets.ModelViewSet):
-    queryset = PointOfInterest.objects.all().prefetch_related('translations')
+    queryset = PointOfInterest.objects.all()
     serializer_class = PointOfInterestSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOperatorOrReadOnly]
 
+    @property
+    def languages(self):
+        return locales.request_languages(self.request)
+
+    def get_queryset(self):
+        return super().get_queryset().with_translations(self.languages)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'languages': self.languages}
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ['Accept-Language'])
+        return response
+
+    @cache_response(timeout=settings.GENERATION_CACHE_TIMEOUT, depends_on=('poi:{pk}',), localized=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
-    @cache_response(timeout=120)
     def nearby(self, request):
         lon = request.query_params.get('lon')
         lat = request.query_params.get('lat')
         radius = float(request.query_params.get('radius', 2.0))
         if lon is None or lat is None:
             return Response({'detail': 'lon and lat required'}, status=400)
-        qs = services.search_pois_within_radius(lon, lat, radius)
+        # Cells are cached language-neutral, with every translation, and localized per request
+        neutral = {**self.get_serializer_context(), 'languages': ()}
+        results = services.search_pois_nearby_cached(
+            lon, lat, radius, lambda pois: PointOfInterestSerializer(pois, many=True, context=neutral).data
+        )
+        if results is not None:
+            page = self.paginate_queryset(results)
+            return self.get_paginated_response([localize_poi_data(row, self.languages) for row in page])
+        qs = services.search_pois_within_radius(lon, lat, radius).with_translations(self.languages)
         page = self.paginate_queryset(qs)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=['get'], pagination_class=DistanceCursorPagination)
+    def nearest(self, request):
+        lon = request.query_params.get('lon')
+        lat = request.query_params.get('lat')
+        if lon is None or lat is None:
+            return Response({'detail': 'lon and lat required'}, status=400)
+        qs = services.pois_nearest(lon, lat).with_translations(self.languages)
+        page = self.paginate_queryset(qs)
+        data = self.get_serializer(page, many=True).data
+        for row, poi in zip(data, page):
+            row['distance_km'] = round(poi.knn_distance / 1000, 3)
+        return self.get_paginated_response(data)
+
+    @action(detail=False, methods=['get'])
+    def viewport(self, request):
+        try:
+            bbox = [float(c) for c in request.query_params['bbox'].split(',')]
+            zoom = int(request.query_params['zoom'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'bbox and zoom required'}, status=400)
+        if len(bbox) != 4 or not 0 <= zoom <= 22:
+            return Response({'detail': 'bbox must be min_lon,min_lat,max_lon,max_lat and zoom 0-22'}, status=400)
+        try:
+            return Response(services.pois_in_viewport(bbox, zoom))
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        month = request.query_params.get('month') or timezone.localdate().strftime('%Y-%m')
+        try:
+            year, month = (int(part) for part in month.split('-'))
+        except ValueError:
+            return Response({'detail': 'month must be YYYY-MM'}, status=400)
+        if not (1 <= month <= 12 and 1 <= year <= 9998):
+            return Response({'detail': 'month must be YYYY-MM'}, status=400)
+        if not pk.isdigit() or not PointOfInterest.objects.filter(pk=pk).exists():
+            raise NotFound()
+        days = services.poi_calendar_cached(int(pk), year, month)
+        return Response({'poi': int(pk), 'month': f'{year:04d}-{month:02d}', 'days': days})
+
+    @action(detail=False, methods=['get'], url_path='distance-matrix')
+    def distance_matrix(self, request):
+        try:
+            ids = [int(pk) for pk in request.query_params['ids'].split(',')]
+        except (KeyError, ValueError):
+            return Response({'detail': 'ids required'}, status=400)
+        if not 0 < len(ids) <= settings.DISTANCE_MATRIX_MAX_POIS:
+            return Response({'detail': f'between 1 and {settings.DISTANCE_MATRIX_MAX_POIS} ids allowed'}, status=400)
+        try:
+            return Response(services.poi_distance_matrix(ids))
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+
     @action(detail=True, methods=['get'])
-    @cache_response(timeout=120)
+    @cache_response(timeout=settings.GENERATION_CACHE_TIMEOUT, depends_on=('poi:{pk}',), localized=True)
     def aggregate(self, request, pk=None):
-        poi = services.poi_with_aggregate_rating(pk)
+        poi = services.poi_with_aggregate_rating(pk, self.languages)
         if poi is None:
             return Response({'detail': 'Not found'}, status=404)
         data = self.get_serializer(poi).data
         data['avg_rating'] = getattr(poi, 'avg_rating', None)
+        data['review_count'] = poi.review_count
         return Response(data)
 
     def perform_create(self, serializer):
-        poi = serializer.save(operator=self.request.user)
-        translations = self.request.data.get('translations')
-        if translations:
-            for lang, data in translations.items():
-                services.create_poi_translations_only(poi, {lang: data})
+        serializer.instance = services.create_poi(
+            self.request.user,
+            serializer.validated_data['name'],
+            serializer.validated_data['location'],
+            self.request.data.get('translations'),
+        )
 
     def perform_update(self, serializer):
         poi = self.get_object()
@@ -101,11 +264,26 @@ class POIViewSet(viewsets.ModelViewSet):
         services.delete_poi(instance)
 
 
+class POITileView(APIView):
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [MVTRenderer]
+
+    def get(self, request, z, x, y):
+        if not (0 <= z <= settings.MVT_MAX_ZOOM and x < 2**z and y < 2**z):
+            raise NotFound()
+        tile = services.get_poi_tile(z, x, y, locales.request_languages(request))
+        return Response(tile, headers={'Cache-Control': 'public, max-age=60', 'Vary': 'Accept-Language'})
+
+
 class AttractionScheduleViewSet(viewsets.ModelViewSet):
-    queryset = AttractionSchedule.objects.select_related('poi').all()
+    queryset = services.with_remaining_seats(AttractionSchedule.objects.select_related('poi'))
     serializer_class = AttractionScheduleSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOperatorOrReadOnly]
 
+    @cache_response(timeout=settings.GENERATION_CACHE_TIMEOUT, depends_on=('schedule:{pk}',))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         poi = get_object_or_404(PointOfInterest, pk=self.request.data.get('poi'))
         instance = services.create_schedule(
@@ -115,28 +293,190 @@ class AttractionScheduleViewSet(viewsets.ModelViewSet):
             serializer.validated_data['total_capacity'],
             serializer.validated_data.get('remaining_capacity'),
             serializer.validated_data.get('is_active', True),
+            serializer.validated_data.get('shard_count', 0),
         )
         serializer.instance = instance
 
     def perform_update(self, serializer):
-        schedule = self.get_object()
-        services.update_schedule(schedule, **serializer.validated_data)
-        serializer.save()
+        # update_schedule saves the instance; saving the serializer again would overwrite resharded capacity
+        instance = services.update_schedule(serializer.instance, **serializer.validated_data)
+        # The seats_left annotation was read before the update
+        instance.seats_left = services.remaining_seats(instance)
+        serializer.instance = instance
 
     def perform_destroy(self, instance):
         services.delete_schedule(instance)
 
+    @action(detail=False, methods=['get'], pagination_class=ScheduleCursorPagination)
+    def available(self, request):
+        params = request.query_params
+        try:
+            lon, lat = float(params['lon']), float(params['lat'])
+            radius = float(params.get('radius', 2.0))
+            min_seats = int(params.get('min_seats', 1))
+            start = _parse_aware(params['from']) if 'from' in params else timezone.now()
+            end = _parse_aware(params['to']) if 'to' in params else start + timedelta(days=1)
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'detail': 'lon and lat required; radius, min_seats, from and to (ISO 8601) are optional'},
+                status=400,
+            )
+        qs = services.search_available_schedules(lon, lat, radius, start, end, max(min_seats, 1))
+        page = self.paginate_queryset(qs)
+        data = self.get_serializer(page, many=True).data
+        for row, schedule in zip(data, page):
+            row['poi_name'] = schedule.poi.name
+            row['distance_km'] = round(schedule.distance.km, 3)
+        return self.get_paginated_response(data)
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        serializer = ScheduleRecurrenceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        poi = params.pop('poi')
+        self.check_object_permissions(request, poi)
+        try:
+            result = services.generate_schedules(poi, **params)
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+    # Seat holds: anyone signed in may hold seats, so these actions drop the operator permission
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def holds(self, request, pk=None):
+        schedule = get_object_or_404(AttractionSchedule, pk=pk, is_active=True)
+        try:
+            seats = int(request.data.get('seats', 1))
+        except (TypeError, ValueError):
+            raise ParseError('seats must be an integer')
+        if not 1 <= seats <= settings.SEAT_HOLD_MAX_SEATS:
+            raise ParseError(f'seats must be between 1 and {settings.SEAT_HOLD_MAX_SEATS}')
+        try:
+            hold = services.hold_seats(request.user, schedule, seats)
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+        return Response(hold, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=True,
+        methods=['post'],
+        url_path=r'holds/(?P<hold_id>[0-9a-f]{32})/confirm',
+        url_name='confirm-hold',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def confirm_hold(self, request, pk=None, hold_id=None):
+        schedule = get_object_or_404(AttractionSchedule, pk=pk)
+        item = get_object_or_404(ItineraryItem, pk=request.data.get('itinerary_item_id'), itinerary__user=request.user)
+        try:
+            booking = services.confirm_hold(request.user, schedule, hold_id, item)
+        except HoldNotFound:
+            raise NotFound('Hold not found or expired')
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=True,
+        methods=['delete'],
+        url_path=r'holds/(?P<hold_id>[0-9a-f]{32})',
+        url_name='release-hold',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def release_hold(self, request, pk=None, hold_id=None):
+        try:
+            services.release_hold(request.user, pk, hold_id)
+        except HoldNotFound:
+            raise NotFound('Hold not found or expired')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        # Answered from Redis, so the schedule is not looked up unless its capacity mirror has to be loaded
+        if not pk.isdigit():
+            raise NotFound()
+        try:
+            return Response(services.schedule_availability(pk))
+        except AttractionSchedule.DoesNotExist:
+            raise NotFound()
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+
 
 class ItineraryViewSet(viewsets.ModelViewSet):
     queryset = Itinerary.objects.all().prefetch_related('items')
     serializer_class = ItinerarySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if 'stats' in request.query_params.get('include', '').split(','):
+            results = response.data['results']
+            stats = services.get_itineraries_stats([row['id'] for row in results], self._stats_backend())
+            for row in results:
+                row['stats'] = stats[row['id']]
+        return response
+
     @action(detail=True, methods=['get'])
     def stats(self, request, pk=None):
-        stats = services.get_itinerary_stats(pk)
+        if not pk.isdigit() or not self.filter_queryset(self.get_queryset()).filter(pk=pk).exists():
+            raise NotFound()
+        stats = services.get_itinerary_stats(int(pk), self._stats_backend())
         return Response(stats)
 
+    @action(detail=False, methods=['get'], url_path='stats', url_name='batch-stats')
+    def batch_stats(self, request):
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk]
+        except ValueError:
+            return Response({'detail': 'ids must be a comma-separated list of integers'}, status=400)
+        if not ids or len(ids) > settings.ITINERARY_BATCH_STATS_MAX:
+            return Response(
+                {'detail': f'Pass between 1 and {settings.ITINERARY_BATCH_STATS_MAX} itinerary ids'}, status=400
+            )
+        found = set(self.filter_queryset(self.get_queryset()).filter(pk__in=ids).values_list('pk', flat=True))
+        stats = services.get_itineraries_stats([pk for pk in ids if pk in found], self._stats_backend())
+        return Response({'results': [{'id': pk, **payload} for pk, payload in stats.items()]})
+
+    def _stats_backend(self):
+        backend = self.request.query_params.get('backend')
+        if backend is not None and backend not in services.ITINERARY_STATS_BACKENDS:
+            raise ParseError('backend must be stored, python or sql')
+        return backend
+
+    @action(detail=True, methods=['post'])
+    def optimize(self, request, pk=None):
+        itinerary = self.get_object()
+        try:
+            time_budget_ms = min(
+                float(request.data.get('time_budget_ms', settings.ROUTE_OPTIMIZER_TIME_BUDGET_MS)), 1000
+            )
+            dwell_minutes = float(request.data.get('dwell_minutes', 0))
+        except (TypeError, ValueError):
+            return Response({'detail': 'time_budget_ms and dwell_minutes must be numbers'}, status=400)
+        return Response({'days': services.optimize_itinerary(itinerary, time_budget_ms, dwell_minutes)})
+
+    @action(detail=True, methods=['post'])
+    def book(self, request, pk=None):
+        itinerary = self.get_object()
+        entries = request.data.get('items') if isinstance(request.data, dict) else None
+        try:
+            lines = [(int(e['itinerary_item_id']), int(e['schedule_id']), int(e.get('seats', 1))) for e in entries]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return Response(
+                {'detail': 'items must be a list of {itinerary_item_id, schedule_id, seats} objects'}, status=400
+            )
+        if not lines or len(lines) > settings.ITINERARY_BOOKING_MAX_ITEMS or min(seats for *_, seats in lines) < 1:
+            return Response(
+                {'detail': f'Book between 1 and {settings.ITINERARY_BOOKING_MAX_ITEMS} items of at least one seat'},
+                status=400,
+            )
+        try:
+            bookings = services.book_itinerary(request.user, itinerary, lines)
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict)
+        return Response({'results': BookingSerializer(bookings, many=True).data}, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
@@ -160,7 +500,11 @@ class ItineraryItemViewSet(viewsets.ModelViewSet):
             )
         except DjangoValidationError as e:
             raise DRFValidationError(e.messages)
-        serializer.save(itinerary=iti)
+        item = serializer.save(itinerary=iti)
+        services.refresh_itinerary_days([(iti.pk, item.date)])
+
+    def perform_update(self, serializer):
+        serializer.instance = services.update_itinerary_item(serializer.instance, **serializer.validated_data)
 
     def perform_destroy(self, instance):
         services.remove_itinerary_item(instance)
@@ -172,17 +516,33 @@ class BookingViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
     def perform_create(self, serializer):
-        services.create_booking(
-            self.request.user,
-            serializer.validated_data['itinerary_item'],
-            serializer.validated_data['schedule'],
-            serializer.validated_data['seats'],
-        )
-        serializer.save(user=self.request.user)
+        # create_booking inserts the booking; saving the serializer would insert a second one
+        try:
+            serializer.instance = services.create_booking(
+                self.request.user,
+                serializer.validated_data['itinerary_item'],
+                serializer.validated_data['schedule'],
+                serializer.validated_data['seats'],
+            )
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
 
     def perform_destroy(self, instance):
         services.cancel_booking(instance)
 
+    # Confirming records a payment: staff (or the payment provider's callback, as a staff user) only
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def confirm(self, request, pk=None):
+        booking = self.get_object()
+        payment_ref = request.data.get('payment_ref')
+        if not payment_ref:
+            return Response({'detail': 'payment_ref required'}, status=400)
+        try:
+            booking = services.confirm_booking(booking, str(payment_ref)[:128])
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.messages)
+        return Response(self.get_serializer(booking).data)
+
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all().select_related('poi')
@@ -190,10 +550,21 @@ class ReviewViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
     def perform_create(self, serializer):
-        services.submit_review(
+        serializer.instance = services.submit_review(
             self.request.user,
             serializer.validated_data['poi'],
             serializer.validated_data['rating'],
-            serializer.validated_data['text'],
+            serializer.validated_data.get('text', ''),
         )
-        serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        # Counters are kept per POI; moving a review to another POI is a delete and a new review
+        if serializer.validated_data.get('poi', serializer.instance.poi) != serializer.instance.poi:
+            raise DRFValidationError({'poi': 'The point of interest of a review cannot be changed.'})
+        try:
+            serializer.instance = services.update_review(serializer.instance, **serializer.validated_data)
+        except Review.DoesNotExist:
+            raise NotFound()
+
+    def perform_destroy(self, instance):
+        services.delete_review(instance)
@@ -0,0 +1,282 @@
+# Two-tier cache: a size-bounded in-process LRU in front of a shared cache alias (Redis in production).
+# Reads are served from worker memory when possible; every write goes through to the shared cache and is
+# announced on an invalidation bus so the other workers drop their local copies. Local entries also expire
+# after LOCAL_TIMEOUT, which bounds staleness if a bus message is ever lost.
+#
+# Values held locally are shared by every thread of the worker, so callers must treat them as read-only.
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.epoch = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float, epoch=None) -> None:
+        with self._lock:
+            # A value read from the shared cache before an invalidation arrived must not be kept
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys) -> None:
+        with self._lock:
+            self.epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalBus:
+    # In-process stand-in for the Redis channel: every TieredCache of the process is a "worker"
+    _subscribers = weakref.WeakSet()
+
+    def __init__(self, channel: str, shared_alias: str):
+        self.channel = channel
+
+    def publish(self, message: dict) -> None:
+        payload = json.dumps(message)
+        for subscriber in list(self._subscribers):
+            if subscriber.channel == self.channel:
+                subscriber.receive(payload)
+
+    def subscribe(self, subscriber) -> None:
+        self._subscribers.add(subscriber)
+
+
+class RedisBus:
+    # Redis pub/sub; one listener thread per worker process
+    def __init__(self, channel: str, shared_alias: str):
+        self.channel = channel
+        self.shared_alias = shared_alias
+        self._listener = None
+        self._subscriber = None
+
+    def _connection(self):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection(self.shared_alias)
+
+    def publish(self, message: dict) -> None:
+        try:
+            self._connection().publish(self.channel, json.dumps(message))
+        except Exception:
+            logger.exception('Could not publish cache invalidation on %s', self.channel)
+
+    def subscribe(self, subscriber) -> None:
+        self._subscriber = subscriber
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen, name=f'{self.channel}-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._subscriber.receive(message['data'])
+            except Exception:
+                logger.exception('Cache invalidation listener on %s failed; reconnecting', self.channel)
+            # Messages may have been missed while disconnected
+            self._subscriber.store.clear()
+            time.sleep(1)
+
+
+BUSES = {'local': LocalBus, 'redis': RedisBus}
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+class _Worker:
+    # Process-wide state of one tiered alias; Django creates a cache instance per thread
+    def __init__(self, channel: str, options: dict):
+        self.id = uuid.uuid4().hex
+        self.channel = channel
+        self.store = LocalStore(options.get('MAX_ENTRIES', 1024))
+        self.bus = BUSES[options.get('BUS', 'redis')](channel, options.get('SHARED', 'default'))
+        self.bus.subscribe(self)
+
+    def receive(self, payload) -> None:
+        message = json.loads(payload)
+        if message['origin'] == self.id:
+            return
+        if message.get('clear'):
+            self.store.clear()
+        else:
+            self.store.delete(message['keys'])
+
+    def invalidate(self, keys) -> None:
+        self.store.delete(keys)
+        self.bus.publish({'origin': self.id, 'keys': list(keys)})
+
+    def clear(self) -> None:
+        self.store.clear()
+        self.bus.publish({'origin': self.id, 'clear': True})
+
+
+def _worker_for(location: str, options: dict) -> _Worker:
+    # Keyed by pid too: a forked worker must not reuse its parent's store or listener thread
+    key = (location, os.getpid())
+    with _workers_lock:
+        if key not in _workers:
+            _workers[key] = _Worker(options.get('CHANNEL', f'cache-invalidate:{location}'), options)
+        return _workers[key]
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'default')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self._worker = _worker_for(location or 'tiered', options)
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_key(self, key, version):
+        return self.shared.make_key(key, version=version)
+
+    def _local_ttl(self, timeout):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        return self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._worker.store.get(local_key)
+        if value is not _MISSING:
+            return value
+        epoch = self._worker.store.epoch
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._worker.store.set(local_key, value, self._local_timeout, epoch)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, remote = {}, []
+        for key in keys:
+            value = self._worker.store.get(self._local_key(key, version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            epoch = self._worker.store.epoch
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                self._worker.store.set(self._local_key(key, version), value, self._local_timeout, epoch)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._written([key], version)
+        self._worker.store.set(self._local_key(key, version), value, self._local_ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout=timeout, version=version) or []
+        self._written(data, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._worker.store.set(self._local_key(key, version), value, self._local_ttl(timeout))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._written([key], version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._written([key], version)
+        return value
+
+    def incr_many(self, keys, initial: int, timeout: Optional[int], version=None):
+        # Increments every key, first setting missing ones to ``initial`` with ``timeout``. On Redis that is one
+        # MULTI round trip; either way the other workers get a single invalidation message
+        keys = list(keys)
+        shared = self.shared
+        if isinstance(shared, RedisCache):
+            pipe = shared.client.get_client(write=True).pipeline()
+            for key in keys:
+                shared_key = shared.client.make_key(key, version=version)
+                pipe.set(shared_key, initial, nx=True, ex=timeout)
+                pipe.incr(shared_key)
+            values = pipe.execute()[1::2]
+        else:
+            values = []
+            for key in keys:
+                shared.add(key, initial, timeout=timeout, version=version)
+                values.append(shared.incr(key, version=version))
+        self._written(keys, version)
+        return dict(zip(keys, values))
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        self._written([key], version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        self._written(keys, version)
+
+    def has_key(self, key, version=None):
+        if self._worker.store.get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        self._worker.clear()
+
+    def _written(self, keys, version) -> None:
+        self._worker.invalidate([self._local_key(key, version) for key in keys])
@@ -0,0 +1,126 @@
+# Stampede-safe read-through caching. Entries are stored with the time they stop being fresh and outlive it by
+# CACHE_STALE_TIMEOUT: a stale entry is still served while one worker, holding a cache.add lock (SET NX on Redis),
+# recomputes it. On a cold miss the other workers wait for that one instead of running the same query.
+# Entries live in the hot (two-tier) cache; locks need the shared cache's atomic add. Hit/miss/stale counters
+# are kept per process and added to the shared counters every CACHE_STATS_FLUSH_INTERVAL, so a hit served from
+# worker memory makes no round trip at all.
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+EVENTS = ('hit', 'miss', 'stale')
+POLL_INTERVAL = 0.05
+
+_names = set()
+_counts = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def register(name: str) -> str:
+    _names.add(name)
+    return name
+
+
+def hot_cache():
+    return caches[settings.HOT_CACHE_ALIAS]
+
+
+def _entry_key(key: str) -> str:
+    return f'swr:{key}'
+
+
+def lock_key(key: str) -> str:
+    return f'lock:{key}'
+
+
+def acquire(lock: str):
+    # Returns a token to pass to release(), or None when another worker holds the lock
+    token = uuid.uuid4().hex
+    return token if cache.add(lock, token, timeout=settings.CACHE_LOCK_TIMEOUT) else None
+
+
+def release(lock: str, token: str) -> None:
+    # Not atomic, but a lock that expired under a slow holder only costs one duplicate recompute
+    if cache.get(lock) == token:
+        cache.delete(lock)
+
+
+def wait(lock: str, key: Optional[str] = None):
+    # Poll until the lock holder stores ``key`` or gives up; returns the value if it appeared
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value = None if key is None else hot_cache().get(key)
+        if value is not None:
+            return value
+        if cache.get(lock) is None:
+            return None
+    return None
+
+
+def get_or_compute(name: str, key: str, compute, timeout: int, cacheable=None):
+    entry_key = _entry_key(key)
+    entry = hot_cache().get(entry_key)
+    if entry is not None and entry[0] > time.time():
+        record(name, 'hit')
+        return entry[1]
+    lock = lock_key(key)
+    token = acquire(lock)
+    if token is None:
+        if entry is not None:
+            record(name, 'stale')
+            return entry[1]
+        entry = wait(lock, entry_key)
+        if entry is not None:
+            record(name, 'hit')
+            return entry[1]
+    record(name, 'miss')
+    try:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            hot_cache().set(entry_key, (time.time() + timeout, value), timeout=timeout + settings.CACHE_STALE_TIMEOUT)
+    finally:
+        if token is not None:
+            release(lock, token)
+    return value
+
+
+def _stats_key(name: str, event: str) -> str:
+    return f'cachestats:{name}:{event}'
+
+
+def record(name: str, event: str) -> None:
+    with _counts_lock:
+        _counts[name, event] += 1
+        due = time.monotonic() - _flushed_at >= settings.CACHE_STATS_FLUSH_INTERVAL
+    if due:
+        flush_stats()
+
+
+def flush_stats() -> None:
+    # Counts of a worker that exits before its next flush are lost; they are statistics, not accounting
+    global _flushed_at
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed_at = time.monotonic()
+    for (name, event), count in pending.items():
+        key = _stats_key(name, event)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, timeout=None):
+                cache.incr(key, count)
+
+
+def stats():
+    flush_stats()
+    keys = {(name, event): _stats_key(name, event) for name in sorted(_names) for event in EVENTS}
+    found = cache.get_many(list(keys.values()))
+    return {name: {event: found.get(keys[name, event], 0) for event in EVENTS} for name in sorted(_names)}
@@ -0,0 +1,22 @@
+import numpy as np
+
+# Vectorized great-circle distances. Every function takes lon/lat degree arrays (or anything np.asarray accepts)
+# and returns kilometres on a sphere of the mean Earth radius, the same model PostGIS uses for sphere distances.
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lon1, lat1, lon2, lat2) -> np.ndarray:
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(a, dtype=float)) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def leg_km(lons, lats) -> np.ndarray:
+    # Distances between consecutive points of a path: n points give n - 1 legs
+    lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+    return haversine_km(lons[:-1], lats[:-1], lons[1:], lats[1:])
+
+
+def distance_matrix_km(lons, lats) -> np.ndarray:
+    lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+    return haversine_km(lons[:, None], lats[:, None], lons[None, :], lats[None, :])
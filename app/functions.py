@@ -0,0 +1,17 @@
+from django.contrib.gis.db.models.functions import GeoFunc
+from django.db.models import FloatField, Value
+
+
+class KNNDistance(GeoFunc):
+    # PostGIS <-> operator: metres on a geography column, and ORDER BY on it is served by the GiST index
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    geom_param_pos = (0, 1)
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        clone = self.copy()
+        point = clone.source_expressions[1]
+        if isinstance(point, Value):
+            point.output_field.geography = self.geo_field.geography
+        return super(KNNDistance, clone).as_sql(compiler, connection, **extra_context)
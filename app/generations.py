@@ -0,0 +1,59 @@
+# Generation counters for write-aware caching. Writes through app.services bump the generation of the written
+# object ('poi:42'), map cell or calendar month; cached responses embed the generations of the tags they depend
+# on, so a bump makes every older entry unreachable and the TTL only bounds how long dead entries take to age out.
+# Counters are read through the hot (two-tier) cache, so a cache hit needs no round trip for its token; a bump
+# goes through it too, which drops the counter from every worker's local tier over the invalidation bus. Counters
+# expire after GENERATION_KEY_TIMEOUT, longer than any entry keyed on them lives, so tags that are only ever read
+# (one per map tile) do not pile up in Redis.
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import caching
+
+KEY_PREFIX = 'gen'
+
+
+def key(tag: str) -> str:
+    return f'{KEY_PREFIX}:{tag}'
+
+
+def _seed() -> int:
+    # A counter evicted from the cache restarts from the clock instead of 0, so it never repeats a value that
+    # an older cached entry could still be keyed on
+    return time.time_ns() // 1000
+
+
+def get_many(tags):
+    cache = caching.hot_cache()
+    keys = {tag: key(tag) for tag in tags}
+    found = cache.get_many(list(keys.values()))
+    generations = {}
+    for tag, k in keys.items():
+        if k not in found:
+            cache.add(k, _seed(), timeout=settings.GENERATION_KEY_TIMEOUT)
+            found[k] = cache.get(k)
+        generations[tag] = found[k]
+    return generations
+
+
+def token(tags) -> str:
+    generations = get_many(tags)
+    return '.'.join(f'{tag}={generations[tag]}' for tag in tags)
+
+
+def bump(*tags) -> None:
+    # Once the write is visible to other connections; a cache miss right before commit must not re-cache old data
+    transaction.on_commit(lambda: _bump_now(tags))
+
+
+def _bump_now(tags) -> None:
+    # All tags of a write in one round trip and one invalidation message
+    caching.hot_cache().incr_many([key(tag) for tag in tags], _seed(), settings.GENERATION_KEY_TIMEOUT)
+
+
+def touch(model: str, *pks) -> None:
+    # Object tags only: no cached response depends on a whole model, so a model-wide tag would be bumped for nothing
+    if pks:
+        bump(*(f'{model}:{pk}' for pk in pks))
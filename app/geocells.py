@@ -0,0 +1,86 @@
+import math
+
+from .distance import EARTH_RADIUS_KM
+
+# Geohash cells. Nearby searches cache the POIs of every cell they touch, so the cell precision picks how many
+# cache entries one search reads; it is chosen from the radius bucket below.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION_BY_RADIUS_KM = ((1.0, 6), (5.0, 5), (50.0, 4))
+PRECISIONS = tuple(precision for _, precision in PRECISION_BY_RADIUS_KM)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def precision_for_radius(radius_km: float):
+    for max_radius, precision in PRECISION_BY_RADIUS_KM:
+        if radius_km <= max_radius:
+            return precision
+    return None
+
+
+def cell_size(precision: int):
+    bits = 5 * precision
+    return 360 / 2 ** ((bits + 1) // 2), 180 / 2 ** (bits // 2)
+
+
+def encode(lon: float, lat: float, precision: int) -> str:
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    chars, value, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value *= 2
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            value, bit = 0, 0
+    return ''.join(chars)
+
+
+def bounds(cell: str):
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    even = True
+    for char in cell:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def covering(lon: float, lat: float, radius_km: float, precision: int):
+    # Cells intersecting the lon/lat bounding box of the search circle
+    width, height = cell_size(precision)
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = min(180.0, dlat / max(math.cos(math.radians(lat)), 1e-6))
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0 - height / 2, lat + dlat)
+    cells = []
+    for row in range(math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height) + 1):
+        center_lat = -90 + (row + 0.5) * height
+        for col in range(math.floor((lon - dlon + 180) / width), math.floor((lon + dlon + 180) / width) + 1):
+            center_lon = (col + 0.5) * width % 360 - 180
+            cells.append(encode(center_lon, center_lat, precision))
+    return list(dict.fromkeys(cells))
+
+
+def cell_tags(lon: float, lat: float):
+    return [cell_tag(encode(lon, lat, precision)) for precision in PRECISIONS]
+
+
+def cell_tag(cell: str) -> str:
+    # Generation tag (app.generations) of the cell; a POI write bumps the tags of the cells it sits in
+    return f'nearby:{cell}'
+
+
+def cache_key(cell: str, generation) -> str:
+    return f'nearby:cell:{cell}:{generation}'
@@ -0,0 +1,196 @@
+# Time-limited seat holds in Redis. Per schedule, a hash maps hold ids to seats and owners, a sorted set orders
+# hold ids by expiry, a counter tracks the seats currently held and a capacity key mirrors the schedule's
+# remaining_capacity (0 when inactive). Every script first drops expired holds, so they are released without a
+# background job, and availability (capacity - held) is answered by Redis alone once the mirror is loaded.
+# PostgreSQL stays the source of truth: confirming a hold still books through the conditional seat UPDATE, and
+# bookings made without a hold first claim seats that are not held. The mirror is loaded from a database read
+# only if no write forgot it since the read (a version counter fences it), and it expires after
+# SEAT_HOLD_CAPACITY_TTL in case a claim was never followed by a commit.
+import uuid
+from functools import lru_cache
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+
+# Statuses returned by the scripts
+OK, CAPACITY_UNKNOWN, NOT_ENOUGH_SEATS = 0, 1, 2
+VERSION_TTL = 24 * 60 * 60
+
+PURGE_LUA = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now_ms)
+for _, id in ipairs(expired) do
+    local seats = redis.call('HGET', KEYS[1], id)
+    if seats then
+        redis.call('DECRBY', KEYS[4], seats)
+        redis.call('HDEL', KEYS[1], id)
+        redis.call('HDEL', KEYS[3], id)
+    end
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now_ms)
+end
+local capacity = redis.call('GET', KEYS[5])
+local held = tonumber(redis.call('GET', KEYS[4]) or '0')
+"""
+
+# KEYS: seats, expiry, owners, held, capacity, version; ARGV: hold id, seats, owner, ttl ms
+HOLD_LUA = (
+    PURGE_LUA
+    + """
+if not capacity then return {1, 0, 0} end
+local available = tonumber(capacity) - held
+if available < tonumber(ARGV[2]) then return {2, 0, math.max(available, 0)} end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+redis.call('INCRBY', KEYS[4], ARGV[2])
+local expires_ms = now_ms + tonumber(ARGV[4])
+redis.call('ZADD', KEYS[2], expires_ms, ARGV[1])
+for i = 1, 4 do redis.call('PEXPIRE', KEYS[i], tonumber(ARGV[4]) * 2) end
+return {0, expires_ms, available - tonumber(ARGV[2])}
+"""
+)
+
+# KEYS: seats, expiry, owners, held, capacity, version; ARGV: hold id, owner, claim ('1' also takes the seats off
+# the capacity mirror because they are about to be booked)
+TAKE_LUA = (
+    PURGE_LUA
+    + """
+local seats = redis.call('HGET', KEYS[1], ARGV[1])
+if not seats or redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then return -1 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DECRBY', KEYS[4], seats)
+if ARGV[3] == '1' and capacity then
+    redis.call('DECRBY', KEYS[5], seats)
+end
+return tonumber(seats)
+"""
+)
+
+# KEYS: seats, expiry, owners, held, capacity, version; ARGV: seats. Takes seats nobody holds off the mirror for
+# a booking made without a hold
+CLAIM_LUA = (
+    PURGE_LUA
+    + """
+if not capacity then return {1, 0} end
+local available = tonumber(capacity) - held
+if available < tonumber(ARGV[1]) then return {2, math.max(available, 0)} end
+redis.call('DECRBY', KEYS[5], ARGV[1])
+return {0, available - tonumber(ARGV[1])}
+"""
+)
+
+# KEYS: seats, expiry, owners, held, capacity, version
+AVAILABLE_LUA = (
+    PURGE_LUA
+    + """
+if not capacity then return {1, 0, held} end
+return {0, math.max(tonumber(capacity) - held, 0), held}
+"""
+)
+
+# KEYS: seats, expiry, owners, held, capacity, version; ARGV: capacity, version read before the database, ttl ms
+LOAD_LUA = """
+if (redis.call('GET', KEYS[6]) or '0') ~= ARGV[2] then return 0 end
+redis.call('SET', KEYS[5], ARGV[1], 'PX', ARGV[3], 'NX')
+return 1
+"""
+
+
+class HoldNotFound(Exception):
+    pass
+
+
+class NotEnoughSeats(Exception):
+    def __init__(self, available):
+        super().__init__(available)
+        self.available = available
+
+
+class CapacityUnknown(Exception):
+    pass
+
+
+def enabled() -> bool:
+    return isinstance(caches['default'], RedisCache)
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+@lru_cache(maxsize=None)
+def _script(source: str):
+    return _redis().register_script(source)
+
+
+def _keys(schedule_id: int):
+    # Namespaced like every other key of the default cache (KEY_PREFIX, VERSION)
+    cache = caches['default']
+    names = ('seats', 'expiry', 'owners', 'held', 'capacity', 'version')
+    return [cache.make_key(f'holds:{schedule_id}:{name}') for name in names]
+
+
+def _run(source: str, schedule_id: int, *args):
+    return _script(source)(keys=_keys(schedule_id), args=args, client=_redis())
+
+
+def capacity_version(schedule_id: int) -> str:
+    # Read before the database read that load_capacity stores
+    version = _redis().get(_keys(schedule_id)[5])
+    return '0' if version is None else version.decode()
+
+
+def load_capacity(schedule_id: int, remaining_capacity: int, version: str) -> None:
+    # NX: a mirror already adjusted by a claim in flight must not be overwritten with an older DB read. A version
+    # other than ``version`` means a write committed and forgot the mirror after the read, so it is not stored
+    _run(LOAD_LUA, schedule_id, remaining_capacity, version, int(settings.SEAT_HOLD_CAPACITY_TTL * 1000))
+
+
+def forget_capacity(schedule_id: int) -> None:
+    keys = _keys(schedule_id)
+    pipe = _redis().pipeline()
+    pipe.delete(keys[4])
+    pipe.incr(keys[5])
+    pipe.expire(keys[5], VERSION_TTL)
+    pipe.execute()
+
+
+def hold(schedule_id: int, seats: int, owner: int, ttl_seconds: Optional[int] = None):
+    ttl_seconds = ttl_seconds or settings.SEAT_HOLD_TTL
+    hold_id = uuid.uuid4().hex
+    status, expires_ms, available = _run(HOLD_LUA, schedule_id, hold_id, seats, owner, int(ttl_seconds * 1000))
+    if status == CAPACITY_UNKNOWN:
+        raise CapacityUnknown()
+    if status == NOT_ENOUGH_SEATS:
+        raise NotEnoughSeats(available)
+    return {'hold_id': hold_id, 'expires_at_ms': expires_ms, 'available': available}
+
+
+def take(schedule_id: int, hold_id: str, owner: int, claim: bool) -> int:
+    seats = _run(TAKE_LUA, schedule_id, hold_id, owner, '1' if claim else '0')
+    if seats == -1:
+        raise HoldNotFound(hold_id)
+    return seats
+
+
+def claim(schedule_id: int, seats: int) -> int:
+    status, available = _run(CLAIM_LUA, schedule_id, seats)
+    if status == CAPACITY_UNKNOWN:
+        raise CapacityUnknown()
+    if status == NOT_ENOUGH_SEATS:
+        raise NotEnoughSeats(available)
+    return available
+
+
+def available(schedule_id: int):
+    status, seats, held = _run(AVAILABLE_LUA, schedule_id)
+    if status == CAPACITY_UNKNOWN:
+        raise CapacityUnknown()
+    return {'available': seats, 'held': held}
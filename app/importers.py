@@ -0,0 +1,145 @@
+# Streaming readers for bulk POI files. Every reader yields raw items (GeoJSON features or plain records) one at
+# a time, so an import holds at most one batch in memory whatever the size of the file; ``clean_record`` turns an
+# item into {name, lon, lat, translations} or rejects it. Readers only raise for a file they cannot parse.
+import csv
+import json
+from typing import Any, Dict, Iterator, TextIO
+
+CHUNK_SIZE = 64 * 1024
+
+FORMATS_BY_SUFFIX = {
+    '.geojson': 'geojson',
+    '.json': 'geojson',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.csv': 'csv',
+}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def _iter_json_array(fp: TextIO, key: str) -> Iterator[Any]:
+    # Decode the items of the top-level ``key`` array one by one instead of loading the whole document
+    decoder = json.JSONDecoder()
+    buf = ''
+    eof = False
+
+    def fill():
+        nonlocal buf, eof
+        chunk = fp.read(CHUNK_SIZE)
+        eof = not chunk
+        buf += chunk
+
+    marker = f'"{key}"'
+    while marker not in buf:
+        if eof:
+            return
+        buf = buf[-len(marker) :]
+        fill()
+    pos = buf.index(marker) + len(marker)
+    while True:
+        bracket = buf.find('[', pos)
+        if bracket != -1:
+            break
+        if eof:
+            raise InvalidRecord(f'"{key}" is not an array')
+        fill()
+    pos = bracket + 1
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise InvalidRecord(f'Unterminated "{key}" array')
+            buf, pos = '', 0
+            fill()
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise InvalidRecord(f'Malformed item in "{key}" array')
+            buf, pos = buf[pos:], 0
+            fill()
+            continue
+        yield item
+        pos = end
+
+
+def read_geojson(fp: TextIO) -> Iterator[Any]:
+    yield from _iter_json_array(fp, 'features')
+
+
+def read_ndjson(fp: TextIO) -> Iterator[Any]:
+    for lineno, line in enumerate(fp, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                raise InvalidRecord(f'Line {lineno} is not valid JSON')
+
+
+def read_csv(fp: TextIO) -> Iterator[Dict[str, Any]]:
+    # Translations come from ``name_<lang>`` / ``description_<lang>`` columns
+    for row in csv.DictReader(fp):
+        translations = {}
+        for column, value in row.items():
+            if column.startswith('name_') and value:
+                lang = column[len('name_') :]
+                translations[lang] = {'name': value, 'description': row.get(f'description_{lang}') or ''}
+        yield {'name': row.get('name'), 'lon': row.get('lon'), 'lat': row.get('lat'), 'translations': translations}
+
+
+READERS = {'geojson': read_geojson, 'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def _feature_to_record(feature: Any) -> Dict[str, Any]:
+    if not isinstance(feature, dict):
+        raise InvalidRecord('records must be objects')
+    if feature.get('type') != 'Feature':
+        return feature
+    geometry = feature.get('geometry') or {}
+    if not isinstance(geometry, dict) or geometry.get('type') != 'Point':
+        raise InvalidRecord('Only Point geometries are supported')
+    coordinates = geometry.get('coordinates')
+    if not isinstance(coordinates, list) or len(coordinates) < 2:
+        raise InvalidRecord('Point coordinates must be [lon, lat]')
+    properties = feature.get('properties') or {}
+    if not isinstance(properties, dict):
+        raise InvalidRecord('properties must be an object')
+    return {**properties, 'lon': coordinates[0], 'lat': coordinates[1]}
+
+
+def clean_record(record: Any) -> Dict[str, Any]:
+    record = _feature_to_record(record)
+    name = record.get('name')
+    name = name.strip() if isinstance(name, str) else ''
+    if not name or len(name) > 200:
+        raise InvalidRecord('name is required and must be at most 200 characters')
+    try:
+        lon, lat = float(record['lon']), float(record['lat'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidRecord('lon and lat must be numbers')
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise InvalidRecord('lon/lat out of range')
+    translations = record.get('translations') or {}
+    if not isinstance(translations, dict):
+        raise InvalidRecord('translations must map language codes to objects with a name')
+    cleaned = {}
+    for lang, data in translations.items():
+        if not isinstance(lang, str) or not 0 < len(lang) <= 10:
+            raise InvalidRecord('translation language codes must be 1 to 10 characters')
+        if not isinstance(data, dict) or not isinstance(data.get('name'), str) or not data['name'].strip():
+            raise InvalidRecord('translations must map language codes to objects with a name')
+        if len(data['name'].strip()) > 200:
+            raise InvalidRecord(f'{lang} translation name must be at most 200 characters')
+        description = data.get('description') or ''
+        if not isinstance(description, str):
+            raise InvalidRecord(f'{lang} translation description must be a string')
+        cleaned[lang] = {'name': data['name'].strip(), 'description': description}
+    return {'name': name, 'lon': lon, 'lat': lat, 'translations': cleaned}
@@ -0,0 +1,31 @@
+# Locale resolution for localized POI payloads. Accept-Language becomes an ordered fallback chain
+# ('de-AT,en;q=0.5' -> ('de-at', 'de', 'en')); a POI is shown in the first language of the chain it has a
+# translation for, and under its default name otherwise. Codes are compared lowercased.
+from django.utils.translation.trans_real import parse_accept_lang_header
+
+MAX_LANGUAGES = 6
+
+
+def fallbacks(code: str):
+    code = code.lower()
+    base = code.split('-')[0]
+    return (code,) if base == code else (code, base)
+
+
+def language_chain(accept_language: str):
+    chain = []
+    for code, _ in parse_accept_lang_header(accept_language or ''):
+        if code == '*':
+            continue
+        for candidate in fallbacks(code):
+            if candidate not in chain:
+                chain.append(candidate)
+    return tuple(chain[:MAX_LANGUAGES])
+
+
+def request_languages(request):
+    return language_chain(request.headers.get('Accept-Language', ''))
+
+
+def chain_key(languages) -> str:
+    return ','.join(languages) or '-'
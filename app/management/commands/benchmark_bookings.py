@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app import services
+from app.models import Booking, Itinerary, ItineraryItem, PointOfInterest
+
+
+class Command(BaseCommand):
+    help = 'Measure bookings/sec on one hot schedule for every booking strategy and check nothing is oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--bookings', type=int, default=2000, help='Booking attempts per strategy.')
+        parser.add_argument('--capacity', type=int, default=None, help='Defaults to --bookings.')
+        parser.add_argument('--strategy', choices=services.BOOKING_STRATEGIES, action='append')
+        parser.add_argument(
+            '--shards', type=int, action='append', default=[], help='Also book a schedule split into this many shards.'
+        )
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username='benchmark-bookings')
+        poi = PointOfInterest.objects.create(operator=user, name='Benchmark', location=Point(0, 0))
+        try:
+            itinerary = Itinerary.objects.create(user=user, name='Benchmark')
+            start = timezone.now() + timedelta(days=1)
+            item = ItineraryItem.objects.create(
+                itinerary=itinerary,
+                poi=poi,
+                date=start.date(),
+                start_time=start.time(),
+                end_time=(start + timedelta(hours=1)).time(),
+                order=0,
+            )
+            for strategy in options['strategy'] or services.BOOKING_STRATEGIES:
+                self.run(strategy, strategy, user, item, start, options)
+            for shards in options['shards']:
+                # Sharded schedules book the same way whatever the strategy
+                self.run(f'{shards} shards', None, user, item, start, options, shards)
+        finally:
+            poi.delete()
+
+    def run(self, label, strategy, user, item, start, options, shards=0):
+        capacity = options['capacity'] or options['bookings']
+        schedule = services.create_schedule(item.poi, start, start + timedelta(hours=1), capacity, shard_count=shards)
+        attempts = iter(range(options['bookings']))
+        attempts_lock = threading.Lock()
+        counts = {'booked': 0, 'rejected': 0}
+
+        def worker():
+            try:
+                while True:
+                    with attempts_lock:
+                        if next(attempts, None) is None:
+                            return
+                    try:
+                        services.create_booking(user, item, schedule, 1, strategy)
+                        outcome = 'booked'
+                    except ValidationError:
+                        outcome = 'rejected'
+                    with attempts_lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sold = Booking.objects.filter(schedule=schedule).count()
+        consistent = sold == counts['booked'] == capacity - services.remaining_seats(schedule)
+        self.stdout.write(
+            f'{label}: {counts["booked"]} booked, {counts["rejected"]} rejected in {elapsed:.2f} s '
+            f'({counts["booked"] / elapsed:.0f} bookings/s, {options["threads"]} threads), '
+            f'{"consistent" if consistent else "INCONSISTENT"}'
+        )
@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+
+from app import distance, services
+
+
+def _best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compare the scalar haversine loop with the vectorized distance module.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=2000)
+        parser.add_argument('--matrix-points', type=int, default=300)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        lons = [rng.uniform(-10, 30) for _ in range(options['points'])]
+        lats = [rng.uniform(35, 60) for _ in range(options['points'])]
+        points = [Point(lon, lat) for lon, lat in zip(lons, lats)]
+        n = options['matrix_points']
+
+        cases = [
+            (
+                f'path of {len(points)} points',
+                lambda: [services.haversine(a, b) for a, b in zip(points, points[1:])],
+                lambda: distance.leg_km(lons, lats),
+            ),
+            (
+                f'{n}x{n} matrix',
+                lambda: [[services.haversine(a, b) for b in points[:n]] for a in points[:n]],
+                lambda: distance.distance_matrix_km(lons[:n], lats[:n]),
+            ),
+        ]
+        for label, scalar, vectorized in cases:
+            scalar_s = _best_of(options['repeat'], scalar)
+            vector_s = _best_of(options['repeat'], vectorized)
+            self.stdout.write(
+                f'{label}: scalar {scalar_s * 1000:.2f} ms, vectorized {vector_s * 1000:.2f} ms, '
+                f'speedup x{scalar_s / vector_s:.0f}'
+            )
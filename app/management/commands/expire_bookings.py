@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import services
+
+
+class Command(BaseCommand):
+    help = 'Cancel pending bookings older than BOOKING_PENDING_TTL and give their seats back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--ttl', type=int, default=None, help='Seconds; defaults to BOOKING_PENDING_TTL.')
+        parser.add_argument('--every', type=float, default=None, help='Keep running, every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = services.expire_pending_bookings(options['batch_size'], options['ttl'])
+            self.stdout.write(self.style.SUCCESS(f'Expired {expired} pending bookings.'))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app import importers, services
+from app.models import PointOfInterest
+
+
+class Command(BaseCommand):
+    help = 'Stream POIs with translations from a GeoJSON, NDJSON or CSV file into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--operator', required=True, help='Username that will own the imported POIs.')
+        parser.add_argument('--format', choices=sorted(importers.READERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint', help='File recording how many records are committed; an interrupted run resumes from it.'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Validate every record without writing.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or importers.FORMATS_BY_SUFFIX.get(path.suffix.lower())
+        if fmt is None:
+            raise CommandError(f'Cannot infer the format of {path}; pass --format.')
+        try:
+            operator = get_user_model().objects.get(username=options['operator'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown operator {options["operator"]!r}.')
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        dry_run = options['dry_run']
+        start = 0 if dry_run else self.read_checkpoint(checkpoint, path)
+        if start:
+            self.stdout.write(f'Resuming after {start} records.')
+
+        processed, invalid = start, 0
+        started = time.monotonic()
+        with path.open(newline='', encoding='utf-8') as fp:
+            records = islice(importers.READERS[fmt](fp), start, None)
+            try:
+                while batch := list(islice(records, options['batch_size'])):
+                    clean = []
+                    for offset, record in enumerate(batch, start=processed + 1):
+                        try:
+                            clean.append(importers.clean_record(record))
+                        except importers.InvalidRecord as e:
+                            invalid += 1
+                            self.stderr.write(f'Record {offset}: {e}')
+                    if not dry_run:
+                        self.import_batch(operator, clean, checkpoint, path, processed, processed + len(batch))
+                    processed += len(batch)
+                    rate = (processed - start) / max(time.monotonic() - started, 1e-9)
+                    self.stdout.write(f'{processed} records processed, {rate:.0f} rows/s')
+            except importers.InvalidRecord as e:
+                raise CommandError(f'{path} is malformed after record {processed}: {e}')
+
+        verb = 'validated' if dry_run else 'imported'
+        self.stdout.write(
+            self.style.SUCCESS(f'{processed - start - invalid} records {verb}, {invalid} invalid skipped.')
+        )
+
+    def import_batch(self, operator, clean, checkpoint, path, committed, processed) -> None:
+        # The checkpoint names the batch's last POI before COMMIT, so a run that dies between the commit and the
+        # final checkpoint write can tell on resume that the batch is in and must not be imported again
+        with transaction.atomic():
+            pois = services.bulk_import_pois(operator, clean)
+            if pois:
+                pending = {'processed': processed, 'last_poi': pois[-1].pk}
+                self.write_checkpoint(checkpoint, path, committed, pending)
+        self.write_checkpoint(checkpoint, path, processed)
+
+    def read_checkpoint(self, checkpoint, path) -> int:
+        if checkpoint is None or not checkpoint.exists():
+            return 0
+        state = json.loads(checkpoint.read_text())
+        if state.get('source') != str(path.resolve()):
+            raise CommandError(f'{checkpoint} belongs to {state.get("source")}, not {path}.')
+        pending = state.get('pending')
+        if pending and PointOfInterest.objects.filter(pk=pending['last_poi']).exists():
+            return pending['processed']
+        return state['processed']
+
+    def write_checkpoint(self, checkpoint, path, processed, pending=None) -> None:
+        if checkpoint is None:
+            return
+        state = {'source': str(path.resolve()), 'processed': processed}
+        if pending:
+            state['pending'] = pending
+        tmp = checkpoint.with_name(checkpoint.name + '.tmp')
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, checkpoint)
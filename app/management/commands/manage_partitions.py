@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the upcoming monthly partitions of schedules and bookings and, with --archive, detach the partitions '
+        'older than the retention period (dumping them to gzipped CSV files and dropping them with --archive-dir). '
+        'Schedule months that kept bookings still refer to are left attached.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD, help='Months to create.')
+        parser.add_argument('--archive', action='store_true')
+        parser.add_argument('--retention', type=int, default=settings.PARTITION_RETENTION_MONTHS, help='Months.')
+        parser.add_argument('--archive-dir', type=Path, default=None)
+
+    def handle(self, *args, **options):
+        directory = options['archive_dir']
+        if directory is not None and not directory.is_dir():
+            raise CommandError(f'{directory} is not a directory')
+        for table in partitions.PARTITIONED_TABLES:
+            for name in partitions.ensure_partitions(table, options['ahead']):
+                self.stdout.write(f'Created {name}')
+        if not options['archive']:
+            return
+        cutoff = partitions.add_months(partitions.month_start(partitions.utc_today()), -options['retention'])
+        # Bookings first: a schedule month is only archived once no kept booking refers to its schedules
+        for table in reversed(partitions.PARTITIONED_TABLES):
+            if directory is not None:
+                for name in partitions.detached_partitions(table):
+                    self.stdout.write(f'Archived {name} to {partitions.dump_partition(name, directory)}')
+            for partition in partitions.partitions(table):
+                if partition.upper is None or partition.upper.date() > cutoff:
+                    continue
+                try:
+                    path = partitions.archive_partition(table, partition.name, directory)
+                except partitions.PartitionInUse as e:
+                    self.stderr.write(f'Kept {partition.name}: {e}')
+                    continue
+                self.stdout.write(f'Archived {partition.name} to {path}' if path else f'Detached {partition.name}')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import services
+
+
+class Command(BaseCommand):
+    help = 'Spread the seats of sharded schedules evenly over their shards and refresh remaining_capacity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('schedule_ids', nargs='*', type=int, help='Defaults to every sharded schedule not over.')
+        parser.add_argument('--every', type=float, default=None, help='Keep running, every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            rebalanced = services.rebalance_capacity_shards(options['schedule_ids'] or None)
+            self.stdout.write(self.style.SUCCESS(f'Rebalanced {rebalanced} schedules.'))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
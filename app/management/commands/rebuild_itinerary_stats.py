@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app import services
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored per-day itinerary stats from the itinerary items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('itinerary_ids', nargs='*', type=int, help='Defaults to every itinerary.')
+
+    def handle(self, *args, **options):
+        rebuilt = services.rebuild_itinerary_stats(options['itinerary_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} itineraries.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app import services
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in the denormalized review_count/rating_sum counters of points of interest.'
+
+    def handle(self, *args, **options):
+        fixed = services.recompute_poi_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings for {fixed} points of interest.'))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:30
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointofinterest',
+            index=django.contrib.postgres.indexes.GistIndex(django.db.models.functions.comparison.Cast('location', django.contrib.gis.db.models.fields.GeometryField(srid=4326)), name='poi_location_geom_gist'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_poi_location_geom_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointofinterest',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pointofinterest',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE app_pointofinterest AS poi
+            SET review_count = agg.review_count, rating_sum = agg.rating_sum
+            FROM (
+                SELECT poi_id, COUNT(*) AS review_count, SUM(rating) AS rating_sum
+                FROM app_review
+                GROUP BY poi_id
+            ) AS agg
+            WHERE agg.poi_id = poi.id
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_poi_rating_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('walk_km', models.FloatField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('itinerary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='app.itinerary')),
+            ],
+            options={
+                'verbose_name': 'Itinerary Day Stats',
+                'verbose_name_plural': 'Itinerary Day Stats',
+                'ordering': ['date'],
+                'unique_together': {('itinerary', 'date')},
+            },
+        ),
+    ]
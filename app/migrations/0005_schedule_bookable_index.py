@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_itinerary_day_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attractionschedule',
+            index=models.Index(condition=models.Q(('is_active', True), ('remaining_capacity__gt', 0)), fields=['poi', 'start'], name='schedule_bookable_idx'),
+        ),
+    ]
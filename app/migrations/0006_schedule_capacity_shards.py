@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_schedule_bookable_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attractionschedule',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ScheduleCapacityShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('remaining', models.PositiveIntegerField()),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capacity_shards', to='app.attractionschedule')),
+            ],
+            options={
+                'verbose_name': 'Schedule Capacity Shard',
+                'verbose_name_plural': 'Schedule Capacity Shards',
+                'ordering': ['schedule', 'index'],
+                'unique_together': {('schedule', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_schedule_capacity_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='booking_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:01
+
+import re
+from datetime import date, datetime
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+import django.db.models.deletion
+
+# A frozen copy of the conversion: later changes to app.partitions or the settings must not change what this
+# migration does. ensure_partitions and the manage_partitions command take over from these months on.
+PARTITIONED_TABLES = {
+    'app_attractionschedule': 'start',
+    'app_booking': 'created_at',
+}
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(month):
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def convert_table(cursor, table, column, first_month, months_ahead):
+    legacy = f'{table}_plegacy'
+    # Check the rows moved below right away: ALTER TABLE refuses tables with deferred trigger events pending
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    cursor.execute('SELECT count(*) FROM pg_constraint WHERE confrelid = %s::regclass AND contype = %s', [table, 'f'])
+    if cursor.fetchone()[0]:
+        raise RuntimeError(f'{table} is referenced by foreign keys; a partitioned table cannot be')
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+    # Index and primary key names are schema-wide: the legacy partition gives them up to the parent
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+        )
+        """,
+        [legacy, legacy],
+    )
+    indexes = cursor.fetchall()
+    for name, _definition in indexes:
+        cursor.execute(f'ALTER INDEX {name} RENAME TO {name[:55]}_legacy')
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [legacy])
+    cursor.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {cursor.fetchone()[0]} TO {legacy}_pkey')
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [legacy],
+    )
+    foreign_keys = cursor.fetchall()
+
+    # The parent owns the id sequence from now on; partitions cannot keep identity columns of their own
+    cursor.execute(f'SELECT max(id) FROM {legacy}')
+    max_id = cursor.fetchone()[0]
+    cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+    cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT')
+    cursor.execute(f'DROP SEQUENCE IF EXISTS {table}_id_seq')
+    cursor.execute(
+        f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+        f'PARTITION BY RANGE ({column})'
+    )
+    cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {column})')
+    cursor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+    cursor.execute('SELECT setval(%s, %s, %s)', [f'{table}_id_seq', max_id or 1, max_id is not None])
+    for _name, definition in indexes:
+        cursor.execute(re.sub(rf' ON (public\.)?{legacy} ', f' ON {table} ', definition))
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+
+    cursor.execute(f'CREATE TABLE {table}_pdefault PARTITION OF {table} DEFAULT')
+    for offset in range(months_ahead + 1):
+        month = add_months(first_month, offset)
+        cursor.execute(
+            f'CREATE TABLE {partition_name(table, month)} PARTITION OF {table} '
+            f'FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})'
+        )
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {legacy} WHERE {column} >= {_bound(first_month)} RETURNING *) '
+        f'INSERT INTO {table} SELECT * FROM moved'
+    )
+    cursor.execute(
+        f'ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({_bound(first_month)})'
+    )
+
+
+
+def partition_tables(apps, schema_editor):
+    today = datetime.now(dt_timezone.utc).date()
+    first_month = date(today.year, today.month, 1)
+    with schema_editor.connection.cursor() as cursor:
+        for table, column in PARTITIONED_TABLES.items():
+            convert_table(cursor, table, column, first_month, MONTHS_AHEAD)
+
+
+def unpartition_tables(apps, schema_editor):
+    # Merging the partitions back into one table means copying every row and recreating the foreign keys the
+    # conversion dropped; archived partitions are gone from the database altogether. Restore a backup instead.
+    raise IrreversibleError('0008_partition_schedules_and_bookings cannot be unapplied; restore a pre-0008 backup')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_booking_pending_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='schedule',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='app.attractionschedule'),
+        ),
+        migrations.AlterField(
+            model_name='schedulecapacityshard',
+            name='schedule',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='capacity_shards', to='app.attractionschedule'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at'], name='booking_created_idx'),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
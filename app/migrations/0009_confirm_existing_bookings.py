@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_partition_schedules_and_bookings'),
+    ]
+
+    operations = [
+        # Bookings made before the pending/confirmed workflow never had a way out of "pending": they are the
+        # bookings customers already hold and must not be cancelled by the expiry sweep
+        migrations.RunSQL(
+            "UPDATE app_booking SET status = 'confirmed', updated_at = now() WHERE status = 'pending'",
+            migrations.RunSQL.noop,
+        ),
+    ]
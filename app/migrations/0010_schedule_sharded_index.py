@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_confirm_existing_bookings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attractionschedule',
+            index=models.Index(condition=models.Q(('is_active', True), ('shard_count__gt', 0)), fields=['poi', 'start'], name='schedule_sharded_idx'),
+        ),
+    ]
@@ -1,14 +1,21 @@
 from django.conf import settings
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Polygon
 from django.contrib.gis.measure import D
+from django.contrib.postgres.indexes import GistIndex
 from django.db import models
+from django.db.models import Prefetch
+from django.db.models.functions import Cast, Lower, NullIf
 from django.utils.translation import gettext_lazy as _
 
+from .functions import KNNDistance
+
 
 class PointOfInterestQuerySet(gis_models.QuerySet):
     def with_avg_rating(self):
-        return self.annotate(avg_rating=models.Avg('reviews__rating'))
+        # Read from the counters maintained by services instead of aggregating the review table
+        return self.annotate(avg_rating=Cast('rating_sum', models.FloatField()) / NullIf('review_count', 0))
 
     def within_radius(self, point, radius_km):
         return self.filter(location__distance_lte=(point, D(km=radius_km))).annotate(
@@ -18,11 +25,29 @@ class PointOfInterestQuerySet(gis_models.QuerySet):
     def order_by_distance(self, point):
         return self.annotate(distance=Distance('location', point)).order_by('distance')
 
+    def in_bbox(self, bbox):
+        return self.annotate(geom=Cast('location', gis_models.GeometryField(srid=4326))).filter(
+            geom__bboverlaps=Polygon.from_bbox(bbox)
+        )
+
+    def nearest(self, point):
+        return self.annotate(knn_distance=KNNDistance('location', point)).order_by('knn_distance', 'id')
+
+    def with_translations(self, languages=()):
+        # Only the translations of the requested fallback chain, on ``localized_translations``; every
+        # translation when no language was asked for
+        if not languages:
+            return self.prefetch_related('translations')
+        translations = POITranslation.objects.annotate(language=Lower('language_code')).filter(language__in=languages)
+        return self.prefetch_related(Prefetch('translations', queryset=translations, to_attr='localized_translations'))
+
 
 class PointOfInterest(gis_models.Model):
     location = gis_models.PointField(geography=True)
     operator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pois')
     name = models.CharField(max_length=200)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -32,6 +57,10 @@ class PointOfInterest(gis_models.Model):
         verbose_name = _('Point of Interest')
         verbose_name_plural = _('Points of Interest')
         ordering = ['id']
+        indexes = [
+            # Planar lon/lat bbox lookups for map screens; must match the cast used by ``in_bbox``.
+            GistIndex(Cast('location', gis_models.GeometryField(srid=4326)), name='poi_location_geom_gist'),
+        ]
 
     def __str__(self):
         return self.name
@@ -56,16 +85,48 @@ class AttractionSchedule(models.Model):
     total_capacity = models.PositiveIntegerField()
     remaining_capacity = models.PositiveIntegerField()
     is_active = models.BooleanField(default=True)
+    # 0: seats are counted on remaining_capacity. N > 1: they are split across N ScheduleCapacityShard rows and
+    # remaining_capacity is only a snapshot, refreshed whenever the shards are rebalanced
+    shard_count = models.PositiveSmallIntegerField(default=0)
 
     class Meta:
         verbose_name = _('Attraction Schedule')
         verbose_name_plural = _('Attraction Schedules')
         ordering = ['start']
+        indexes = [
+            # Availability search: only bookable slots are indexed, probed per nearby POI by start time.
+            models.Index(
+                fields=['poi', 'start'],
+                name='schedule_bookable_idx',
+                condition=models.Q(is_active=True, remaining_capacity__gt=0),
+            ),
+            # The same for sharded slots, whose remaining_capacity is only a snapshot
+            models.Index(
+                fields=['poi', 'start'],
+                name='schedule_sharded_idx',
+                condition=models.Q(is_active=True, shard_count__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.poi.name} {self.start} - {self.end}'
 
 
+class ScheduleCapacityShard(models.Model):
+    # Schedules are range-partitioned (app.partitions), which PostgreSQL foreign keys cannot reference
+    schedule = models.ForeignKey(
+        AttractionSchedule, on_delete=models.CASCADE, related_name='capacity_shards', db_constraint=False
+    )
+    index = models.PositiveSmallIntegerField()
+    remaining = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _('Schedule Capacity Shard')
+        verbose_name_plural = _('Schedule Capacity Shards')
+        ordering = ['schedule', 'index']
+        unique_together = (('schedule', 'index'),)
+
+
 class Itinerary(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='itineraries')
     name = models.CharField(max_length=200)
@@ -96,6 +157,19 @@ class ItineraryItem(models.Model):
         unique_together = (('itinerary', 'date', 'order'),)
 
 
+class ItineraryDayStats(models.Model):
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='day_stats')
+    date = models.DateField()
+    walk_km = models.FloatField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Itinerary Day Stats')
+        verbose_name_plural = _('Itinerary Day Stats')
+        ordering = ['date']
+        unique_together = (('itinerary', 'date'),)
+
+
 class Booking(models.Model):
     STATUS_PENDING = 'pending'
     STATUS_CONFIRMED = 'confirmed'
@@ -107,7 +181,9 @@ class Booking(models.Model):
     ]
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
     itinerary_item = models.ForeignKey(ItineraryItem, on_delete=models.CASCADE, related_name='bookings')
-    schedule = models.ForeignKey(AttractionSchedule, on_delete=models.CASCADE, related_name='bookings')
+    schedule = models.ForeignKey(
+        AttractionSchedule, on_delete=models.CASCADE, related_name='bookings', db_constraint=False
+    )
     seats = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
     payment_ref = models.CharField(max_length=128, blank=True, null=True)
@@ -118,6 +194,12 @@ class Booking(models.Model):
         verbose_name = _('Booking')
         verbose_name_plural = _('Bookings')
         ordering = ['-created_at']
+        indexes = [
+            # Expiry sweep: only the (few) pending rows are indexed, oldest first
+            models.Index(fields=['created_at'], name='booking_pending_idx', condition=models.Q(status='pending')),
+            # Newest-first listings read the most recent monthly partitions only
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} booking {self.status}'
@@ -0,0 +1,149 @@
+# Monthly range partitions for the tables that only grow: schedules by start, bookings by created_at. Month bounds
+# are UTC. Migration 0008 converts each table once: the existing table is attached as the "legacy" partition for
+# every row before the conversion month, the months from there on get their own partitions, and a default
+# partition takes rows no month has been created for yet (far-future schedules). ``ensure_partitions`` creates
+# upcoming months, moving their rows out of the default; ``archive_partition`` detaches an old partition and
+# optionally dumps it to a gzipped CSV and drops it. A schedule partition is only detached once no booking refers
+# to its schedules, and its capacity shards go with it. Queries with a range predicate on the partition column are
+# pruned to the partitions they need.
+import gzip
+import re
+from datetime import date, datetime
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from django.db import connection, transaction
+
+PARTITIONED_TABLES = {
+    'app_attractionschedule': 'start',
+    'app_booking': 'created_at',
+}
+
+UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+class PartitionInUse(RuntimeError):
+    pass
+
+
+class Partition(NamedTuple):
+    name: str
+    upper: Optional[datetime]  # None for the default partition
+
+
+def utc_today() -> date:
+    return datetime.now(dt_timezone.utc).date()
+
+
+def month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def partitions(table: str) -> List[Partition]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ORDER BY child.relname
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+    found = []
+    for name, bound in rows:
+        upper = UPPER_BOUND.search(bound)
+        found.append(Partition(name, datetime.fromisoformat(upper.group(1)) if upper else None))
+    return found
+
+
+def ensure_partitions(table: str, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    # Creates the missing months from the current one to ``months_ahead`` later. Rows already routed to the default
+    # partition for such a month are moved into it, which must happen before the attach can succeed
+    column = PARTITIONED_TABLES[table]
+    existing = {partition.name for partition in partitions(table)}
+    current = month_start(today or utc_today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+        lower, upper = _bound(month), _bound(add_months(month, 1))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {table}_pdefault WHERE {column} >= {lower} AND {column} < {upper} '
+                f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'
+            )
+            cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})')
+        created.append(name)
+    return created
+
+
+def detached_partitions(table: str) -> List[str]:
+    # Partitions a previous run detached but did not dump and drop
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname ~ %s AND pg_table_is_visible(oid)
+            ORDER BY relname
+            """,
+            [rf'^{table}_p(legacy|[0-9]{{6}})$'],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def archive_partition(table: str, name: str, directory: Optional[Path] = None) -> Optional[Path]:
+    # Detaches the partition; with a directory it is also written to <name>.csv.gz and dropped. Each step commits
+    # on its own so the table locks are not held while the dump is written; a run that stops after the detach is
+    # finished by ``dump_partition`` on the ``detached_partitions`` of the next run
+    detach_partition(table, name)
+    if directory is None:
+        return None
+    return dump_partition(name, directory)
+
+
+def detach_partition(table: str, name: str) -> None:
+    # Not CONCURRENTLY: PostgreSQL refuses it on tables with a default partition, which every table here has. The
+    # plain DETACH locks the table for this short transaction only, and bookings of the partition's schedules that
+    # commit after it no longer find their schedule row
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+        if table == 'app_attractionschedule':
+            cursor.execute(f'SELECT count(*) FROM app_booking WHERE schedule_id IN (SELECT id FROM {name})')
+            bookings = cursor.fetchone()[0]
+            if bookings:
+                raise PartitionInUse(f'{bookings} bookings of its schedules are kept')
+            cursor.execute(f'DELETE FROM app_schedulecapacityshard WHERE schedule_id IN (SELECT id FROM {name})')
+
+
+def dump_partition(name: str, directory: Path) -> Path:
+    # Written under a temporary name first: an interrupted dump never looks like a finished archive
+    path = Path(directory) / f'{name}.csv.gz'
+    partial = path.with_name(f'{path.name}.part')
+    with connection.cursor() as cursor:
+        with gzip.open(partial, 'wb') as archive, cursor.copy(f'COPY {name} TO STDOUT (FORMAT csv, HEADER)') as copy:
+            for chunk in copy:
+                archive.write(chunk)
+    partial.replace(path)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {name}')
+    return path
@@ -0,0 +1,119 @@
+import time
+from typing import List, Sequence, Tuple
+
+# Single-day route optimizer: nearest-neighbour construction followed by 2-opt over a precomputed distance matrix.
+# Stops carry (earliest, latest) arrival windows in minutes of the day; waiting for a window to open is allowed,
+# arriving after it closes is not. ``dwell_minutes`` is the time spent at each stop, one value for all stops or
+# one per stop.
+
+
+def route_km(route: Sequence[int], matrix) -> float:
+    return sum(matrix[a][b] for a, b in zip(route, route[1:]))
+
+
+def _dwell(dwell_minutes, count: int) -> List[float]:
+    return list(dwell_minutes) if isinstance(dwell_minutes, (list, tuple)) else [dwell_minutes] * count
+
+
+def is_feasible(route, matrix, windows, minutes_per_km: float, dwell_minutes=0) -> bool:
+    dwell = _dwell(dwell_minutes, len(matrix))
+    clock, previous = None, None
+    for stop in route:
+        opens, closes = windows[stop]
+        arrival = opens if previous is None else max(clock + matrix[previous][stop] * minutes_per_km, opens)
+        if arrival > closes:
+            return False
+        clock, previous = arrival + dwell[stop], stop
+    return True
+
+
+def arrival_times(route, matrix, windows, minutes_per_km: float, dwell_minutes=0) -> List[float]:
+    # Earliest arrival at each stop of the route, in route order
+    matrix = matrix.tolist() if hasattr(matrix, 'tolist') else matrix
+    dwell = _dwell(dwell_minutes, len(matrix))
+    arrivals, previous = [], None
+    for stop in route:
+        opens = windows[stop][0]
+        if previous is None:
+            arrivals.append(opens)
+        else:
+            arrivals.append(max(arrivals[-1] + dwell[previous] + matrix[previous][stop] * minutes_per_km, opens))
+        previous = stop
+    return arrivals
+
+
+def nearest_neighbour(matrix, windows, minutes_per_km: float, dwell_minutes=0) -> List[int]:
+    dwell = _dwell(dwell_minutes, len(matrix))
+    unvisited = set(range(len(matrix)))
+    current = min(unvisited, key=lambda stop: (windows[stop][0], stop))
+    route, clock = [current], windows[current][0] + dwell[current]
+    unvisited.remove(current)
+    while unvisited:
+        reachable = [
+            stop
+            for stop in unvisited
+            if max(clock + matrix[current][stop] * minutes_per_km, windows[stop][0]) <= windows[stop][1]
+        ]
+        if reachable:
+            current = min(reachable, key=lambda stop: (matrix[route[-1]][stop], stop))
+        else:
+            current = min(unvisited, key=lambda stop: (windows[stop][1], stop))
+        clock = max(clock + matrix[route[-1]][current] * minutes_per_km, windows[current][0]) + dwell[current]
+        route.append(current)
+        unvisited.remove(current)
+    return route
+
+
+def two_opt(route, matrix, windows, minutes_per_km: float, deadline: float, dwell_minutes=0) -> List[int]:
+    # Open path, so reversing a prefix or suffix only changes one edge
+    route = list(route)
+    n = len(route)
+    feasible = is_feasible(route, matrix, windows, minutes_per_km, dwell_minutes)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n - 1):
+            for k in range(i + 1, n):
+                before = after = 0.0
+                if i > 0:
+                    before += matrix[route[i - 1]][route[i]]
+                    after += matrix[route[i - 1]][route[k]]
+                if k < n - 1:
+                    before += matrix[route[k]][route[k + 1]]
+                    after += matrix[route[i]][route[k + 1]]
+                if after - before > -1e-9:
+                    continue
+                candidate = route[:i] + route[i : k + 1][::-1] + route[k + 1 :]
+                if is_feasible(candidate, matrix, windows, minutes_per_km, dwell_minutes) or not feasible:
+                    route = candidate
+                    feasible = feasible or is_feasible(route, matrix, windows, minutes_per_km, dwell_minutes)
+                    improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return route
+
+
+def optimize_route(
+    matrix,
+    windows: Sequence[Tuple[float, float]],
+    minutes_per_km: float,
+    time_budget_s: float,
+    dwell_minutes=0,
+) -> List[int]:
+    # Returns a permutation of range(len(matrix)); never worse than the current order 0..n-1
+    deadline = time.perf_counter() + time_budget_s
+    matrix = matrix.tolist() if hasattr(matrix, 'tolist') else matrix
+    current = list(range(len(matrix)))
+    if len(current) < 3:
+        return current
+    dwell_minutes = _dwell(dwell_minutes, len(matrix))
+    route = nearest_neighbour(matrix, windows, minutes_per_km, dwell_minutes)
+    route = two_opt(route, matrix, windows, minutes_per_km, deadline, dwell_minutes)
+
+    def score(candidate):
+        return (
+            not is_feasible(candidate, matrix, windows, minutes_per_km, dwell_minutes),
+            round(route_km(candidate, matrix), 6),
+        )
+
+    return route if score(route) < score(current) else current
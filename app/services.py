@@ -1,24 +1,47 @@
 import math
-from typing import Any, Dict, Optional
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Any, Dict, List, Optional
 
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
 from django.core.exceptions import ValidationError
-from django.db import transaction
-from django.db.models import F
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, Count, F, Min, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Lower, TruncDay
+from django.utils import timezone
 from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 
+from . import caching, distance, generations, geocells, holds, locales, routing, tiles
 from .models import (
     AttractionSchedule,
     Booking,
     Itinerary,
+    ItineraryDayStats,
     ItineraryItem,
     PointOfInterest,
     POITranslation,
     Review,
+    ScheduleCapacityShard,
 )
 
 
+def poi_changed(*locations) -> None:
+    # Drop derived map data once the write is visible to other connections
+    transaction.on_commit(lambda: invalidate_poi_caches(*locations))
+
+
+def invalidate_poi_caches(*locations) -> None:
+    tiles.invalidate_tiles_at(*locations)
+    generations.bump(*{tag for loc in locations if loc is not None for tag in geocells.cell_tags(loc.x, loc.y)})
+
+
 def create_poi(operator, name, location, translations=None) -> PointOfInterest:
     poi = PointOfInterest.objects.create(operator=operator, name=name, location=location)
     if translations:
@@ -28,26 +51,69 @@ def create_poi(operator, name, location, translations=None) -> PointOfInterest:
                 language_code=lang,
                 defaults={'name': data.get('name'), 'description': data.get('description', '')},
             )
+        generations.touch('translation', poi.pk)
+    generations.touch('poi', poi.pk)
+    poi_changed(poi.location)
     return poi
 
 
+def bulk_import_pois(operator, records) -> List[PointOfInterest]:
+    # One INSERT per table per batch; pk values come back from PostgreSQL so translations can reference them
+    with transaction.atomic():
+        pois = PointOfInterest.objects.bulk_create(
+            [
+                PointOfInterest(operator=operator, name=r['name'], location=Point(r['lon'], r['lat'], srid=4326))
+                for r in records
+            ]
+        )
+        POITranslation.objects.bulk_create(
+            [
+                POITranslation(
+                    poi=poi, language_code=lang, name=data['name'], description=data.get('description') or ''
+                )
+                for poi, r in zip(pois, records)
+                for lang, data in r['translations'].items()
+            ]
+        )
+        transaction.on_commit(tiles.invalidate_all_tiles)
+        # Each distinct cell of the batch once, all in one bump (one round trip)
+        cells = {tag for poi in pois for tag in geocells.cell_tags(poi.location.x, poi.location.y)}
+        generations.bump(*cells)
+    return pois
+
+
 def create_poi_translations_only(poi: PointOfInterest, translations: dict) -> None:
     for lang, data in translations.items():
         POITranslation.objects.get_or_create(
             poi=poi, language_code=lang, defaults={'name': data.get('name'), 'description': data.get('description', '')}
         )
+    generations.touch('translation', poi.pk)
+    generations.touch('poi', poi.pk)
+    poi_changed(poi.location)
 
 
 def update_poi(poi: PointOfInterest, **kwargs) -> PointOfInterest:
+    old_location = poi.location
     for attr, val in kwargs.items():
         if hasattr(poi, attr):
             setattr(poi, attr, val)
-    poi.save()
+    with transaction.atomic():
+        poi.save()
+        if poi.location != old_location:
+            refresh_itinerary_days(ItineraryItem.objects.filter(poi=poi).values_list('itinerary_id', 'date'))
+    generations.touch('poi', poi.pk)
+    poi_changed(old_location, poi.location)
     return poi
 
 
 def delete_poi(poi: PointOfInterest) -> None:
-    poi.delete()
+    location = poi.location
+    generations.touch('poi', poi.pk)
+    with transaction.atomic():
+        days = list(ItineraryItem.objects.filter(poi=poi).values_list('itinerary_id', 'date'))
+        poi.delete()
+        refresh_itinerary_days(days)
+    poi_changed(location)
 
 
 def create_schedule(
@@ -57,31 +123,266 @@ def create_schedule(
     total_capacity: int,
     remaining_capacity: Optional[int] = None,
     is_active: bool = True,
+    shard_count: int = 0,
 ) -> AttractionSchedule:
     if remaining_capacity is None:
         remaining_capacity = total_capacity
-    return AttractionSchedule.objects.create(
-        poi=poi,
-        start=start,
-        end=end,
-        total_capacity=total_capacity,
-        remaining_capacity=remaining_capacity,
-        is_active=is_active,
-    )
+    with transaction.atomic():
+        schedule = AttractionSchedule.objects.create(
+            poi=poi,
+            start=start,
+            end=end,
+            total_capacity=total_capacity,
+            remaining_capacity=remaining_capacity,
+            is_active=is_active,
+        )
+        if shard_count:
+            _write_capacity_shards(schedule, shard_count, remaining_capacity)
+    schedule_changed(schedule)
+    return schedule
 
 
 def update_schedule(schedule: AttractionSchedule, **kwargs) -> AttractionSchedule:
-    for attr, val in kwargs.items():
-        if hasattr(schedule, attr):
-            setattr(schedule, attr, val)
-    schedule.save()
+    shard_count = kwargs.pop('shard_count', schedule.shard_count)
+    old_calendar_tag = calendar_tag(schedule.poi_id, schedule.start)
+    with transaction.atomic():
+        for attr, val in kwargs.items():
+            if hasattr(schedule, attr):
+                setattr(schedule, attr, val)
+        schedule.save()
+        # The calendar month the slot is moved out of changes too; bumped on commit like the new one
+        generations.bump(old_calendar_tag)
+        if shard_count != schedule.shard_count or (shard_count and 'remaining_capacity' in kwargs):
+            set_capacity_shards(schedule, shard_count, kwargs.get('remaining_capacity'))
+    schedule_changed(schedule)
+    return schedule
+
+
+def set_capacity_shards(
+    schedule: AttractionSchedule, shard_count: int, remaining: Optional[int] = None
+) -> AttractionSchedule:
+    # Switch a schedule between one capacity counter (0 or 1) and ``shard_count`` counter rows. The seats left
+    # are carried over, or reset to ``remaining``
+    with transaction.atomic():
+        locked = AttractionSchedule.objects.select_for_update().get(pk=schedule.pk)
+        list(ScheduleCapacityShard.objects.select_for_update().filter(schedule=schedule).order_by('index'))
+        if remaining is None:
+            remaining = remaining_seats(locked)
+        _write_capacity_shards(schedule, shard_count, remaining)
+    schedule_changed(schedule)
     return schedule
 
 
+def rebalance_capacity_shards(schedule_ids: Optional[List[int]] = None) -> int:
+    # Bookings drain random shards and cancellations refill random shards; spread the seats evenly again so a
+    # booking keeps finding a shard with enough seats, and refresh the remaining_capacity snapshot
+    schedules = AttractionSchedule.objects.filter(shard_count__gt=0)
+    if schedule_ids is None:
+        schedules = schedules.filter(end__gte=timezone.now())
+    else:
+        schedules = schedules.filter(pk__in=schedule_ids)
+    rebalanced = 0
+    for schedule in schedules.only('poi', 'start').iterator():
+        schedule_id = schedule.pk
+        with transaction.atomic():
+            # Schedule row first, then shards in index order: the lock order of every other capacity write
+            list(AttractionSchedule.objects.select_for_update().filter(pk=schedule_id).values('pk'))
+            shards = list(
+                ScheduleCapacityShard.objects.select_for_update().filter(schedule_id=schedule_id).order_by('index')
+            )
+            remaining = sum(shard.remaining for shard in shards)
+            for shard, share in zip(shards, _split_capacity(remaining, len(shards))):
+                shard.remaining = share
+            ScheduleCapacityShard.objects.bulk_update(shards, ['remaining'])
+            AttractionSchedule.objects.filter(pk=schedule_id).update(remaining_capacity=remaining)
+            schedule_changed(schedule)
+        rebalanced += 1
+    return rebalanced
+
+
+def remaining_seats(schedule: AttractionSchedule) -> int:
+    if not schedule.shard_count:
+        return schedule.remaining_capacity
+    return ScheduleCapacityShard.objects.filter(schedule=schedule).aggregate(total=Sum('remaining'))['total'] or 0
+
+
+def with_remaining_seats(queryset):
+    # ``seats_left``: remaining_capacity, or for sharded schedules the sum of their shards (remaining_capacity is
+    # only the snapshot of the last rebalance there)
+    shard_seats = (
+        ScheduleCapacityShard.objects.filter(schedule=OuterRef('pk'))
+        .values('schedule')
+        .annotate(total=Sum('remaining'))
+        .values('total')
+    )
+    return queryset.annotate(
+        seats_left=Case(
+            When(shard_count=0, then=F('remaining_capacity')),
+            default=Coalesce(Subquery(shard_seats), F('remaining_capacity')),
+        )
+    )
+
+
+def _write_capacity_shards(schedule: AttractionSchedule, shard_count: int, remaining: int) -> None:
+    shard_count = shard_count if shard_count > 1 else 0
+    ScheduleCapacityShard.objects.filter(schedule=schedule).delete()
+    ScheduleCapacityShard.objects.bulk_create(
+        ScheduleCapacityShard(schedule=schedule, index=index, remaining=share)
+        for index, share in enumerate(_split_capacity(remaining, shard_count))
+    )
+    AttractionSchedule.objects.filter(pk=schedule.pk).update(shard_count=shard_count, remaining_capacity=remaining)
+    schedule.shard_count, schedule.remaining_capacity = shard_count, remaining
+
+
+def _split_capacity(total: int, parts: int) -> List[int]:
+    base, extra = divmod(total, parts) if parts else (0, 0)
+    return [base + (index < extra) for index in range(parts)]
+
+
 def delete_schedule(schedule: AttractionSchedule) -> None:
+    schedule_changed(schedule)
     schedule.delete()
 
 
+def expand_recurrence(
+    start_date,
+    end_date,
+    start_time,
+    end_time,
+    every_minutes: int,
+    duration_minutes: Optional[int] = None,
+    weekdays=None,
+    exclude_dates=(),
+):
+    # Yields (start, end) of every slot starting each ``every_minutes`` from start_time whose end is not after
+    # end_time, on the given weekdays (Monday = 0) between the two dates, in the current time zone
+    tz = timezone.get_current_timezone()
+    duration = timedelta(minutes=duration_minutes or every_minutes)
+    step = timedelta(minutes=every_minutes)
+    weekdays = set(range(7) if weekdays is None else weekdays)
+    exclude_dates = set(exclude_dates)
+    day = start_date
+    while day <= end_date:
+        if day.weekday() in weekdays and day not in exclude_dates:
+            slot = datetime.combine(day, start_time, tzinfo=tz)
+            closing = datetime.combine(day, end_time, tzinfo=tz)
+            while slot + duration <= closing:
+                yield slot, slot + duration
+                slot += step
+        day += timedelta(days=1)
+
+
+def generate_schedules(
+    poi: PointOfInterest, total_capacity: int, is_active: bool = True, dry_run: bool = False, **recurrence
+) -> Dict[str, Any]:
+    # Idempotent: slots whose start already exists for the POI are skipped, so a season can be re-run after
+    # editing its exclusions. The POI row is locked so two runs cannot both insert the same slot
+    # Expanded only one past the cap, so an oversized recurrence is rejected without being materialized
+    slots = list(islice(expand_recurrence(**recurrence), settings.SCHEDULE_GENERATE_MAX_SLOTS + 1))
+    if len(slots) > settings.SCHEDULE_GENERATE_MAX_SLOTS:
+        raise ValidationError(
+            _('The recurrence expands to more than %(max)d slots.'),
+            params={'max': settings.SCHEDULE_GENERATE_MAX_SLOTS},
+        )
+    with transaction.atomic():
+        list(PointOfInterest.objects.select_for_update().filter(pk=poi.pk).values('pk'))
+        existing = set()
+        if slots:
+            existing = set(
+                AttractionSchedule.objects.filter(poi=poi, start__gte=slots[0][0], start__lte=slots[-1][0]).values_list(
+                    'start', flat=True
+                )
+            )
+        new = [(start, end) for start, end in slots if start not in existing]
+        if not dry_run:
+            AttractionSchedule.objects.bulk_create(
+                (
+                    AttractionSchedule(
+                        poi=poi,
+                        start=start,
+                        end=end,
+                        total_capacity=total_capacity,
+                        remaining_capacity=total_capacity,
+                        is_active=is_active,
+                    )
+                    for start, end in new
+                ),
+                batch_size=settings.SCHEDULE_GENERATE_BATCH_SIZE,
+            )
+            if new:
+                generations.bump(*{calendar_tag(poi.pk, start) for start, _end in new})
+    return {
+        'slots': len(slots),
+        'created': 0 if dry_run else len(new),
+        'to_create': len(new),
+        'existing': len(slots) - len(new),
+        'first': slots[0][0] if slots else None,
+        'last': slots[-1][0] if slots else None,
+        'dry_run': dry_run,
+    }
+
+
+def schedule_changed(schedule: AttractionSchedule) -> None:
+    # Capacity or state changed: drop cached responses, the POI's calendar month and the Redis capacity mirror
+    # used by seat holds
+    schedule_id = schedule.pk
+    generations.touch('schedule', schedule_id)
+    generations.bump(calendar_tag(schedule.poi_id, schedule.start))
+    if holds.enabled():
+        transaction.on_commit(lambda: holds.forget_capacity(schedule_id))
+
+
+def calendar_tag(poi_id: int, start) -> str:
+    start = AttractionSchedule._meta.get_field('start').to_python(start)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    return f'calendar:{poi_id}:{timezone.localtime(start):%Y-%m}'
+
+
+CALENDAR_CACHE = caching.register('calendar')
+
+
+def poi_calendar(poi_id: int, year: int, month: int) -> List[Dict[str, Any]]:
+    # Per local day of the month: bookable slots, their capacity and the first slot with seats left, rolled up
+    # with date_trunc in one query. Sharded schedules count the seats left in their shards
+    tz = timezone.get_current_timezone()
+    first = datetime(year, month, 1, tzinfo=tz)
+    following = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=tz)
+    schedules = AttractionSchedule.objects.filter(poi_id=poi_id, is_active=True, start__gte=first, start__lt=following)
+    rows = (
+        with_remaining_seats(schedules)
+        .annotate(day=TruncDay('start', tzinfo=tz))
+        .values('day')
+        .annotate(
+            slots=Count('id'),
+            total_capacity=Sum('total_capacity'),
+            remaining_capacity=Sum('seats_left'),
+            first_available=Min('start', filter=Q(seats_left__gt=0)),
+        )
+        .order_by('day')
+    )
+    return [
+        {
+            'date': row['day'].date(),
+            'slots': row['slots'],
+            'total_capacity': row['total_capacity'],
+            'remaining_capacity': row['remaining_capacity'],
+            'first_available': row['first_available'],
+        }
+        for row in rows
+    ]
+
+
+def poi_calendar_cached(poi_id: int, year: int, month: int) -> List[Dict[str, Any]]:
+    tag = f'calendar:{poi_id}:{year:04d}-{month:02d}'
+    return caching.get_or_compute(
+        CALENDAR_CACHE,
+        f'{tag}:{generations.token([tag])}',
+        lambda: poi_calendar(poi_id, year, month),
+        settings.GENERATION_CACHE_TIMEOUT,
+    )
+
+
 def create_itinerary(user, name: str) -> Itinerary:
     return Itinerary.objects.create(user=user, name=name)
 
@@ -101,42 +402,507 @@ def add_itinerary_item(
     if not just_validate:
         if order is None:
             order = itinerary.items.filter(date=date).count()
-        item = ItineraryItem.objects.create(
-            itinerary=itinerary, poi=poi, date=date, start_time=start_time, end_time=end_time, order=order
-        )
+        with transaction.atomic():
+            item = ItineraryItem.objects.create(
+                itinerary=itinerary, poi=poi, date=date, start_time=start_time, end_time=end_time, order=order
+            )
+            refresh_itinerary_days([(itinerary.pk, date)])
         return item
     return None
 
 
+def update_itinerary_item(item: ItineraryItem, **kwargs) -> ItineraryItem:
+    old_day = (item.itinerary_id, item.date)
+    for attr, val in kwargs.items():
+        if hasattr(item, attr):
+            setattr(item, attr, val)
+    with transaction.atomic():
+        item.save()
+        refresh_itinerary_days([old_day, (item.itinerary_id, item.date)])
+    return item
+
+
 def remove_itinerary_item(item: ItineraryItem) -> None:
-    item.delete()
+    with transaction.atomic():
+        item.delete()
+        refresh_itinerary_days([(item.itinerary_id, item.date)])
 
 
-def create_booking(user, itinerary_item: ItineraryItem, schedule: AttractionSchedule, seats: int) -> Booking:
+def refresh_itinerary_days(days) -> None:
+    # Recompute the stored stats of only the given (itinerary_id, date) pairs. The itinerary row lock serializes
+    # concurrent edits of one itinerary, so each recompute sees the items committed before it.
+    days = sorted(set(days))
+    if not days:
+        return
+    with transaction.atomic():
+        list(Itinerary.objects.select_for_update().filter(pk__in={pk for pk, _ in days}).order_by('pk').values('pk'))
+        for itinerary_id, day in days:
+            locations = list(
+                ItineraryItem.objects.filter(itinerary_id=itinerary_id, date=day)
+                .order_by('order')
+                .values_list('poi__location', flat=True)
+            )
+            if not locations:
+                ItineraryDayStats.objects.filter(itinerary_id=itinerary_id, date=day).delete()
+                continue
+            walk_km = float(distance.leg_km([loc.x for loc in locations], [loc.y for loc in locations]).sum())
+            ItineraryDayStats.objects.update_or_create(
+                itinerary_id=itinerary_id, date=day, defaults={'walk_km': walk_km, 'item_count': len(locations)}
+            )
+
+
+def rebuild_itinerary_stats(itinerary_ids=None) -> int:
+    itineraries = Itinerary.objects.order_by('pk')
+    if itinerary_ids is not None:
+        itineraries = itineraries.filter(pk__in=itinerary_ids)
+    rebuilt = 0
+    for itinerary_id in itineraries.values_list('pk', flat=True).iterator():
+        with transaction.atomic():
+            list(Itinerary.objects.select_for_update().filter(pk=itinerary_id).values('pk'))
+            ItineraryDayStats.objects.filter(itinerary_id=itinerary_id).delete()
+            ItineraryDayStats.objects.bulk_create(
+                ItineraryDayStats(itinerary_id=itinerary_id, date=day, item_count=occupancy, walk_km=walk_km)
+                for day, occupancy, walk_km in _itinerary_day_rows_sql([itinerary_id]).get(itinerary_id, [])
+            )
+        rebuilt += 1
+    return rebuilt
+
+
+BOOKING_STRATEGIES = ('conditional', 'row_lock')
+
+TAKE_SEATS_SQL = """
+    UPDATE app_attractionschedule
+    SET remaining_capacity = remaining_capacity - %s
+    WHERE id = %s AND is_active AND shard_count = 0 AND remaining_capacity >= %s
+    RETURNING remaining_capacity
+"""
+
+
+def create_booking(
+    user,
+    itinerary_item: ItineraryItem,
+    schedule: AttractionSchedule,
+    seats: int,
+    strategy: Optional[str] = None,
+    held: bool = False,
+    status: str = Booking.STATUS_PENDING,
+) -> Booking:
+    # With seat holds enabled a booking that does not come from a hold may only take seats nobody holds. Pending
+    # bookings wait for a payment confirmation and are cancelled by the expiry sweep if none comes
+    strategy = strategy or settings.BOOKING_STRATEGY
+    claimed = holds.enabled() and not held
+    if claimed and not _claim_unheld_seats(schedule.pk, seats):
+        raise ValidationError(_('Not enough seats available.'))
+    if schedule.shard_count:
+        create = _create_booking_sharded
+    elif strategy == 'row_lock':
+        create = _create_booking_row_lock
+    else:
+        create = _create_booking_conditional
+    try:
+        booking = _retry_moved_rows(create, user, itinerary_item, schedule, seats, status)
+    except Exception:
+        if claimed:
+            holds.forget_capacity(schedule.pk)
+        raise
+    schedule_changed(schedule)
+    return booking
+
+
+MOVED_ROW_RETRIES = 3
+
+
+def _retry_moved_rows(write, *args):
+    # A schedule moved to another month changes partition. A concurrent lock or UPDATE of its old row version then
+    # fails with "tuple to be locked was already moved to another partition" (SQLSTATE 40001) and rolls its
+    # transaction back; run the write again, unless an outer transaction owns what was rolled back
+    for attempt in range(MOVED_ROW_RETRIES):
+        try:
+            return write(*args)
+        except OperationalError as exc:
+            moved = getattr(exc.__cause__, 'sqlstate', None) == '40001'
+            if not moved or connection.in_atomic_block or attempt == MOVED_ROW_RETRIES - 1:
+                raise
+
+
+def _create_booking_row_lock(user, itinerary_item, schedule, seats, status) -> Booking:
     with transaction.atomic():
         schedule = AttractionSchedule.objects.select_for_update().get(pk=schedule.pk)
-        if not schedule.is_active or schedule.remaining_capacity < seats:
+        if not schedule.is_active or schedule.shard_count or schedule.remaining_capacity < seats:
             raise ValidationError(_('Not enough seats available.'))
-        booking = Booking.objects.create(user=user, itinerary_item=itinerary_item, schedule=schedule, seats=seats)
+        booking = Booking.objects.create(
+            user=user, itinerary_item=itinerary_item, schedule=schedule, seats=seats, status=status
+        )
         schedule.remaining_capacity = F('remaining_capacity') - seats
         schedule.save(update_fields=['remaining_capacity'])
         return booking
 
 
+def _create_booking_conditional(user, itinerary_item, schedule, seats, status) -> Booking:
+    # The INSERT runs first and the seat check-and-decrement is a single UPDATE right before COMMIT, so the
+    # schedule row is locked only for the commit itself; a failed decrement rolls the booking back
+    with transaction.atomic():
+        booking = Booking.objects.create(
+            user=user, itinerary_item=itinerary_item, schedule=schedule, seats=seats, status=status
+        )
+        remaining = _take_seats(schedule.pk, seats)
+        if remaining is None:
+            raise ValidationError(_('Not enough seats available.'))
+        schedule.remaining_capacity = remaining
+        return booking
+
+
+def _create_booking_sharded(user, itinerary_item, schedule, seats, status) -> Booking:
+    with transaction.atomic():
+        booking = Booking.objects.create(
+            user=user, itinerary_item=itinerary_item, schedule=schedule, seats=seats, status=status
+        )
+        if not _take_shard_seats(schedule.pk, seats):
+            raise ValidationError(_('Not enough seats available.'))
+        return booking
+
+
+TAKE_SHARD_SEATS_SQL = """
+    UPDATE app_schedulecapacityshard
+    SET remaining = remaining - %s
+    WHERE id = (
+        SELECT shard.id
+        FROM app_schedulecapacityshard AS shard
+        JOIN app_attractionschedule AS schedule ON schedule.id = shard.schedule_id
+        WHERE shard.schedule_id = %s AND schedule.is_active AND shard.remaining >= %s
+        ORDER BY random()
+        LIMIT 1
+        FOR UPDATE OF shard SKIP LOCKED
+    )
+    RETURNING remaining
+"""
+
+RELEASE_SHARD_SEATS_SQL = """
+    UPDATE app_schedulecapacityshard
+    SET remaining = remaining + %s
+    WHERE id = (SELECT id FROM app_schedulecapacityshard WHERE schedule_id = %s ORDER BY random() LIMIT 1)
+"""
+
+
+def _take_shard_seats(schedule_id: int, seats: int) -> bool:
+    # A random shard with enough seats that no concurrent booking is updating, so bookings of one schedule spread
+    # over its shards instead of queueing on one row
+    with connection.cursor() as cursor:
+        cursor.execute(TAKE_SHARD_SEATS_SQL, [seats, schedule_id, seats])
+        if cursor.fetchone() is not None:
+            return True
+    # Every shard with enough seats is busy or the seats left are fragmented: wait for all shards, in index order,
+    # and take the seats from as many of them as needed
+    shards = list(
+        ScheduleCapacityShard.objects.select_for_update(of=('self',))
+        .filter(schedule_id=schedule_id, schedule__is_active=True)
+        .order_by('index')
+    )
+    if sum(shard.remaining for shard in shards) < seats:
+        return False
+    for shard in shards:
+        taken = min(shard.remaining, seats)
+        shard.remaining -= taken
+        seats -= taken
+    ScheduleCapacityShard.objects.bulk_update(shards, ['remaining'])
+    return True
+
+
+TAKE_SEATS_MANY_SQL = """
+    UPDATE app_attractionschedule AS s
+    SET remaining_capacity = s.remaining_capacity - v.seats
+    FROM unnest(%s::bigint[], %s::integer[]) AS v(id, seats)
+    WHERE s.id = v.id
+"""
+
+
+def book_itinerary(user, itinerary: Itinerary, lines: List[tuple]) -> List[Booking]:
+    # Books (itinerary_item_id, schedule_id, seats) lines all-or-nothing in one transaction. Schedules are locked
+    # in ascending id order so concurrent multi-item bookings cannot deadlock; errors are keyed by item id. With
+    # seat holds enabled the seats are first claimed from the ones nobody holds, in the same order. An itinerary
+    # checkout is final: its bookings are confirmed, never left to the expiry sweep
+    items = ItineraryItem.objects.in_bulk([line[0] for line in lines]) if lines else {}
+    demand = {}
+    for item_id, schedule_id, seats in lines:
+        demand[schedule_id] = demand.get(schedule_id, 0) + seats
+    errors = {}
+    claimed = []
+    try:
+        with transaction.atomic():
+            locked = AttractionSchedule.objects.select_for_update().filter(pk__in=demand).order_by('pk')
+            schedules = {schedule.pk: schedule for schedule in locked}
+            for item_id, schedule_id, seats in lines:
+                item, schedule = items.get(item_id), schedules.get(schedule_id)
+                if item is None or item.itinerary_id != itinerary.pk:
+                    errors[str(item_id)] = _('Not an item of this itinerary.')
+                elif schedule is None:
+                    errors[str(item_id)] = _('Schedule not found.')
+                elif not schedule.is_active or (
+                    not schedule.shard_count and schedule.remaining_capacity < demand[schedule_id]
+                ):
+                    errors[str(item_id)] = _('Not enough seats available.')
+            if not errors and holds.enabled():
+                for schedule_id in sorted(demand):
+                    if not _claim_unheld_seats(schedule_id, demand[schedule_id]):
+                        errors.update(
+                            {str(line[0]): _('Not enough seats available.') for line in lines if line[1] == schedule_id}
+                        )
+                        break
+                    claimed.append(schedule_id)
+            if errors:
+                raise ValidationError(errors)
+            bookings = Booking.objects.bulk_create(
+                [
+                    Booking(
+                        user=user,
+                        itinerary_item=items[item_id],
+                        schedule=schedules[schedule_id],
+                        seats=seats,
+                        status=Booking.STATUS_CONFIRMED,
+                    )
+                    for item_id, schedule_id, seats in lines
+                ]
+            )
+            unsharded = {
+                schedule_id: seats for schedule_id, seats in demand.items() if not schedules[schedule_id].shard_count
+            }
+            with connection.cursor() as cursor:
+                cursor.execute(TAKE_SEATS_MANY_SQL, [list(unsharded), list(unsharded.values())])
+            for schedule_id, seats in demand.items():
+                if schedules[schedule_id].shard_count and not _take_shard_seats(schedule_id, seats):
+                    raise ValidationError(
+                        {str(line[0]): _('Not enough seats available.') for line in lines if line[1] == schedule_id}
+                    )
+            for schedule_id in demand:
+                schedule_changed(schedules[schedule_id])
+    except Exception:
+        # The claims took seats off the mirrors for bookings that were rolled back
+        for schedule_id in claimed:
+            holds.forget_capacity(schedule_id)
+        raise
+    return bookings
+
+
+def _take_seats(schedule_id: int, seats: int) -> Optional[int]:
+    with connection.cursor() as cursor:
+        cursor.execute(TAKE_SEATS_SQL, [seats, schedule_id, seats])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def _release_seats(schedule_id: int, seats: int) -> None:
+    # A sharded schedule gets the seats back on a random shard; the rebalance evens them out
+    with connection.cursor() as cursor:
+        cursor.execute(RELEASE_SHARD_SEATS_SQL, [seats, schedule_id])
+        if cursor.rowcount:
+            return
+    AttractionSchedule.objects.filter(pk=schedule_id).update(remaining_capacity=F('remaining_capacity') + seats)
+
+
 def cancel_booking(booking: Booking) -> None:
+    _retry_moved_rows(_cancel_booking, booking)
+
+
+def _cancel_booking(booking: Booking) -> None:
     with transaction.atomic():
+        # Only the first cancellation gives the seats back
+        cancelled = (
+            Booking.objects.filter(pk=booking.pk)
+            .exclude(status=Booking.STATUS_CANCELLED)
+            .update(status=Booking.STATUS_CANCELLED, updated_at=timezone.now())
+        )
         booking.status = Booking.STATUS_CANCELLED
-        booking.save(update_fields=['status'])
-        schedule = booking.schedule
-        schedule.remaining_capacity = F('remaining_capacity') + booking.seats
-        schedule.save(update_fields=['remaining_capacity'])
+        if cancelled:
+            _release_seats(booking.schedule_id, booking.seats)
+            schedule_changed(booking.schedule)
+
+
+def confirm_booking(booking: Booking, payment_ref: str) -> Booking:
+    # Pending -> confirmed only: a booking the expiry sweep already cancelled has given its seats back
+    confirmed = Booking.objects.filter(pk=booking.pk, status=Booking.STATUS_PENDING).update(
+        status=Booking.STATUS_CONFIRMED, payment_ref=payment_ref, updated_at=timezone.now()
+    )
+    if not confirmed:
+        raise ValidationError(_('Only pending bookings can be confirmed.'))
+    booking.status, booking.payment_ref = Booking.STATUS_CONFIRMED, payment_ref
+    return booking
+
+
+EXPIRE_BOOKINGS_SQL = """
+    WITH expired AS (
+        SELECT id
+        FROM app_booking
+        WHERE status = %s AND created_at < %s
+        ORDER BY created_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE app_booking AS booking
+    SET status = %s, updated_at = now()
+    FROM expired
+    WHERE booking.id = expired.id
+    RETURNING booking.schedule_id, booking.seats
+"""
+
+
+def expire_pending_bookings(batch_size: int = 500, ttl_seconds: Optional[int] = None) -> int:
+    # Cancels pending bookings older than BOOKING_PENDING_TTL, one set-based UPDATE per batch. SKIP LOCKED leaves
+    # rows that a concurrent confirm or cancel is updating (and a second sweeper's batch) alone. Seats go back
+    # with one aggregated UPDATE per schedule, in schedule id order like every other multi-schedule write
+    ttl_seconds = settings.BOOKING_PENDING_TTL if ttl_seconds is None else ttl_seconds
+    cutoff = timezone.now() - timedelta(seconds=ttl_seconds)
+    expired = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    EXPIRE_BOOKINGS_SQL, [Booking.STATUS_PENDING, cutoff, batch_size, Booking.STATUS_CANCELLED]
+                )
+                rows = cursor.fetchall()
+            released = {}
+            for schedule_id, seats in rows:
+                released[schedule_id] = released.get(schedule_id, 0) + seats
+            schedules = AttractionSchedule.objects.only('poi', 'start').in_bulk(released)
+            for schedule_id in sorted(released):
+                _release_seats(schedule_id, released[schedule_id])
+                schedule_changed(schedules[schedule_id])
+        expired += len(rows)
+        if len(rows) < batch_size:
+            return expired
+
+
+def hold_seats(user, schedule: AttractionSchedule, seats: int) -> Dict[str, Any]:
+    # Reserve seats in Redis for SEAT_HOLD_TTL; nothing is written to PostgreSQL until the hold is confirmed
+    for attempt in range(2):
+        try:
+            hold = holds.hold(schedule.pk, seats, user.pk)
+        except holds.CapacityUnknown:
+            _load_hold_capacity(schedule.pk)
+            continue
+        except holds.NotEnoughSeats:
+            raise ValidationError(_('Not enough seats available.'))
+        expires_at = datetime.fromtimestamp(hold['expires_at_ms'] / 1000, tz=dt_timezone.utc)
+        return {
+            'hold_id': hold['hold_id'],
+            'schedule': schedule.pk,
+            'seats': seats,
+            'expires_at': expires_at,
+            'available': hold['available'],
+        }
+    raise ValidationError(_('Seat holds are unavailable, try again.'))
+
+
+def confirm_hold(user, schedule: AttractionSchedule, hold_id: str, itinerary_item: ItineraryItem) -> Booking:
+    # Claiming the hold moves its seats from "held" to "sold" in the capacity mirror atomically, so availability
+    # never double counts them; the booking itself still goes through the conditional seat UPDATE and, being the
+    # checkout of the hold, is confirmed right away
+    seats = holds.take(schedule.pk, hold_id, user.pk, claim=True)
+    try:
+        return create_booking(user, itinerary_item, schedule, seats, held=True, status=Booking.STATUS_CONFIRMED)
+    except ValidationError:
+        holds.forget_capacity(schedule.pk)
+        raise
+
+
+def release_hold(user, schedule_id: int, hold_id: str) -> int:
+    return holds.take(schedule_id, hold_id, user.pk, claim=False)
+
+
+def schedule_availability(schedule_id: int) -> Dict[str, Any]:
+    # Served by Redis; PostgreSQL is read only to (re)load the capacity mirror after a schedule write
+    for attempt in range(2):
+        try:
+            return {'schedule': int(schedule_id), **holds.available(schedule_id)}
+        except holds.CapacityUnknown:
+            _load_hold_capacity(schedule_id)
+    raise ValidationError(_('Seat holds are unavailable, try again.'))
+
+
+def _claim_unheld_seats(schedule_id: int, seats: int) -> bool:
+    for attempt in range(2):
+        try:
+            holds.claim(schedule_id, seats)
+            return True
+        except holds.CapacityUnknown:
+            _load_hold_capacity(schedule_id)
+        except holds.NotEnoughSeats:
+            return False
+    raise ValidationError(_('Seat holds are unavailable, try again.'))
+
+
+def _load_hold_capacity(schedule_id: int) -> None:
+    # The version is read first: a write that commits after the read below forgets the mirror and bumps it, and
+    # the stale value is then not stored
+    version = holds.capacity_version(schedule_id)
+    schedule = AttractionSchedule.objects.filter(pk=schedule_id).only('remaining_capacity', 'is_active', 'shard_count')
+    schedule = schedule.first()
+    if schedule is None:
+        raise AttractionSchedule.DoesNotExist()
+    holds.load_capacity(schedule_id, remaining_seats(schedule) if schedule.is_active else 0, version)
 
 
 def submit_review(user, poi: PointOfInterest, rating: int, text: str) -> Review:
-    review, _ = Review.objects.update_or_create(user=user, poi=poi, defaults={'rating': rating, 'text': text})
+    with transaction.atomic():
+        previous = Review.objects.select_for_update().filter(user=user, poi=poi).values_list('rating', flat=True)
+        previous_rating = previous.first()
+        review, created = Review.objects.update_or_create(user=user, poi=poi, defaults={'rating': rating, 'text': text})
+        PointOfInterest.objects.filter(pk=poi.pk).update(
+            review_count=F('review_count') + int(created),
+            rating_sum=F('rating_sum') + rating - (previous_rating or 0),
+        )
+        generations.touch('review', review.pk)
+        generations.touch('poi', poi.pk)
+    poi_changed(poi.location)
+    return review
+
+
+def update_review(review: Review, **kwargs) -> Review:
+    with transaction.atomic():
+        previous_rating = Review.objects.select_for_update().values_list('rating', flat=True).get(pk=review.pk)
+        for attr, val in kwargs.items():
+            if hasattr(review, attr):
+                setattr(review, attr, val)
+        review.save()
+        generations.touch('review', review.pk)
+        if review.rating != previous_rating:
+            PointOfInterest.objects.filter(pk=review.poi_id).update(
+                rating_sum=F('rating_sum') + review.rating - previous_rating
+            )
+            generations.touch('poi', review.poi_id)
+    if review.rating != previous_rating:
+        poi_changed(review.poi.location)
     return review
 
 
+def delete_review(review: Review) -> None:
+    review_id = review.pk
+    with transaction.atomic():
+        # The locked read yields the rating as committed, not as this instance last saw it
+        rating = Review.objects.select_for_update().filter(pk=review_id).values_list('rating', flat=True).first()
+        # Only the delete that removed the row takes it off the counters, like cancel_booking
+        if rating is None or not Review.objects.filter(pk=review_id).delete()[0]:
+            return
+        generations.touch('review', review_id)
+        PointOfInterest.objects.filter(pk=review.poi_id).update(
+            review_count=F('review_count') - 1, rating_sum=F('rating_sum') - rating
+        )
+        generations.touch('poi', review.poi_id)
+    poi_changed(review.poi.location)
+
+
+def recompute_poi_ratings() -> int:
+    reviews = Review.objects.filter(poi=OuterRef('pk')).order_by().values('poi')
+    actual_count = Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), 0)
+    actual_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    drifted = list(
+        PointOfInterest.objects.annotate(actual_count=actual_count, actual_sum=actual_sum)
+        .exclude(review_count=F('actual_count'), rating_sum=F('actual_sum'))
+        .values_list('pk', flat=True)
+    )
+    PointOfInterest.objects.filter(pk__in=drifted).update(review_count=actual_count, rating_sum=actual_sum)
+    return len(drifted)
+
+
 def get_poi_reviews(poi: PointOfInterest):
     return poi.reviews.all()
 
@@ -146,13 +912,178 @@ def search_pois_within_radius(lon: float, lat: float, km: float):
     return PointOfInterest.objects.with_avg_rating().within_radius(pt, km)
 
 
+def available_schedule_ids(lon: float, lat: float, km: float, start, end, min_seats: int = 1):
+    # Ids of the bookable slots near a point, one branch per capacity model so each matches a partial (poi, start)
+    # index: unsharded slots with the predicate of schedule_bookable_idx, sharded slots schedule_sharded_idx and
+    # the seats left in their shards
+    pt = Point(float(lon), float(lat), srid=4326)
+    nearby = Q(is_active=True, start__gte=start, start__lt=end, poi__location__distance_lte=(pt, D(km=km)))
+    unsharded = AttractionSchedule.objects.filter(
+        nearby, shard_count=0, remaining_capacity__gt=0, remaining_capacity__gte=min_seats
+    )
+    sharded = with_remaining_seats(AttractionSchedule.objects.filter(nearby, shard_count__gt=0)).filter(
+        seats_left__gte=min_seats
+    )
+    return unsharded.order_by().values('pk').union(sharded.order_by().values('pk'), all=True)
+
+
+def search_available_schedules(lon: float, lat: float, km: float, start, end, min_seats: int = 1):
+    # The start range is repeated on the outer query so it is pruned to the same partitions as the id lookup
+    pt = Point(float(lon), float(lat), srid=4326)
+    schedules = AttractionSchedule.objects.filter(
+        pk__in=available_schedule_ids(lon, lat, km, start, end, min_seats),
+        start__gte=start,
+        start__lt=end,
+    )
+    return with_remaining_seats(schedules).select_related('poi').annotate(distance=Distance('poi__location', pt))
+
+
+NEARBY_CACHE = caching.register('nearby')
+
+
+def search_pois_nearby_cached(lon: float, lat: float, km: float, serialize) -> Optional[List[Dict[str, Any]]]:
+    # Serve nearby searches from per-geohash-cell candidate lists and filter them exactly in-process. Only
+    # cells missing from the cache hit PostGIS, with a single bbox query. Returns None for radii too large
+    # to be worth caching per cell.
+    lon, lat = float(lon), float(lat)
+    precision = geocells.precision_for_radius(km)
+    if precision is None:
+        return None
+    cells = geocells.covering(lon, lat, km, precision)
+    # Cells are keyed on their generation, read before PostGIS: rows loaded before a write commits are stored
+    # under a generation the write's bump has already left behind
+    cell_generations = generations.get_many([geocells.cell_tag(cell) for cell in cells])
+    keys = {cell: geocells.cache_key(cell, cell_generations[geocells.cell_tag(cell)]) for cell in cells}
+    cached = caching.hot_cache().get_many(list(keys.values()))
+    candidates = {cell: cached.get(keys[cell]) for cell in cells}
+    missing = [cell for cell, entries in candidates.items() if entries is None]
+    caching.record(NEARBY_CACHE, 'miss' if missing else 'hit')
+    lock = caching.lock_key('nearby:' + ','.join(missing))
+    token = caching.acquire(lock) if missing else None
+    if missing and token is None:
+        # Another worker is loading the same cells; wait for it rather than repeating its query
+        caching.wait(lock)
+        cached = caching.hot_cache().get_many([keys[cell] for cell in missing])
+        candidates.update({cell: cached[keys[cell]] for cell in missing if keys[cell] in cached})
+        missing = [cell for cell in missing if candidates[cell] is None]
+    try:
+        if missing:
+            candidates.update(_load_nearby_cells({cell: keys[cell] for cell in missing}, precision, serialize))
+    finally:
+        if token is not None:
+            caching.release(lock, token)
+    entries = [entry for cell_entries in candidates.values() for entry in cell_entries]
+    if not entries:
+        return []
+    poi_lons, poi_lats, rows = zip(*entries)
+    within = distance.haversine_km(lon, lat, poi_lons, poi_lats) <= km
+    return sorted((data for data, keep in zip(rows, within) if keep), key=lambda data: data['id'])
+
+
+def _load_nearby_cells(missing: Dict[str, str], precision, serialize) -> Dict[str, List]:
+    # One bbox query for every missing cell ({cell: cache key}); empty cells are cached too so they stop hitting
+    # PostGIS
+    loaded = {cell: [] for cell in missing}
+    cell_bounds = [geocells.bounds(cell) for cell in missing]
+    bbox = (
+        min(b[0] for b in cell_bounds),
+        min(b[1] for b in cell_bounds),
+        max(b[2] for b in cell_bounds),
+        max(b[3] for b in cell_bounds),
+    )
+    pois = list(PointOfInterest.objects.in_bbox(bbox).prefetch_related('translations'))
+    pois = [poi for poi in pois if geocells.encode(poi.location.x, poi.location.y, precision) in loaded]
+    for poi, data in zip(pois, serialize(pois)):
+        cell = geocells.encode(poi.location.x, poi.location.y, precision)
+        loaded[cell].append((poi.location.x, poi.location.y, dict(data)))
+    caching.hot_cache().set_many(
+        {missing[cell]: entries for cell, entries in loaded.items()}, timeout=settings.NEARBY_CELL_CACHE_TIMEOUT
+    )
+    return loaded
+
+
 def pois_ordered_by_distance(lon: float, lat: float):
     pt = Point(float(lon), float(lat))
     return PointOfInterest.objects.order_by_distance(pt)
 
 
-def poi_with_aggregate_rating(poi_id: int) -> Optional[PointOfInterest]:
-    return PointOfInterest.objects.with_avg_rating().filter(id=poi_id).first()
+def pois_nearest(lon: float, lat: float):
+    pt = Point(float(lon), float(lat), srid=4326)
+    return PointOfInterest.objects.nearest(pt)
+
+
+VIEWPORT_CACHE = caching.register('viewport')
+VIEWPORT_CELLS_PER_TILE = 8
+VIEWPORT_CLUSTER_SAMPLE_IDS = 5
+
+VIEWPORT_CLUSTERS_SQL = """
+    SELECT COUNT(*), ST_X(ST_Centroid(ST_Collect(geom))), ST_Y(ST_Centroid(ST_Collect(geom))),
+           (array_agg(id ORDER BY id))[1:%s]
+    FROM (
+        SELECT id, location::geometry(GEOMETRY, 4326) AS geom
+        FROM app_pointofinterest
+        WHERE location::geometry(GEOMETRY, 4326) && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
+    ) AS pois
+    GROUP BY ST_SnapToGrid(geom, %s)
+    ORDER BY 1 DESC, 4
+"""
+
+
+def snap_bbox_to_tiles(bbox, zoom: int):
+    # Widen the viewport to whole tiles so pans within the same tiles share one cache entry
+    size = 360 / 2**zoom
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (
+        max(-180.0, math.floor(min_lon / size) * size),
+        max(-90.0, math.floor(min_lat / size) * size),
+        min(180.0, math.ceil(max_lon / size) * size),
+        min(90.0, math.ceil(max_lat / size) * size),
+    )
+
+
+def pois_in_viewport(bbox, zoom: int) -> Dict[str, Any]:
+    bbox = snap_bbox_to_tiles(bbox, zoom)
+    # Keyed on the generations of the map tiles covering the viewport, which every POI write inside it bumps
+    version = generations.token(tiles.covering_tags(bbox, zoom))
+    cache_key = f'viewport:{version}:{zoom}:' + ','.join(f'{c:.6f}' for c in bbox)
+    return caching.get_or_compute(
+        VIEWPORT_CACHE, cache_key, lambda: _pois_in_viewport(bbox, zoom), settings.VIEWPORT_CACHE_TIMEOUT
+    )
+
+
+def _pois_in_viewport(bbox, zoom: int) -> Dict[str, Any]:
+    if zoom >= settings.VIEWPORT_POINTS_MIN_ZOOM:
+        # The first VIEWPORT_MAX_POINTS by id, so a truncated viewport always shows the same points
+        pois = PointOfInterest.objects.in_bbox(bbox).only('id', 'name', 'location').order_by('id')
+        pois = list(pois[: settings.VIEWPORT_MAX_POINTS + 1])
+        result = {
+            'mode': 'points',
+            'bbox': bbox,
+            'points': [
+                {'id': poi.id, 'name': poi.name, 'coordinates': [poi.location.x, poi.location.y]}
+                for poi in pois[: settings.VIEWPORT_MAX_POINTS]
+            ],
+            'truncated': len(pois) > settings.VIEWPORT_MAX_POINTS,
+        }
+    else:
+        cell = 360 / 2**zoom / VIEWPORT_CELLS_PER_TILE
+        if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / cell**2 > settings.VIEWPORT_MAX_CLUSTERS:
+            raise ValidationError(_('Viewport is too large for this zoom level.'))
+        with connection.cursor() as cursor:
+            cursor.execute(VIEWPORT_CLUSTERS_SQL, [VIEWPORT_CLUSTER_SAMPLE_IDS, *bbox, cell])
+            rows = cursor.fetchall()
+        result = {
+            'mode': 'clusters',
+            'bbox': bbox,
+            'clusters': [
+                {'count': count, 'coordinates': [lon, lat], 'sample_ids': ids} for count, lon, lat, ids in rows
+            ],
+        }
+    return result
+
+
+def poi_with_aggregate_rating(poi_id: int, languages=()) -> Optional[PointOfInterest]:
+    return PointOfInterest.objects.with_avg_rating().with_translations(languages).filter(id=poi_id).first()
 
 
 def haversine(p1: Point, p2: Point) -> float:
@@ -167,36 +1098,196 @@ def haversine(p1: Point, p2: Point) -> float:
     return R * c * 0.621371  # miles
 
 
-def get_itinerary_stats(itinerary_id: int) -> Dict[str, Any]:
-    # ORM + Python only: Calculate total walking km and daily occupancy per day
-    items = ItineraryItem.objects.filter(itinerary_id=itinerary_id).select_related('poi').order_by('date', 'order')
+ITINERARY_STATS_BACKENDS = ('stored', 'python', 'sql')
+
+ITINERARY_STATS_SQL = """
+    WITH legs AS (
+        SELECT item.itinerary_id,
+               item.date,
+               ST_Distance(
+                   poi.location,
+                   LAG(poi.location) OVER (PARTITION BY item.itinerary_id, item.date ORDER BY item."order"),
+                   false
+               ) AS leg_m
+        FROM app_itineraryitem AS item
+        JOIN app_pointofinterest AS poi ON poi.id = item.poi_id
+        WHERE item.itinerary_id = ANY(%s)
+    )
+    SELECT itinerary_id, date, COUNT(*), COALESCE(SUM(leg_m), 0) / 1000.0
+    FROM legs
+    GROUP BY itinerary_id, date
+    ORDER BY itinerary_id, date
+"""
+
+
+def get_itinerary_stats(itinerary_id: int, backend: Optional[str] = None) -> Dict[str, Any]:
+    return get_itineraries_stats([itinerary_id], backend)[int(itinerary_id)]
+
+
+def get_itineraries_stats(itinerary_ids, backend: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
+    # Stats of many itineraries in a constant number of queries: every backend reads the rows of all the
+    # itineraries at once, ordered by itinerary, and groups them in a single pass
+    itinerary_ids = list(dict.fromkeys(int(pk) for pk in itinerary_ids))
+    backend = backend or settings.ITINERARY_STATS_BACKEND
+    if backend == 'stored':
+        rows = _itinerary_day_rows_stored(itinerary_ids)
+    elif backend == 'sql':
+        rows = _itinerary_day_rows_sql(itinerary_ids)
+    else:
+        rows = _itinerary_day_rows_python(itinerary_ids)
+    return {pk: _stats_payload(rows.get(pk, [])) for pk in itinerary_ids}
+
+
+def _stats_payload(rows) -> Dict[str, Any]:
+    # rows: (date, occupancy, walk_km) ordered by date
+    return {
+        'total_walk_km': round(float(sum(walk_km for _, _, walk_km in rows)), 3),
+        'daily_occupancy': [{'date': day.strftime('%Y-%m-%d'), 'occupancy': occupancy} for day, occupancy, _ in rows],
+    }
+
+
+def _group_day_rows(rows) -> Dict[int, List]:
+    # (itinerary_id, date, occupancy, walk_km) ordered by itinerary -> {itinerary_id: [(date, occupancy, walk_km)]}
+    return {
+        itinerary_id: [(day, occupancy, float(walk_km)) for _, day, occupancy, walk_km in group]
+        for itinerary_id, group in groupby(rows, key=itemgetter(0))
+    }
+
+
+def _itinerary_day_rows_stored(itinerary_ids) -> Dict[int, List]:
+    # O(days) read-only query of the rows the item and POI services keep up to date; items written around the
+    # services are picked up by the rebuild_itinerary_stats command, never by a read
+    stored = ItineraryDayStats.objects.filter(itinerary_id__in=itinerary_ids).order_by('itinerary_id', 'date')
+    return _group_day_rows(stored.values_list('itinerary_id', 'date', 'item_count', 'walk_km'))
+
+
+def _itinerary_day_rows_sql(itinerary_ids) -> Dict[int, List]:
+    # One round trip: LAG pairs each item with the previous one of the same itinerary and day, ST_Distance on the
+    # sphere matches app.distance, and GROUP BY yields the occupancy alongside the per-day walk
+    with connection.cursor() as cursor:
+        cursor.execute(ITINERARY_STATS_SQL, [list(itinerary_ids)])
+        return _group_day_rows(cursor.fetchall())
+
+
+def _itinerary_day_rows_python(itinerary_ids) -> Dict[int, List]:
+    # Walking legs only join consecutive items of the same itinerary and day; each item carries the leg into it
+    items = list(
+        ItineraryItem.objects.filter(itinerary_id__in=itinerary_ids)
+        .order_by('itinerary_id', 'date', 'order')
+        .values_list('itinerary_id', 'date', 'poi__location')
+    )
     if not items:
-        return {'total_walk_km': 0.0, 'daily_occupancy': []}
-    total_walk = 0.0
-    last_point = None
-    last_date = None
-    daily_occupancy = {}
+        return {}
+    days = [(pk, d) for pk, d, _ in items]
+    legs = distance.leg_km([loc.x for _, _, loc in items], [loc.y for _, _, loc in items])
+    same_day = np.asarray([a == b for a, b in zip(days, days[1:])], dtype=bool)
+    walk_in = np.zeros(len(items))
+    walk_in[1:][same_day] = legs[same_day]
+    per_day = []
+    for (pk, d), group in groupby(zip(days, walk_in.tolist()), key=itemgetter(0)):
+        walks = [walk for _, walk in group]
+        per_day.append((pk, d, len(walks), sum(walks)))
+    return _group_day_rows(per_day)
+
+
+def _minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _time_of_day(minutes: int):
+    return time(minutes // 60, minutes % 60)
+
+
+def optimize_itinerary(
+    itinerary: Itinerary, time_budget_ms: Optional[float] = None, dwell_minutes: float = 0
+) -> List[Dict[str, Any]]:
+    # Reorder each day's items to shorten the walk and re-time them along the new route. Items keep their length
+    # and stay within the day's span (first start to last end); items with a live booking keep their time.
+    # ``dwell_minutes`` is extra time allowed at every stop on top of its length
+    time_budget_ms = settings.ROUTE_OPTIMIZER_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+    minutes_per_km = 60 / settings.WALKING_SPEED_KMH
+    items = list(itinerary.items.select_related('poi').order_by('date', 'order'))
+    booked = set(
+        Booking.objects.filter(itinerary_item__in=items)
+        .exclude(status=Booking.STATUS_CANCELLED)
+        .values_list('itinerary_item_id', flat=True)
+    )
+    days: Dict[Any, List[ItineraryItem]] = {}
     for item in items:
-        if item.date not in daily_occupancy:
-            daily_occupancy[item.date] = 0
-        daily_occupancy[item.date] += 1
-        if last_point is not None and item.date == last_date:
-            total_walk += haversine(last_point, item.poi.location)
-        last_point = item.poi.location
-        last_date = item.date
-    result = {
-        'total_walk_km': round(total_walk, 3),
-        'daily_occupancy': [
-            {'date': d.strftime('%Y-%m-%d'), 'occupancy': daily_occupancy[d]} for d in sorted(daily_occupancy.keys())
-        ],
-    }
+        days.setdefault(item.date, []).append(item)
+    changed, result = [], []
+    for day, day_items in days.items():
+        matrix = distance.distance_matrix_km(
+            [item.poi.location.x for item in day_items], [item.poi.location.y for item in day_items]
+        )
+        lengths = [max(_minutes(item.end_time) - _minutes(item.start_time), 0) for item in day_items]
+        opens = min(_minutes(item.start_time) for item in day_items)
+        closes = max(_minutes(item.end_time) for item in day_items)
+        windows = [
+            (_minutes(item.start_time),) * 2 if item.pk in booked else (opens, closes - length)
+            for item, length in zip(day_items, lengths)
+        ]
+        dwell = [length + dwell_minutes for length in lengths]
+        route = routing.optimize_route(matrix, windows, minutes_per_km, time_budget_ms / 1000, dwell)
+        current = list(range(len(day_items)))
+        if route != current and not routing.is_feasible(route, matrix, windows, minutes_per_km, dwell):
+            route = current
+        if route != current:
+            # Permute the day's existing order values so untouched days and gaps stay as they are. Arrivals are
+            # rounded down to the minute, which keeps every item clear of the next one and booked items in place
+            arrivals = routing.arrival_times(route, matrix, windows, minutes_per_km, dwell)
+            slots = [item.order for item in day_items]
+            for slot, index, arrival in zip(slots, route, arrivals):
+                item = day_items[index]
+                item.order = slot
+                item.start_time = _time_of_day(int(arrival))
+                item.end_time = _time_of_day(int(arrival) + lengths[index])
+                changed.append(item)
+        result.append(
+            {
+                'date': day.strftime('%Y-%m-%d'),
+                'item_ids': [day_items[index].id for index in route],
+                'walk_km_before': round(routing.route_km(current, matrix), 3),
+                'walk_km_after': round(routing.route_km(route, matrix), 3),
+            }
+        )
+    if changed:
+        with transaction.atomic():
+            # (itinerary, date, order) is unique and checked row by row, so park the moved rows out of the way first
+            offset = max(item.order for item in items) + 1
+            ItineraryItem.objects.filter(pk__in=[item.pk for item in changed]).update(order=F('order') + offset)
+            ItineraryItem.objects.bulk_update(changed, ['order', 'start_time', 'end_time'])
+            refresh_itinerary_days({(itinerary.pk, item.date) for item in changed})
     return result
 
 
+def poi_distance_matrix(poi_ids: List[int]) -> Dict[str, Any]:
+    locations = dict(PointOfInterest.objects.filter(pk__in=poi_ids).values_list('pk', 'location'))
+    missing = [pk for pk in poi_ids if pk not in locations]
+    if missing:
+        raise ValidationError(_('Unknown points of interest: %(ids)s') % {'ids': ', '.join(map(str, missing))})
+    matrix = distance.distance_matrix_km([locations[pk].x for pk in poi_ids], [locations[pk].y for pk in poi_ids])
+    return {'ids': poi_ids, 'matrix_km': matrix.round(3).tolist()}
+
+
+def get_poi_tile(z: int, x: int, y: int, languages=()) -> bytes:
+    return tiles.get_poi_tile(z, x, y, languages)
+
+
 def get_translation(poi: PointOfInterest, lang_code: Optional[str] = None) -> Any:
-    lang_code = lang_code or get_language()
-    try:
-        translation = poi.translations.get(language_code=lang_code)
-        return translation.name, translation.description
-    except POITranslation.DoesNotExist:
-        return poi.name, ''
+    # Regional codes fall back to their base language ('de-at' -> 'de'), then to the POI's default name
+    languages = locales.fallbacks(lang_code or get_language() or settings.LANGUAGE_CODE)
+    # POIs from list querysets come with the request's translations prefetched (``with_translations``), so a
+    # page of them costs no query per POI
+    candidates = getattr(poi, 'localized_translations', None)
+    if candidates is None and 'translations' in getattr(poi, '_prefetched_objects_cache', {}):
+        candidates = poi.translations.all()
+    if candidates is None:
+        candidates = POITranslation.objects.annotate(language=Lower('language_code')).filter(
+            poi=poi, language__in=languages
+        )
+    translations = {t.language_code.lower(): t for t in candidates}
+    for language in languages:
+        if language in translations:
+            return translations[language].name, translations[language].description
+    return poi.name, ''
@@ -0,0 +1,91 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import generations, locales
+
+WEB_MERCATOR_MAX_LAT = 85.0511287798
+
+POI_TILE_SQL = """
+    WITH bounds AS (SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom),
+    features AS (
+        SELECT p.id,
+               COALESCE(t.name, p.name) AS name,
+               p.rating_sum::float8 / NULLIF(p.review_count, 0) AS avg_rating,
+               ST_AsMVTGeom(ST_Transform(p.location::geometry(GEOMETRY, 4326), 3857), bounds.geom, %(extent)s) AS geom
+        FROM app_pointofinterest p
+        CROSS JOIN bounds
+        LEFT JOIN LATERAL (
+            SELECT tr.name
+            FROM app_poitranslation tr
+            WHERE tr.poi_id = p.id AND lower(tr.language_code) = ANY(%(languages)s::text[])
+            ORDER BY array_position(%(languages)s::text[], lower(tr.language_code))
+            LIMIT 1
+        ) t ON true
+        WHERE p.location::geometry(GEOMETRY, 4326) && ST_Transform(bounds.geom, 4326)
+    )
+    SELECT ST_AsMVT(features.*, 'pois', %(extent)s, 'geom', 'id') FROM features
+"""
+
+
+def tile_for(lon: float, lat: float, z: int):
+    n = 2**z
+    lat = max(min(lat, WEB_MERCATOR_MAX_LAT), -WEB_MERCATOR_MAX_LAT)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+GLOBAL_TAG = 'mvt'
+
+
+def _tile_tag(z: int, x: int, y: int) -> str:
+    return f'mvt:{z}:{x}:{y}'
+
+
+def covering_tags(bbox, zoom: int, max_tiles: int = 4):
+    # Tags whose bumps cover every POI write inside bbox: the global tag and the tiles of the deepest zoom, up to
+    # ``zoom``, at which at most ``max_tiles`` tiles cover it (invalidate_tiles_at bumps the tiles of every zoom)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    for z in range(min(zoom, settings.MVT_MAX_ZOOM), -1, -1):
+        x0, y0 = tile_for(min_lon, max_lat, z)
+        x1, y1 = tile_for(max_lon, min_lat, z)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_tiles:
+            return [GLOBAL_TAG, *(_tile_tag(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))]
+
+
+def get_poi_tile(z: int, x: int, y: int, languages=()) -> bytes:
+    # Tiles are keyed by a per-tile generation so a POI write only has to bump the generations of the tiles it sits
+    # in, whatever language chains those tiles were rendered for.
+    versions = generations.get_many([GLOBAL_TAG, _tile_tag(z, x, y)])
+    version = f'{versions[GLOBAL_TAG]}.{versions[_tile_tag(z, x, y)]}'
+    cache_key = f'mvt:{version}:{locales.chain_key(languages)}:{z}:{x}:{y}'
+    tile = cache.get(cache_key)
+    if tile is not None:
+        return tile
+    with connection.cursor() as cursor:
+        params = {'z': z, 'x': x, 'y': y, 'extent': settings.MVT_EXTENT, 'languages': list(languages)}
+        cursor.execute(POI_TILE_SQL, params)
+        tile = bytes(cursor.fetchone()[0] or b'')
+    cache.set(cache_key, tile, timeout=settings.MVT_CACHE_TIMEOUT)
+    return tile
+
+
+def invalidate_tiles_at(*points) -> None:
+    # generations.bump increments atomically, so concurrent writers to the same tile cannot lose a bump, and sends
+    # the tags of every zoom level in one round trip
+    generations.bump(
+        *{
+            _tile_tag(z, *tile_for(p.x, p.y, z))
+            for p in points
+            if p is not None
+            for z in range(settings.MVT_MAX_ZOOM + 1)
+        }
+    )
+
+
+def invalidate_all_tiles() -> None:
+    # Cheaper than per-tile bumps when a bulk write touches more tiles than it is worth tracking
+    generations.bump(GLOBAL_TAG)
@@ -114,9 +114,82 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
-CACHES = {'default': env.cache('CACHE_URL', default='redis://localhost:6379/0')}
+CACHES = {
+    'default': env.cache('CACHE_URL', default='redis://localhost:6379/0'),
+    # Per-worker LRU in front of 'default' for hot, read-mostly entries (cached responses, nearby cells);
+    # writes are announced over Redis pub/sub so other workers drop their copies ('local' bus for dev/tests)
+    'tiered': {
+        'BACKEND': 'app.cache_backends.TieredCache',
+        'LOCATION': 'tiered',
+        'OPTIONS': {
+            'SHARED': 'default',
+            'MAX_ENTRIES': env.int('TIERED_CACHE_MAX_ENTRIES', default=4096),
+            'LOCAL_TIMEOUT': env.int('TIERED_CACHE_LOCAL_TIMEOUT', default=30),
+            'BUS': env('TIERED_CACHE_BUS', default='redis'),
+        },
+    },
+}
+HOT_CACHE_ALIAS = 'tiered'
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
+# Responses keyed on write generations (app.generations) stay correct across writes, so the TTL can be long
+GENERATION_CACHE_TIMEOUT = env.int('GENERATION_CACHE_TIMEOUT', default=6 * 60 * 60)
+# app.caching: how long an expired entry may still be served while one worker recomputes it, how long that
+# worker's lock lives, and how long the others wait for it on a cold miss before computing themselves
+CACHE_STALE_TIMEOUT = env.int('CACHE_STALE_TIMEOUT', default=5 * 60)
+# Lifetime of a generation counter; it outlives every entry keyed on it (an expired counter restarts from the clock)
+GENERATION_KEY_TIMEOUT = env.int(
+    'GENERATION_KEY_TIMEOUT', default=GENERATION_CACHE_TIMEOUT + CACHE_STALE_TIMEOUT + 60 * 60
+)
+CACHE_LOCK_TIMEOUT = env.int('CACHE_LOCK_TIMEOUT', default=10)
+CACHE_LOCK_WAIT = env.float('CACHE_LOCK_WAIT', default=2.0)
+# Seconds between flushes of a worker's cache hit/miss counters to the shared cache
+CACHE_STATS_FLUSH_INTERVAL = env.int('CACHE_STATS_FLUSH_INTERVAL', default=10)
+# cache_response also stores a gzip copy of rendered bodies at least this large
+CACHE_RESPONSE_GZIP = env.bool('CACHE_RESPONSE_GZIP', default=True)
+CACHE_RESPONSE_GZIP_MIN_BYTES = env.int('CACHE_RESPONSE_GZIP_MIN_BYTES', default=1024)
+
+# Map screens: below this zoom the viewport endpoint returns grid clusters instead of raw points.
+VIEWPORT_POINTS_MIN_ZOOM = env.int('VIEWPORT_POINTS_MIN_ZOOM', default=16)
+VIEWPORT_MAX_POINTS = env.int('VIEWPORT_MAX_POINTS', default=500)
+VIEWPORT_MAX_CLUSTERS = env.int('VIEWPORT_MAX_CLUSTERS', default=4096)
+VIEWPORT_CACHE_TIMEOUT = env.int('VIEWPORT_CACHE_TIMEOUT', default=300)
+NEARBY_CELL_CACHE_TIMEOUT = env.int('NEARBY_CELL_CACHE_TIMEOUT', default=60 * 60)
+
+DISTANCE_MATRIX_MAX_POIS = env.int('DISTANCE_MATRIX_MAX_POIS', default=200)
+
+# 'stored' reads the per-day rows maintained on item writes (backfilled by the rebuild_itinerary_stats command),
+# 'python' walks the items in-process and 'sql' computes the same payload in PostGIS in one query
+ITINERARY_STATS_BACKEND = env('ITINERARY_STATS_BACKEND', default='stored')
+ITINERARY_BATCH_STATS_MAX = env.int('ITINERARY_BATCH_STATS_MAX', default=500)
+
+WALKING_SPEED_KMH = env.float('WALKING_SPEED_KMH', default=4.5)
+ROUTE_OPTIMIZER_TIME_BUDGET_MS = env.int('ROUTE_OPTIMIZER_TIME_BUDGET_MS', default=50)
+
+# 'conditional' books with one guarded UPDATE on the schedule; 'row_lock' holds SELECT ... FOR UPDATE across the
+# booking INSERT
+BOOKING_STRATEGY = env('BOOKING_STRATEGY', default='conditional')
+# Pending (unpaid) bookings are cancelled by the expire_bookings sweep after this many seconds
+BOOKING_PENDING_TTL = env.int('BOOKING_PENDING_TTL', default=900)
+
+# Schedules and bookings are partitioned by month (app.partitions); manage_partitions keeps this many months ahead
+# created and archives partitions older than PARTITION_RETENTION_MONTHS
+PARTITION_MONTHS_AHEAD = env.int('PARTITION_MONTHS_AHEAD', default=3)
+PARTITION_RETENTION_MONTHS = env.int('PARTITION_RETENTION_MONTHS', default=24)
+
+# Seats held in Redis before checkout are released automatically after SEAT_HOLD_TTL seconds
+SEAT_HOLD_TTL = env.int('SEAT_HOLD_TTL', default=180)
+SEAT_HOLD_MAX_SEATS = env.int('SEAT_HOLD_MAX_SEATS', default=10)
+# Seconds the Redis copy of a schedule's remaining capacity lives before it is reloaded from PostgreSQL
+SEAT_HOLD_CAPACITY_TTL = env.int('SEAT_HOLD_CAPACITY_TTL', default=60)
+ITINERARY_BOOKING_MAX_ITEMS = env.int('ITINERARY_BOOKING_MAX_ITEMS', default=50)
+SCHEDULE_GENERATE_MAX_SLOTS = env.int('SCHEDULE_GENERATE_MAX_SLOTS', default=20000)
+SCHEDULE_GENERATE_MAX_DAYS = env.int('SCHEDULE_GENERATE_MAX_DAYS', default=731)
+SCHEDULE_GENERATE_BATCH_SIZE = env.int('SCHEDULE_GENERATE_BATCH_SIZE', default=1000)
+
+MVT_MAX_ZOOM = env.int('MVT_MAX_ZOOM', default=22)
+MVT_EXTENT = 4096
+MVT_CACHE_TIMEOUT = env.int('MVT_CACHE_TIMEOUT', default=60 * 60 * 24)
 
 LOGGING = {
     'version': 1,
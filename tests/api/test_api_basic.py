@@ -1,10 +1,13 @@
+from datetime import date, time
+
 import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
 from django.urls import reverse
 from rest_framework import status
 
-from app.models import PointOfInterest
+from app import services
+from app.models import AttractionSchedule, Booking, PointOfInterest
 
 pytestmark = pytest.mark.django_db
 
@@ -41,3 +44,49 @@ def test_cannot_create_itinerary_item_overlap(authenticated_api_client):
     data2 = {'itinerary': iti_id, 'poi_id': poi.id, 'date': '2040-01-01', 'start_time': '10:30', 'end_time': '11:30'}
     r2 = authenticated_api_client.post(item_url, data2, format='json')
     assert r2.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_book_itinerary_is_all_or_nothing(authenticated_api_client, user):
+    iti = services.create_itinerary(user, 'Fair')
+    poi = PointOfInterest.objects.create(operator=user, name='Rides', location=Point(1, 2))
+    wheel = services.create_schedule(poi, '2040-01-01T10:00Z', '2040-01-01T11:00Z', total_capacity=4)
+    coaster = services.create_schedule(poi, '2040-01-01T12:00Z', '2040-01-01T13:00Z', total_capacity=1)
+    morning = services.add_itinerary_item(iti, poi, date(2040, 1, 1), time(10, 0), time(11, 0))
+    noon = services.add_itinerary_item(iti, poi, date(2040, 1, 1), time(12, 0), time(13, 0))
+    url = reverse('api:itinerary-book', args=[iti.pk])
+
+    lines = [
+        {'itinerary_item_id': morning.pk, 'schedule_id': wheel.pk, 'seats': 2},
+        {'itinerary_item_id': noon.pk, 'schedule_id': coaster.pk, 'seats': 2},
+    ]
+    rejected = authenticated_api_client.post(url, {'items': lines}, format='json')
+    assert rejected.status_code == status.HTTP_400_BAD_REQUEST
+    assert list(rejected.data) == [str(noon.pk)]
+    assert Booking.objects.count() == 0
+
+    lines[1]['seats'] = 1
+    booked = authenticated_api_client.post(url, {'items': lines}, format='json')
+    assert booked.status_code == status.HTTP_201_CREATED
+    assert [(row['seats'], row['status']) for row in booked.data['results']] == [(2, 'confirmed'), (1, 'confirmed')]
+    assert dict(AttractionSchedule.objects.values_list('pk', 'remaining_capacity')) == {wheel.pk: 2, coaster.pk: 0}
+
+
+def test_booking_create_and_staff_confirm(authenticated_api_client, user):
+    iti = services.create_itinerary(user, 'Fair')
+    poi = PointOfInterest.objects.create(operator=user, name='Swings', location=Point(1, 2))
+    swings = services.create_schedule(poi, '2040-01-01T10:00Z', '2040-01-01T11:00Z', total_capacity=4)
+    item = services.add_itinerary_item(iti, poi, date(2040, 1, 1), time(10, 0), time(11, 0))
+    data = {'itinerary_item_id': item.pk, 'schedule_id': swings.pk, 'seats': 3}
+    created = authenticated_api_client.post(reverse('api:booking-list'), data, format='json')
+    assert created.status_code == status.HTTP_201_CREATED
+    assert Booking.objects.get().pk == created.data['id']
+    assert authenticated_api_client.post(reverse('api:booking-list'), data, format='json').status_code == 400
+
+    confirm_url = reverse('api:booking-confirm', args=[created.data['id']])
+    owner = authenticated_api_client.post(confirm_url, {'payment_ref': 'self-paid'}, format='json')
+    assert owner.status_code == status.HTTP_403_FORBIDDEN
+    staff = get_user_model().objects.create_user(username='cashier', password='pw', is_staff=True)
+    authenticated_api_client.force_authenticate(staff)
+    confirmed = authenticated_api_client.post(confirm_url, {'payment_ref': 'psp-1'}, format='json')
+    assert confirmed.status_code == status.HTTP_200_OK
+    assert Booking.objects.get().status == Booking.STATUS_CONFIRMED
@@ -3,10 +3,13 @@ from datetime import date, time
 import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
-from app.models import Itinerary, ItineraryItem, PointOfInterest
+from app import services
+from app.models import Itinerary, PointOfInterest
 
 pytestmark = pytest.mark.django_db
 
@@ -17,14 +20,7 @@ def test_itinerary_stats_endpoint(authenticated_api_client):
     locs = [Point(12.0, 51.0), Point(12.01, 51.005), Point(12.02, 51.01)]
     for i, pt in enumerate(locs):
         poi = PointOfInterest.objects.create(operator=user, name=f'Pt{i}', location=pt)
-        ItineraryItem.objects.create(
-            itinerary=iti,
-            poi=poi,
-            date=date(2040, 5, 20),
-            start_time=time(10 + i, 0),
-            end_time=time(11 + i, 0),
-            order=i,
-        )
+        services.add_itinerary_item(iti, poi, date(2040, 5, 20), time(10 + i, 0), time(11 + i, 0))
     url = reverse('api:itinerary-stats', args=[iti.id])
     resp = authenticated_api_client.get(url)
     assert resp.status_code == status.HTTP_200_OK
@@ -32,3 +28,75 @@ def test_itinerary_stats_endpoint(authenticated_api_client):
     assert 'daily_occupancy' in resp.data
     assert isinstance(resp.data['total_walk_km'], float)
     assert resp.data['daily_occupancy']
+    assert authenticated_api_client.get(reverse('api:itinerary-stats', args=[iti.id + 1000])).status_code == 404
+
+
+def test_itinerary_optimize_endpoint_reorders_and_retimes_day(authenticated_api_client, user):
+    iti = Itinerary.objects.create(user=user, name='Zigzag')
+    # One-hour visits with half-hour gaps, as the item endpoint accepts them
+    visits = [
+        (time(9, 0), time(10, 0)),
+        (time(10, 30), time(11, 30)),
+        (time(12, 0), time(13, 0)),
+        (time(13, 30), time(14, 30)),
+    ]
+    for i, (lon, (start, end)) in enumerate(zip([0.0, 0.03, 0.01, 0.02], visits)):
+        poi = PointOfInterest.objects.create(operator=user, name=f'Z{i}', location=Point(lon, 0.0))
+        services.add_itinerary_item(iti, poi, date(2040, 5, 21), start, end)
+    url = reverse('api:itinerary-optimize', args=[iti.id])
+    resp = authenticated_api_client.post(url, {}, format='json')
+    assert resp.status_code == status.HTTP_200_OK
+    day = resp.data['days'][0]
+    assert day['walk_km_after'] < day['walk_km_before']
+    # 0.01 degrees of longitude on the equator is about 15 minutes on foot
+    assert list(iti.items.order_by('order').values_list('poi__name', 'start_time', 'end_time')) == [
+        ('Z0', time(9, 0), time(10, 0)),
+        ('Z2', time(10, 14), time(11, 14)),
+        ('Z3', time(11, 29), time(12, 29)),
+        ('Z1', time(12, 44), time(13, 44)),
+    ]
+
+
+def _itinerary_with_items(user, name, count):
+    iti = Itinerary.objects.create(user=user, name=name)
+    for i in range(count):
+        poi = PointOfInterest.objects.create(operator=user, name=f'{name} {i}', location=Point(i * 0.01, 0.0))
+        services.add_itinerary_item(iti, poi, date(2040, 6, 1), time(9 + i), time(10 + i))
+    return iti
+
+
+@pytest.mark.parametrize('backend', ['stored', 'python', 'sql'])
+def test_itinerary_batch_stats_uses_constant_queries(authenticated_api_client, user, backend):
+    itineraries = [_itinerary_with_items(user, f'Trip {n}', n + 1) for n in range(6)]
+    url = reverse('api:itinerary-batch-stats')
+    # Warm up so both calls below measure steady-state reads
+    authenticated_api_client.get(url, {'ids': ','.join(str(iti.id) for iti in itineraries), 'backend': backend})
+    counts = []
+    for subset in (itineraries[:2], itineraries):
+        with CaptureQueriesContext(connection) as queries:
+            resp = authenticated_api_client.get(
+                url, {'ids': ','.join(str(iti.id) for iti in subset), 'backend': backend}
+            )
+        assert resp.status_code == status.HTTP_200_OK
+        assert [row['id'] for row in resp.data['results']] == [iti.id for iti in subset]
+        counts.append(len(queries))
+    assert counts[0] == counts[1]
+    # Reads never write, whatever rows are stored
+    assert all(query['sql'].lstrip().upper().startswith('SELECT') for query in queries.captured_queries)
+    last = resp.data['results'][-1]
+    assert last['daily_occupancy'] == [{'date': '2040-06-01', 'occupancy': 6}]
+    assert last['total_walk_km'] == pytest.approx(5.56, abs=0.01)
+
+
+def test_itinerary_batch_stats_rejects_bad_ids(authenticated_api_client):
+    url = reverse('api:itinerary-batch-stats')
+    assert authenticated_api_client.get(url, {'ids': '1,x'}).status_code == status.HTTP_400_BAD_REQUEST
+    assert authenticated_api_client.get(url).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_itinerary_list_includes_stats(authenticated_api_client, user):
+    iti = _itinerary_with_items(user, 'Listed', 2)
+    resp = authenticated_api_client.get(reverse('api:itinerary-list'), {'include': 'stats'})
+    assert resp.status_code == status.HTTP_200_OK
+    row = next(row for row in resp.data['results'] if row['id'] == iti.id)
+    assert row['stats']['daily_occupancy'] == [{'date': '2040-06-01', 'occupancy': 2}]
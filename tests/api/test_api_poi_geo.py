@@ -1,9 +1,13 @@
+import gzip
+from datetime import date, time
+
 import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
 from django.urls import reverse
 from rest_framework import status
 
+from app import services, tiles
 from app.models import PointOfInterest
 
 pytestmark = pytest.mark.django_db
@@ -24,11 +28,212 @@ def test_nearby_api(authenticated_api_client):
 def test_aggregate_rating_api(authenticated_api_client):
     user = get_user_model().objects.create(username='geo2', password='pw')
     poi = PointOfInterest.objects.create(operator=user, name='Rated', location=Point(8, 8))
-    # Add reviews manually
-    from app.models import Review
-
-    Review.objects.create(user=user, poi=poi, rating=5, text='Great!')
+    services.submit_review(user, poi, 5, 'Great!')
     url = reverse('api:pointofinterest-aggregate', args=[poi.id])
     resp = authenticated_api_client.get(url)
     assert resp.status_code == status.HTTP_200_OK
     assert resp.data['avg_rating'] == 5
+
+
+def test_aggregate_cache_follows_review_writes(authenticated_api_client, django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create(username='geo3', password='pw')
+    poi = PointOfInterest.objects.create(operator=user, name='Cached', location=Point(9, 9))
+    url = reverse('api:pointofinterest-aggregate', args=[poi.id])
+    assert authenticated_api_client.get(url).data['review_count'] == 0
+    PointOfInterest.objects.filter(pk=poi.pk).update(name='Unseen')
+    assert authenticated_api_client.get(url).json()['name'] == 'Cached'
+    with django_capture_on_commit_callbacks(execute=True):
+        services.submit_review(user, poi, 4, 'Fine')
+    resp = authenticated_api_client.get(url)
+    assert (resp.data['name'], resp.data['review_count'], resp.data['avg_rating']) == ('Unseen', 1, 4)
+
+
+def test_poi_detail_revalidates_with_etag(authenticated_api_client, user, django_capture_on_commit_callbacks):
+    poi = PointOfInterest.objects.create(operator=user, name='Tagged', location=Point(3, 3))
+    url = reverse('api:pointofinterest-detail', args=[poi.id])
+    first = authenticated_api_client.get(url)
+    etag = first['ETag']
+    assert first.status_code == status.HTTP_200_OK and etag.startswith('"')
+    cached = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+    assert cached['ETag'] == etag and cached.content == b''
+    with django_capture_on_commit_callbacks(execute=True):
+        services.update_poi(poi, name='Retagged')
+    changed = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert changed.status_code == status.HTTP_200_OK
+    assert changed['ETag'] != etag and changed.json()['name'] == 'Retagged'
+
+
+def test_poi_detail_does_not_cache_browsable_html(authenticated_api_client, user):
+    poi = PointOfInterest.objects.create(operator=user, name='Browsed', location=Point(5, 5))
+    url = reverse('api:pointofinterest-detail', args=[poi.id])
+    html = authenticated_api_client.get(url, HTTP_ACCEPT='text/html')
+    assert html.status_code == status.HTTP_200_OK and 'ETag' not in html
+    assert 'ETag' in authenticated_api_client.get(url)
+
+
+def test_poi_detail_serves_cached_gzip(authenticated_api_client, user, settings):
+    settings.CACHE_RESPONSE_GZIP_MIN_BYTES = 0
+    poi = PointOfInterest.objects.create(operator=user, name='Zipped', location=Point(4, 4))
+    url = reverse('api:pointofinterest-detail', args=[poi.id])
+    plain = authenticated_api_client.get(url)
+    zipped = authenticated_api_client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+    assert zipped['Content-Encoding'] == 'gzip'
+    assert zipped['ETag'] == plain['ETag'][:-1] + '-gzip"'
+    assert gzip.decompress(zipped.content) == plain.content
+    assert authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=zipped['ETag']).status_code == 304
+
+
+def test_poi_names_follow_accept_language_fallbacks(authenticated_api_client, user):
+    poi = services.create_poi(
+        user,
+        'Castle',
+        Point(10.0, 50.0),
+        translations={'de': {'name': 'Burg', 'description': 'Alt'}, 'fr': {'name': 'Château'}},
+    )
+    url = reverse('api:pointofinterest-detail', args=[poi.id])
+    german = authenticated_api_client.get(url, HTTP_ACCEPT_LANGUAGE='de-AT,en;q=0.5')
+    assert (german.data['name'], german.data['language'], german.data['default_name']) == ('Burg', 'de', 'Castle')
+    assert [t['language_code'] for t in german.data['translations']] == ['de']
+    assert 'Accept-Language' in german['Vary']
+    # Cached per language chain, so a second language never gets the German entry
+    assert authenticated_api_client.get(url, HTTP_ACCEPT_LANGUAGE='it').json()['name'] == 'Castle'
+    assert authenticated_api_client.get(url, HTTP_ACCEPT_LANGUAGE='de-AT,en;q=0.5').json()['name'] == 'Burg'
+    nearby = reverse('api:pointofinterest-nearby') + '?lon=10.0&lat=50.0&radius=1'
+    assert authenticated_api_client.get(nearby, HTTP_ACCEPT_LANGUAGE='fr').data['results'][0]['name'] == 'Château'
+    assert authenticated_api_client.get(nearby).data['results'][0]['name'] == 'Castle'
+
+
+def test_cache_stats_are_admin_only(authenticated_api_client, user):
+    url = reverse('api:cache-stats')
+    assert authenticated_api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+    user.is_staff = True
+    user.save()
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == status.HTTP_200_OK
+    assert set(resp.data['POIViewSet:aggregate']) == {'hit', 'miss', 'stale'}
+
+
+def test_nearest_api_pages_by_distance_cursor(authenticated_api_client):
+    user = get_user_model().objects.create(username='knn', password='pw')
+    for i in range(5):
+        PointOfInterest.objects.create(operator=user, name=f'Stop{i}', location=Point(12.00 + i * 0.01, 51.00))
+    url = reverse('api:pointofinterest-nearest')
+    resp = authenticated_api_client.get(url + '?lon=12.00&lat=51.00&page_size=2')
+    assert resp.status_code == status.HTTP_200_OK
+    assert [poi['name'] for poi in resp.data['results']] == ['Stop0', 'Stop1']
+    assert resp.data['results'][0]['distance_km'] == 0
+    names = []
+    while resp.data['next']:
+        resp = authenticated_api_client.get(resp.data['next'])
+        names += [poi['name'] for poi in resp.data['results']]
+    assert names == ['Stop2', 'Stop3', 'Stop4']
+
+
+def test_nearest_api_cursor_keeps_rows_with_equal_distances(authenticated_api_client):
+    user = get_user_model().objects.create(username='knn-ties', password='pw')
+    stops = [
+        PointOfInterest.objects.create(operator=user, name=f'Tie{i}', location=Point(12.0137, 51.0071))
+        for i in range(3)
+    ]
+    PointOfInterest.objects.create(operator=user, name='Far', location=Point(12.05, 51.00))
+    url = reverse('api:pointofinterest-nearest') + '?lon=12.00&lat=51.00&page_size=1'
+    resp = authenticated_api_client.get(url)
+    ids = [poi['id'] for poi in resp.data['results']]
+    while resp.data['next']:
+        resp = authenticated_api_client.get(resp.data['next'])
+        ids += [poi['id'] for poi in resp.data['results']]
+    assert ids[:3] == [stop.pk for stop in stops]
+    assert len(ids) == 4
+
+
+def test_viewport_api_clusters_and_points(authenticated_api_client):
+    user = get_user_model().objects.create(username='map', password='pw')
+    for i in range(3):
+        PointOfInterest.objects.create(operator=user, name=f'Dense{i}', location=Point(-47.001 + i * 0.0001, -23.001))
+    PointOfInterest.objects.create(operator=user, name='Remote', location=Point(-46.2, -23.001))
+    url = reverse('api:pointofinterest-viewport')
+    resp = authenticated_api_client.get(url + '?bbox=-47.5,-23.5,-46.0,-22.5&zoom=8')
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.data['mode'] == 'clusters'
+    assert sorted(c['count'] for c in resp.data['clusters']) == [1, 3]
+    resp = authenticated_api_client.get(url + '?bbox=-47.002,-23.002,-47.0,-23.0&zoom=17')
+    assert resp.data['mode'] == 'points'
+    assert sorted(p['name'] for p in resp.data['points']) == ['Dense0', 'Dense1', 'Dense2']
+    assert resp.data['truncated'] is False
+
+
+def test_viewport_follows_poi_writes_and_flags_truncation(
+    authenticated_api_client, settings, django_capture_on_commit_callbacks
+):
+    user = get_user_model().objects.create(username='mapper', password='pw')
+    first = services.create_poi(user, 'First', Point(-47.001, -23.001))
+    url = reverse('api:pointofinterest-viewport') + '?bbox=-47.002,-23.002,-47.0,-23.0&zoom=17'
+    assert [p['name'] for p in authenticated_api_client.get(url).data['points']] == ['First']
+    with django_capture_on_commit_callbacks(execute=True):
+        services.create_poi(user, 'Second', Point(-47.0012, -23.0012))
+    resp = authenticated_api_client.get(url)
+    assert ([p['name'] for p in resp.data['points']], resp.data['truncated']) == (['First', 'Second'], False)
+
+    settings.VIEWPORT_MAX_POINTS = 1
+    with django_capture_on_commit_callbacks(execute=True):
+        services.create_poi(user, 'Third', Point(-47.0011, -23.0011))
+    resp = authenticated_api_client.get(url)
+    assert ([p['id'] for p in resp.data['points']], resp.data['truncated']) == ([first.pk], True)
+
+
+def test_viewport_api_requires_bbox(authenticated_api_client):
+    resp = authenticated_api_client.get(reverse('api:pointofinterest-viewport') + '?zoom=3')
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_poi_tile_api(api_client, user):
+    services.create_poi(user, 'Tower', Point(2.2945, 48.8584))
+    x, y = tiles.tile_for(2.2945, 48.8584, 14)
+    resp = api_client.get(reverse('api:poi-tile', args=[14, x, y]))
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp['Content-Type'] == 'application/vnd.mapbox-vector-tile'
+    assert resp.content
+    assert api_client.get(reverse('api:poi-tile', args=[1, 5, 0])).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_distance_matrix_api(authenticated_api_client, user):
+    a = PointOfInterest.objects.create(operator=user, name='A', location=Point(0, 0))
+    b = PointOfInterest.objects.create(operator=user, name='B', location=Point(0, 1))
+    url = reverse('api:pointofinterest-distance-matrix')
+    resp = authenticated_api_client.get(f'{url}?ids={b.id},{a.id}')
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.data['ids'] == [b.id, a.id]
+    assert resp.data['matrix_km'] == [[0.0, 111.195], [111.195, 0.0]]
+    assert authenticated_api_client.get(f'{url}?ids={a.id},0').status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_calendar_rolls_up_days_and_follows_bookings(api_client, user, django_capture_on_commit_callbacks):
+    poi = services.create_poi(user, 'Lighthouse', Point(2, 2))
+    morning = services.create_schedule(poi, '2040-06-03T09:00Z', '2040-06-03T10:00Z', total_capacity=2)
+    services.create_schedule(poi, '2040-06-03T14:00Z', '2040-06-03T15:00Z', total_capacity=5)
+    services.create_schedule(poi, '2040-06-20T09:00Z', '2040-06-20T10:00Z', total_capacity=4, is_active=False)
+    services.create_schedule(poi, '2040-07-01T09:00Z', '2040-07-01T10:00Z', total_capacity=4)
+    url = reverse('api:pointofinterest-calendar', args=[poi.pk])
+
+    days = api_client.get(url, {'month': '2040-06'}).data['days']
+    assert [
+        (day['date'].isoformat(), day['slots'], day['total_capacity'], day['remaining_capacity']) for day in days
+    ] == [('2040-06-03', 2, 7, 7)]
+    assert days[0]['first_available'].hour == 9
+
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Coast'), poi, date(2040, 6, 3), time(9, 0), time(10, 0)
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        services.create_booking(user, item, morning, 2)
+    day = api_client.get(url, {'month': '2040-06'}).data['days'][0]
+    assert (day['remaining_capacity'], day['first_available'].hour) == (5, 14)
+    assert api_client.get(url, {'month': 'June'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    # Moving a slot to another month drops both months once the move commits
+    assert len(api_client.get(url, {'month': '2040-07'}).data['days']) == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        services.update_schedule(morning, start='2040-07-02T09:00Z', end='2040-07-02T10:00Z')
+    assert [day['slots'] for day in api_client.get(url, {'month': '2040-06'}).data['days']] == [1]
+    assert len(api_client.get(url, {'month': '2040-07'}).data['days']) == 2
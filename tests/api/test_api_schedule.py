@@ -1,9 +1,17 @@
+import time
+from datetime import timedelta
+
 import pytest
+from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
+from django.core.exceptions import ValidationError
+from django.db import connection
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
-from app.models import PointOfInterest
+from app import holds, services
+from app.models import AttractionSchedule, Itinerary, ItineraryItem, PointOfInterest
 
 pytestmark = pytest.mark.django_db
 
@@ -25,7 +33,160 @@ def test_schedule_crud(authenticated_api_client, user):
     getresp = authenticated_api_client.get(f'{url}{sid}/')
     assert getresp.data['poi'] == poi.id
     assert getresp.data['total_capacity'] == 80
+    revalidated = authenticated_api_client.get(f'{url}{sid}/', HTTP_IF_NONE_MATCH=getresp['ETag'])
+    assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
     patch = authenticated_api_client.patch(f'{url}{sid}/', {'is_active': False}, format='json')
     assert patch.status_code == status.HTTP_200_OK
     deleteresp = authenticated_api_client.delete(f'{url}{sid}/')
     assert deleteresp.status_code in (204, 200, 202)
+
+
+@pytest.fixture
+def hold_setup(user):
+    poi = PointOfInterest.objects.create(operator=user, name='Carousel', location=Point(2, 3))
+    start = timezone.now() + timedelta(days=1)
+    schedule = AttractionSchedule.objects.create(
+        poi=poi, start=start, end=start + timedelta(hours=1), total_capacity=3, remaining_capacity=3
+    )
+    itinerary = Itinerary.objects.create(user=user, name='Fair')
+    item = ItineraryItem.objects.create(
+        itinerary=itinerary, poi=poi, date=start.date(), start_time=start.time(), end_time=start.time(), order=0
+    )
+    return schedule, item
+
+
+def test_seat_holds_confirm_and_release(authenticated_api_client, hold_setup):
+    schedule, item = hold_setup
+    holds_url = reverse('api:attractionschedule-holds', args=[schedule.pk])
+    availability_url = reverse('api:attractionschedule-availability', args=[schedule.pk])
+
+    first = authenticated_api_client.post(holds_url, {'seats': 2}, format='json')
+    assert first.status_code == status.HTTP_201_CREATED
+    assert first.data['available'] == 1
+    assert authenticated_api_client.post(holds_url, {'seats': 2}, format='json').status_code == 400
+    second = authenticated_api_client.post(holds_url, {'seats': 1}, format='json')
+    assert authenticated_api_client.get(availability_url).data == {'schedule': schedule.pk, 'available': 0, 'held': 3}
+
+    release_url = reverse('api:attractionschedule-release-hold', args=[schedule.pk, second.data['hold_id']])
+    assert authenticated_api_client.delete(release_url).status_code == status.HTTP_204_NO_CONTENT
+    assert authenticated_api_client.delete(release_url).status_code == status.HTTP_404_NOT_FOUND
+
+    confirm_url = reverse('api:attractionschedule-confirm-hold', args=[schedule.pk, first.data['hold_id']])
+    booked = authenticated_api_client.post(confirm_url, {'itinerary_item_id': item.pk}, format='json')
+    assert booked.status_code == status.HTTP_201_CREATED
+    assert (booked.data['seats'], booked.data['status']) == (2, 'confirmed')
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 1
+    assert authenticated_api_client.post(confirm_url, {'itinerary_item_id': item.pk}, format='json').status_code == 404
+    assert authenticated_api_client.get(availability_url).data == {'schedule': schedule.pk, 'available': 1, 'held': 0}
+
+
+def test_expired_holds_free_their_seats(user, hold_setup):
+    schedule, _ = hold_setup
+    holds.load_capacity(schedule.pk, schedule.remaining_capacity, holds.capacity_version(schedule.pk))
+    expired = holds.hold(schedule.pk, 3, user.pk, ttl_seconds=0.001)
+    time.sleep(0.01)
+    assert holds.available(schedule.pk) == {'available': 3, 'held': 0}
+    with pytest.raises(holds.HoldNotFound):
+        holds.take(schedule.pk, expired['hold_id'], user.pk, claim=True)
+
+
+def test_direct_bookings_leave_held_seats_alone(user, hold_setup):
+    schedule, item = hold_setup
+    services.hold_seats(user, schedule, 2)
+    with pytest.raises(ValidationError):
+        services.create_booking(user, item, schedule, 2)
+    services.create_booking(user, item, schedule, 1)
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 2
+    assert services.schedule_availability(schedule.pk) == {'schedule': schedule.pk, 'available': 0, 'held': 2}
+
+
+def test_available_schedules_near_a_point(api_client, user):
+    near = PointOfInterest.objects.create(operator=user, name='Pier', location=Point(13.4, 52.5))
+    far = PointOfInterest.objects.create(operator=user, name='Harbour', location=Point(14.4, 52.5))
+    start = timezone.now() + timedelta(hours=2)
+
+    def slot(poi, hours, remaining=5, is_active=True):
+        begin = start + timedelta(hours=hours)
+        return AttractionSchedule.objects.create(
+            poi=poi,
+            start=begin,
+            end=begin + timedelta(hours=1),
+            total_capacity=5,
+            remaining_capacity=remaining,
+            is_active=is_active,
+        )
+
+    later, first = slot(near, 3), slot(near, 1)
+    slot(near, 2, remaining=1)
+    slot(near, 2, is_active=False)
+    slot(near, 30)
+    slot(far, 1)
+
+    url = reverse('api:attractionschedule-available')
+    params = {'lon': 13.4, 'lat': 52.5, 'radius': 5, 'min_seats': 2, 'page_size': 1}
+    page = api_client.get(url, params)
+    assert page.status_code == status.HTTP_200_OK
+    assert [row['id'] for row in page.data['results']] == [first.pk]
+    assert page.data['results'][0]['poi_name'] == 'Pier'
+    page = api_client.get(page.data['next'])
+    assert [row['id'] for row in page.data['results']] == [later.pk]
+    assert page.data['next'] is None
+    assert api_client.get(url, {'lon': 13.4}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def _child_indexes(index):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass', [index])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_available_schedule_branches_use_their_partial_indexes(user):
+    poi = PointOfInterest.objects.create(operator=user, name='Quay', location=Point(13.4, 52.5))
+    start = timezone.now() + timedelta(days=1)
+    unsharded = services.create_schedule(poi, start, start + timedelta(hours=1), total_capacity=4)
+    sharded = services.create_schedule(poi, start, start + timedelta(hours=1), total_capacity=4, shard_count=2)
+    services.create_schedule(poi, start, start + timedelta(hours=1), total_capacity=1)
+    ids = services.available_schedule_ids(13.4, 52.5, 5, start - timedelta(hours=1), start + timedelta(hours=1), 2)
+    assert sorted(row['pk'] for row in ids) == sorted([unsharded.pk, sharded.pk])
+
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+    plan = ids.explain()
+    assert any(name in plan for name in _child_indexes('schedule_bookable_idx')), plan
+    assert any(name in plan for name in _child_indexes('schedule_sharded_idx')), plan
+
+
+def test_generate_recurring_schedules_is_idempotent(authenticated_api_client, user):
+    poi = PointOfInterest.objects.create(operator=user, name='Boat tour', location=Point(2, 3))
+    url = reverse('api:attractionschedule-generate')
+    rule = {
+        'poi': poi.id,
+        'start_date': '2040-06-01',  # a Friday
+        'end_date': '2040-06-10',
+        'start_time': '09:00',
+        'end_time': '17:00',
+        'every_minutes': 30,
+        'weekdays': [0, 1, 2, 3, 4, 5],
+        'exclude_dates': ['2040-06-05'],
+        'total_capacity': 12,
+    }
+    preview = authenticated_api_client.post(url, {**rule, 'dry_run': True}, format='json')
+    assert preview.status_code == status.HTTP_200_OK
+    # Fri, Sat, Mon, Wed, Thu, Fri, Sat: 7 days of 16 slots
+    assert (preview.data['slots'], preview.data['to_create'], preview.data['created']) == (112, 112, 0)
+    assert not AttractionSchedule.objects.exists()
+
+    created = authenticated_api_client.post(url, rule, format='json')
+    assert created.status_code == status.HTTP_201_CREATED
+    assert created.data['created'] == AttractionSchedule.objects.filter(poi=poi).count() == 112
+
+    rerun = authenticated_api_client.post(url, {**rule, 'end_date': '2040-06-11'}, format='json')
+    assert (rerun.data['created'], rerun.data['existing']) == (16, 112)
+    decades = authenticated_api_client.post(url, {**rule, 'end_date': '2140-06-10', 'dry_run': True}, format='json')
+    assert decades.status_code == status.HTTP_400_BAD_REQUEST
+
+    other = get_user_model().objects.create_user(username='other-operator', password='pw')
+    authenticated_api_client.force_authenticate(other)
+    assert authenticated_api_client.post(url, rule, format='json').status_code == status.HTTP_403_FORBIDDEN
@@ -1,10 +1,28 @@
+import uuid
 from typing import Any
 
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from rest_framework.test import APIClient
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(settings):
+    # Every test gets its own key namespace so cached responses and cells never leak between tests or runs
+    # and the two-tier cache uses the in-process invalidation bus
+    prefix = f'test-{uuid.uuid4().hex}'
+    configs = {alias: {**config, 'KEY_PREFIX': prefix} for alias, config in settings.CACHES.items()}
+    hot = configs.get(settings.HOT_CACHE_ALIAS, {})
+    if 'OPTIONS' in hot:
+        hot['OPTIONS'] = {**hot['OPTIONS'], 'BUS': 'local'}
+    settings.CACHES = configs
+    yield
+    for alias in settings.CACHES:
+        if hasattr(caches[alias], 'delete_pattern'):
+            caches[alias].delete_pattern('*')
+
+
 @pytest.fixture
 def user(db: Any) -> User:
     return User.objects.create_user(username='testuser', password='password123')
@@ -0,0 +1,52 @@
+import uuid
+
+from django.core.cache import cache
+
+from app.cache_backends import TieredCache
+
+
+def _worker(channel, **options):
+    # Distinct locations on one channel behave like two worker processes
+    return TieredCache(
+        f'worker-{uuid.uuid4().hex}', {'OPTIONS': {'SHARED': 'default', 'BUS': 'local', 'CHANNEL': channel, **options}}
+    )
+
+
+def test_writes_invalidate_other_workers_local_copies():
+    channel = uuid.uuid4().hex
+    a, b = _worker(channel), _worker(channel)
+    a.set('poi', 1)
+    assert b.get('poi') == 1
+    cache.set('poi', 2)
+    # Served from b's memory, not the shared cache
+    assert b.get('poi') == 1
+    a.set('poi', 3)
+    assert b.get('poi') == 3
+    a.delete('poi')
+    assert b.get('poi') is None
+    assert b.get_many(['poi', 'other']) == {}
+
+
+def test_local_layer_is_size_bounded():
+    a = _worker(uuid.uuid4().hex, MAX_ENTRIES=2)
+    a.set_many({'one': 1, 'two': 2, 'three': 3})
+    cache.set_many({'one': 'shared', 'two': 'shared', 'three': 'shared'})
+    assert a.get_many(['one', 'two', 'three']) == {'one': 'shared', 'two': 2, 'three': 3}
+
+
+def test_incr_invalidates_other_workers_local_copies():
+    channel = uuid.uuid4().hex
+    a, b = _worker(channel), _worker(channel)
+    a.set('generation', 1)
+    assert b.get('generation') == 1
+    a.incr('generation')
+    assert b.get('generation') == 2
+
+
+def test_incr_many_starts_missing_keys_from_initial():
+    channel = uuid.uuid4().hex
+    a, b = _worker(channel), _worker(channel)
+    a.set('bumped', 5)
+    assert b.get('bumped') == 5
+    assert a.incr_many(['bumped', 'missing'], 100, 60) == {'bumped': 6, 'missing': 101}
+    assert b.get_many(['bumped', 'missing']) == {'bumped': 6, 'missing': 101}
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+
+from app import caching
+
+
+def test_get_or_compute_serves_stale_while_another_worker_refreshes(monkeypatch):
+    name = caching.register('test-swr')
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'time', lambda: now[0])
+    assert caching.get_or_compute(name, 'k', lambda: 'v1', timeout=10) == 'v1'
+    assert caching.get_or_compute(name, 'k', lambda: 'unused', timeout=10) == 'v1'
+    now[0] += 11
+    token = caching.acquire(caching.lock_key('k'))
+    assert caching.get_or_compute(name, 'k', lambda: 'v2', timeout=10) == 'v1'
+    caching.release(caching.lock_key('k'), token)
+    assert caching.get_or_compute(name, 'k', lambda: 'v2', timeout=10) == 'v2'
+    assert cache.get(caching.lock_key('k')) is None
+    assert caching.stats()[name] == {'hit': 1, 'miss': 2, 'stale': 1}
+
+
+def test_get_or_compute_skips_uncacheable_values():
+    name = caching.register('test-uncacheable')
+    assert caching.get_or_compute(name, 'error', lambda: 'e1', timeout=10, cacheable=lambda _: False) == 'e1'
+    assert caching.get_or_compute(name, 'error', lambda: 'e2', timeout=10) == 'e2'
+    assert caching.stats()[name]['miss'] == 2
+
+
+def test_cold_miss_waits_for_the_lock_holder(settings):
+    settings.CACHE_LOCK_WAIT = 0.2
+    name = caching.register('test-wait')
+    caching.acquire(caching.lock_key('slow'))
+    # The holder never stores a value, so the waiter gives up and computes itself
+    assert caching.get_or_compute(name, 'slow', lambda: 'mine', timeout=10) == 'mine'
+    assert caching.stats()[name]['miss'] == 1
+
+
+def test_counters_reach_the_shared_cache_in_batches(settings):
+    settings.CACHE_STATS_FLUSH_INTERVAL = 3600
+    name = caching.register('test-batched')
+    caching.flush_stats()
+    for _ in range(3):
+        caching.record(name, 'hit')
+    assert cache.get(caching._stats_key(name, 'hit')) is None
+    assert caching.stats()[name]['hit'] == 3
@@ -0,0 +1,205 @@
+import csv
+import gzip
+import json
+from datetime import date, time, timedelta
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.utils import timezone
+
+from app import services
+from app.models import (
+    AttractionSchedule,
+    Booking,
+    Itinerary,
+    ItineraryItem,
+    PointOfInterest,
+    POITranslation,
+    Review,
+    ScheduleCapacityShard,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+def _feature(name, lon, lat, **properties):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+        'properties': {'name': name, **properties},
+    }
+
+
+def test_import_pois_geojson_in_batches(tmp_path):
+    get_user_model().objects.create(username='importer', password='pw')
+    features = [_feature(f'Spot {i}', 10 + i / 100, 50, translations={'de': {'name': f'Ort {i}'}}) for i in range(5)]
+    path = tmp_path / 'pois.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    out = StringIO()
+    call_command('import_pois', str(path), operator='importer', batch_size=2, stdout=out)
+    assert PointOfInterest.objects.count() == 5
+    assert POITranslation.objects.filter(language_code='de').count() == 5
+    assert 'rows/s' in out.getvalue()
+
+
+def test_import_pois_dry_run_reports_invalid_rows(tmp_path):
+    get_user_model().objects.create(username='importer', password='pw')
+    path = tmp_path / 'pois.csv'
+    path.write_text('name,lon,lat,name_fr\nTower,2.29,48.85,Tour\n,1,1,\nFar,500,1,\n')
+    out, err = StringIO(), StringIO()
+    call_command('import_pois', str(path), operator='importer', dry_run=True, stdout=out, stderr=err)
+    assert PointOfInterest.objects.count() == 0
+    assert '1 records validated, 2 invalid skipped' in out.getvalue()
+    assert 'Record 2' in err.getvalue() and 'Record 3' in err.getvalue()
+
+
+def test_import_pois_resumes_from_checkpoint(tmp_path):
+    get_user_model().objects.create(username='importer', password='pw')
+    path = tmp_path / 'pois.ndjson'
+    path.write_text('\n'.join(json.dumps(_feature(f'Stop {i}', i, i)) for i in range(4)))
+    checkpoint = tmp_path / 'import.checkpoint'
+    checkpoint.write_text(json.dumps({'source': str(path.resolve()), 'processed': 3}))
+    call_command('import_pois', str(path), operator='importer', checkpoint=str(checkpoint), stdout=StringIO())
+    assert list(PointOfInterest.objects.values_list('name', flat=True)) == ['Stop 3']
+    assert json.loads(checkpoint.read_text())['processed'] == 4
+
+
+def test_import_pois_resume_skips_a_batch_committed_before_the_crash(tmp_path):
+    operator = get_user_model().objects.create(username='importer', password='pw')
+    path = tmp_path / 'pois.ndjson'
+    path.write_text('\n'.join(json.dumps(_feature(f'Stop {i}', i, i)) for i in range(4)))
+    # The first two records were committed but the run died before it could mark them done
+    last = services.bulk_import_pois(operator, [{'name': 'Stop 1', 'lon': 1, 'lat': 1, 'translations': {}}])[-1]
+    checkpoint = tmp_path / 'import.checkpoint'
+    state = {'source': str(path.resolve()), 'processed': 0, 'pending': {'processed': 2, 'last_poi': last.pk}}
+    checkpoint.write_text(json.dumps(state))
+    call_command('import_pois', str(path), operator='importer', checkpoint=str(checkpoint), stdout=StringIO())
+    assert sorted(PointOfInterest.objects.values_list('name', flat=True)) == ['Stop 1', 'Stop 2', 'Stop 3']
+    assert json.loads(checkpoint.read_text()) == {'source': str(path.resolve()), 'processed': 4}
+
+
+def test_import_pois_counts_oversized_translations_as_invalid(tmp_path):
+    get_user_model().objects.create(username='importer', password='pw')
+    features = [
+        _feature('Ok', 1, 1, translations={'de': {'name': 'Gut'}}),
+        _feature('Bad code', 1, 1, translations={'x' * 11: {'name': 'Lang'}}),
+        _feature('Bad name', 1, 1, translations={'fr': {'name': 'n' * 201}}),
+    ]
+    path = tmp_path / 'pois.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    out, err = StringIO(), StringIO()
+    call_command('import_pois', str(path), operator='importer', stdout=out, stderr=err)
+    assert list(PointOfInterest.objects.values_list('name', flat=True)) == ['Ok']
+    assert '1 records imported, 2 invalid skipped' in out.getvalue()
+
+
+def test_import_pois_skips_unsupported_features(tmp_path):
+    get_user_model().objects.create(username='importer', password='pw')
+    line = {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]}, 'properties': {}}
+    empty = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': []}, 'properties': {'name': 'Empty'}}
+    null = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': None}, 'properties': {'name': 'Null'}}
+    path = tmp_path / 'pois.ndjson'
+    path.write_text('\n'.join(json.dumps(item) for item in [line, empty, _feature('Kept', 1, 1), null, 7]))
+    out, err = StringIO(), StringIO()
+    call_command('import_pois', str(path), operator='importer', stdout=out, stderr=err)
+    assert list(PointOfInterest.objects.values_list('name', flat=True)) == ['Kept']
+    assert '1 records imported, 4 invalid skipped' in out.getvalue()
+    assert 'Record 1: Only Point geometries are supported' in err.getvalue()
+
+
+def test_recompute_ratings_repairs_drift():
+    user = get_user_model().objects.create(username='critic', password='pw')
+    poi = PointOfInterest.objects.create(operator=user, name='Pier', location=Point(4, 4))
+    Review.objects.create(user=user, poi=poi, rating=3)
+    out = StringIO()
+    call_command('recompute_ratings', stdout=out)
+    poi.refresh_from_db()
+    assert (poi.review_count, poi.rating_sum) == (1, 3)
+    assert 'for 1 points of interest' in out.getvalue()
+
+
+def test_rebuild_itinerary_stats_backfills_rows():
+    user = get_user_model().objects.create(username='walker', password='pw')
+    itinerary = Itinerary.objects.create(user=user, name='Backfill')
+    for order, lat in enumerate((0, 1)):
+        poi = PointOfInterest.objects.create(operator=user, name=f'Stop {order}', location=Point(0, lat))
+        ItineraryItem.objects.create(
+            itinerary=itinerary,
+            poi=poi,
+            date=date(2040, 1, 1),
+            start_time=time(9 + order),
+            end_time=time(10 + order),
+            order=order,
+        )
+    out = StringIO()
+    call_command('rebuild_itinerary_stats', stdout=out)
+    assert list(itinerary.day_stats.values_list('item_count', flat=True)) == [2]
+    assert itinerary.day_stats.get().walk_km == pytest.approx(111.195, abs=1e-3)
+    assert 'for 1 itineraries' in out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_bookings_reports_consistent_strategies():
+    out = StringIO()
+    call_command('benchmark_bookings', threads=2, bookings=12, capacity=10, shards=[3], stdout=out)
+    lines = out.getvalue().splitlines()
+    assert [line.split(':')[0] for line in lines] == ['conditional', 'row_lock', '3 shards']
+    assert all('10 booked, 2 rejected' in line and line.endswith('consistent') for line in lines)
+
+
+def test_expire_bookings_releases_seats_of_stale_pending_bookings():
+    user = get_user_model().objects.create(username='sweeper', password='pw')
+    poi = services.create_poi(user, 'Tower', Point(0, 4))
+    schedule = services.create_schedule(poi, '2040-01-01T10:00Z', '2040-01-01T12:00Z', total_capacity=10)
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Climb'), poi, date(2040, 1, 1), time(10, 0), time(12, 0)
+    )
+    stale = [services.create_booking(user, item, schedule, 2) for _ in range(3)]
+    paid = services.create_booking(user, item, schedule, 1)
+    services.confirm_booking(paid, 'pay-1')
+    Booking.objects.filter(pk__in=[booking.pk for booking in stale + [paid]]).update(
+        created_at=timezone.now() - timedelta(hours=1)
+    )
+    fresh = services.create_booking(user, item, schedule, 1)
+    out = StringIO()
+    call_command('expire_bookings', batch_size=2, stdout=out)
+    assert 'Expired 3 pending bookings' in out.getvalue()
+    assert dict(Booking.objects.values_list('pk', 'status')) == {
+        **{booking.pk: Booking.STATUS_CANCELLED for booking in stale},
+        paid.pk: Booking.STATUS_CONFIRMED,
+        fresh.pk: Booking.STATUS_PENDING,
+    }
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 8
+
+
+def test_manage_partitions_creates_months_and_archives_old_ones(tmp_path):
+    user = get_user_model().objects.create(username='partitions', password='pw')
+    poi = services.create_poi(user, 'Archive', Point(0, 5))
+    old = services.create_schedule(poi, '2020-01-01T10:00Z', '2020-01-01T12:00Z', total_capacity=5, shard_count=2)
+    upcoming = services.create_schedule(
+        poi, timezone.now() + timedelta(days=1), timezone.now() + timedelta(days=1, hours=1), total_capacity=5
+    )
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Past'), poi, date(2020, 1, 1), time(10, 0), time(12, 0)
+    )
+    booking = Booking.objects.create(user=user, itinerary_item=item, schedule=old, seats=1)
+    out, err = StringIO(), StringIO()
+    call_command('manage_partitions', ahead=5, archive=True, retention=0, archive_dir=tmp_path, stdout=out, stderr=err)
+    assert 'Created app_booking_p' in out.getvalue()
+    # This month's booking is kept, so the schedule month it refers to is too
+    assert 'Kept app_attractionschedule_plegacy: 1 bookings' in err.getvalue()
+    assert AttractionSchedule.objects.filter(pk=old.pk).exists()
+
+    booking.delete()
+    out = StringIO()
+    call_command('manage_partitions', ahead=5, archive=True, retention=0, archive_dir=tmp_path, stdout=out)
+    assert 'Archived app_attractionschedule_plegacy' in out.getvalue()
+    with gzip.open(tmp_path / 'app_attractionschedule_plegacy.csv.gz', 'rt') as archive:
+        rows = list(csv.DictReader(archive))
+    assert [int(row['id']) for row in rows] == [old.pk]
+    assert list(AttractionSchedule.objects.values_list('pk', flat=True)) == [upcoming.pk]
+    assert not ScheduleCapacityShard.objects.exists()
@@ -0,0 +1,21 @@
+import math
+
+import numpy as np
+
+from app import distance
+
+
+def test_haversine_km_broadcasts_and_matches_one_degree():
+    km = distance.haversine_km(0.0, 0.0, [0.0, 1.0, 0.0], [1.0, 0.0, 0.0])
+    assert np.allclose(km, [111.195, 111.195, 0.0], atol=1e-3)
+
+
+def test_leg_and_matrix_are_consistent():
+    lons, lats = [13.40, 13.41, 13.45, 13.38], [52.52, 52.50, 52.51, 52.53]
+    legs = distance.leg_km(lons, lats)
+    matrix = distance.distance_matrix_km(lons, lats)
+    assert matrix.shape == (4, 4)
+    assert np.allclose(matrix, matrix.T)
+    assert np.allclose(np.diag(matrix), 0)
+    assert np.allclose(legs, [matrix[i, i + 1] for i in range(3)])
+    assert math.isclose(legs[0], 2.3, rel_tol=0.05)
@@ -0,0 +1,13 @@
+from app import locales
+
+
+def test_language_chain_adds_base_languages_in_preference_order():
+    assert locales.language_chain('de-AT,en;q=0.5,de;q=0.3') == ('de-at', 'de', 'en')
+    assert locales.language_chain('fr;q=0.2, pt-BR') == ('pt-br', 'pt', 'fr')
+    assert locales.language_chain('*') == ()
+    assert locales.language_chain('') == ()
+
+
+def test_chain_key_marks_the_default_chain():
+    assert locales.chain_key(('de-at', 'de')) == 'de-at,de'
+    assert locales.chain_key(()) == '-'
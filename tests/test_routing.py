@@ -0,0 +1,31 @@
+import time
+
+from app import distance, routing
+
+MINUTES_PER_KM = 60 / 4.5
+
+
+def _line(lons):
+    return distance.distance_matrix_km(lons, [0.0] * len(lons))
+
+
+def test_optimize_route_shortens_open_windows():
+    matrix = _line([0.0, 0.03, 0.01, 0.02])
+    route = routing.optimize_route(matrix, [(540, 1020)] * 4, MINUTES_PER_KM, 0.05)
+    assert route == [0, 2, 3, 1]
+
+
+def test_optimize_route_respects_time_windows():
+    matrix = _line([0.0, 0.03, 0.01, 0.02])
+    windows = [(540, 560), (600, 620), (660, 680), (720, 740)]
+    assert routing.optimize_route(matrix, windows, MINUTES_PER_KM, 0.05) == [0, 1, 2, 3]
+
+
+def test_optimize_route_thirty_stops_within_budget():
+    lons = [(i * 7919 % 30) / 1000 for i in range(30)]
+    matrix = _line(lons)
+    started = time.perf_counter()
+    route = routing.optimize_route(matrix, [(540, 1020)] * 30, MINUTES_PER_KM, 0.05)
+    assert time.perf_counter() - started < 0.2
+    assert sorted(route) == list(range(30))
+    assert routing.route_km(route, matrix) < routing.route_km(range(30), matrix)
@@ -1,12 +1,15 @@
+import threading
 from datetime import date, time
+from time import sleep
 
 import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 
-from app import services
-from app.models import AttractionSchedule, PointOfInterest
+from app import generations, locales, partitions, services, tiles
+from app.models import AttractionSchedule, Booking, PointOfInterest
 
 pytestmark = pytest.mark.django_db
 
@@ -20,6 +23,19 @@ def test_create_and_get_poi():
     name, desc = services.get_translation(poi, 'de')
     assert name == 'Burg'
     assert desc == 'Schön'
+    assert services.get_translation(poi, 'de-AT') == ('Burg', 'Schön')
+    assert services.get_translation(poi, 'fr') == ('Castle', '')
+
+
+def test_get_translation_reads_prefetched_translations(django_assert_num_queries):
+    user = get_user_model().objects.create(username='svclist', password='pw')
+    for i in range(3):
+        services.create_poi(user, f'Castle{i}', Point(1, i), translations={'de': {'name': f'Burg{i}'}})
+    services.create_poi(user, 'Bridge', Point(2, 0))
+    pois = list(PointOfInterest.objects.order_by('id').with_translations(locales.fallbacks('de-at')))
+    with django_assert_num_queries(0):
+        names = [services.get_translation(poi, 'de-AT')[0] for poi in pois]
+    assert names == ['Burg0', 'Burg1', 'Burg2', 'Bridge']
 
 
 def test_add_item_and_overlap_detection():
@@ -45,3 +61,228 @@ def test_booking_flow():
     services.cancel_booking(booking)
     schedule.refresh_from_db()
     assert schedule.remaining_capacity == 10
+
+
+@pytest.mark.parametrize('strategy', services.BOOKING_STRATEGIES)
+def test_booking_strategies_never_oversell(strategy):
+    user = get_user_model().objects.create(username=f'bk-{strategy}', password='pw')
+    poi = services.create_poi(user, 'Wheel', Point(0, 2))
+    schedule = services.create_schedule(poi, '2040-01-01T10:00Z', '2040-01-01T12:00Z', total_capacity=3)
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Fair'), poi, date(2040, 1, 1), time(10, 0), time(12, 0)
+    )
+    booking = services.create_booking(user, item, schedule, 2, strategy)
+    with pytest.raises(ValidationError):
+        services.create_booking(user, item, schedule, 2, strategy)
+    assert Booking.objects.filter(schedule=schedule).count() == 1
+    services.cancel_booking(booking)
+    services.cancel_booking(booking)
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 3
+
+
+def _wait_for_lock_waiter():
+    # Until another connection is queued on a row lock
+    for _ in range(100):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")
+            if cursor.fetchone()[0]:
+                return
+        sleep(0.05)
+    raise AssertionError('no connection is waiting for the row lock')
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('strategy', ['row_lock', 'conditional'])
+def test_booking_retries_when_its_schedule_moves_partition(strategy):
+    user = get_user_model().objects.create(username=f'mover-{strategy}', password='pw')
+    poi = services.create_poi(user, 'Ferry', Point(0, 3))
+    month = partitions.add_months(partitions.month_start(partitions.utc_today()), 1)
+    schedule = services.create_schedule(poi, f'{month}T10:00Z', f'{month}T12:00Z', total_capacity=5)
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Crossing'), poi, month, time(10, 0), time(12, 0)
+    )
+    booked = []
+
+    def book():
+        try:
+            booked.append(services.create_booking(user, item, schedule, 2, strategy))
+        finally:
+            connection.close()
+
+    later = partitions.add_months(month, 1)
+    with transaction.atomic():
+        list(AttractionSchedule.objects.select_for_update().filter(pk=schedule.pk).values('pk'))
+        booker = threading.Thread(target=book)
+        booker.start()
+        _wait_for_lock_waiter()
+        services.update_schedule(schedule, start=f'{later}T10:00Z', end=f'{later}T12:00Z')
+    booker.join()
+    assert len(booked) == 1
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT tableoid::regclass::text FROM app_attractionschedule WHERE id = %s', [schedule.pk])
+        assert cursor.fetchone()[0] != partitions.partition_name('app_attractionschedule', month)
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 3
+    services.cancel_booking(booked[0])
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 5
+
+
+def test_poi_write_bumps_versions_of_its_tiles(django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create(username='tileuser', password='pw')
+    x, y = tiles.tile_for(13.405, 52.52, 12)
+    tag = f'mvt:12:{x}:{y}'
+    before = generations.get_many([tag])[tag]
+    with django_capture_on_commit_callbacks(execute=True):
+        services.create_poi(user, 'Gate', Point(13.405, 52.52))
+    assert generations.get_many([tag])[tag] == before + 1
+
+
+def test_review_counters_follow_submit_update_and_delete():
+    user = get_user_model().objects.create(username='rater', password='pw')
+    other = get_user_model().objects.create(username='rater2', password='pw')
+    poi = services.create_poi(user, 'Tower', Point(3, 3))
+    services.submit_review(user, poi, 4, 'Good')
+    review = services.submit_review(other, poi, 2, 'Meh')
+    services.submit_review(user, poi, 5, 'Better on second visit')
+    rated = services.poi_with_aggregate_rating(poi.id)
+    assert (rated.review_count, rated.rating_sum, rated.avg_rating) == (2, 7, 3.5)
+    services.update_review(review, rating=4)
+    rated = services.poi_with_aggregate_rating(poi.id)
+    assert (rated.review_count, rated.rating_sum, rated.avg_rating) == (2, 9, 4.5)
+    services.delete_review(review)
+    services.delete_review(review)
+    rated = services.poi_with_aggregate_rating(poi.id)
+    assert (rated.review_count, rated.rating_sum, rated.avg_rating) == (1, 5, 5.0)
+
+
+def test_nearby_cells_are_evicted_by_poi_writes(django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create(username='celluser', password='pw')
+    serialize = lambda pois: [{'id': poi.id, 'name': poi.name} for poi in pois]  # noqa: E731
+    with django_capture_on_commit_callbacks(execute=True):
+        poi = services.create_poi(user, 'Fountain', Point(2.35, 48.85))
+    assert [r['name'] for r in services.search_pois_nearby_cached(2.35, 48.85, 1.0, serialize)] == ['Fountain']
+    PointOfInterest.objects.filter(pk=poi.pk).update(name='Stale')
+    assert [r['name'] for r in services.search_pois_nearby_cached(2.351, 48.85, 1.0, serialize)] == ['Fountain']
+    with django_capture_on_commit_callbacks(execute=True):
+        services.update_poi(poi, name='Renamed')
+    assert [r['name'] for r in services.search_pois_nearby_cached(2.35, 48.85, 1.0, serialize)] == ['Renamed']
+    assert services.search_pois_nearby_cached(2.36, 48.85, 0.1, serialize) == []
+
+
+def test_itinerary_stats_sum_same_day_legs_in_km():
+    user = get_user_model().objects.create(username='walker', password='pw')
+    iti = services.create_itinerary(user, 'Meridian walk')
+    north = services.create_poi(user, 'North', Point(0, 1))
+    south = services.create_poi(user, 'South', Point(0, 0))
+    services.add_itinerary_item(iti, south, date(2040, 1, 1), time(9, 0), time(10, 0))
+    services.add_itinerary_item(iti, north, date(2040, 1, 1), time(11, 0), time(12, 0))
+    services.add_itinerary_item(iti, south, date(2040, 1, 2), time(9, 0), time(10, 0))
+    stats = services.get_itinerary_stats(iti.id)
+    assert stats['total_walk_km'] == pytest.approx(111.195, abs=1e-3)
+    assert [day['occupancy'] for day in stats['daily_occupancy']] == [2, 1]
+
+
+def test_itinerary_stats_sql_backend_matches_python():
+    user = get_user_model().objects.create(username='parity', password='pw')
+    iti = services.create_itinerary(user, 'Parity')
+    stops = [(13.40, 52.52), (13.41, 52.50), (13.45, 52.51), (2.35, 48.85), (2.29, 48.86)]
+    for i, (lon, lat) in enumerate(stops):
+        poi = services.create_poi(user, f'Stop {i}', Point(lon, lat))
+        day = date(2040, 3, 1) if i < 3 else date(2040, 3, 4)
+        services.add_itinerary_item(iti, poi, day, time(8 + i, 0), time(8 + i, 30))
+    python_stats = services.get_itinerary_stats(iti.id, backend='python')
+    sql_stats = services.get_itinerary_stats(iti.id, backend='sql')
+    assert sql_stats['daily_occupancy'] == python_stats['daily_occupancy']
+    assert sql_stats['total_walk_km'] == pytest.approx(python_stats['total_walk_km'], abs=1e-3)
+    assert services.get_itinerary_stats(services.create_itinerary(user, 'Empty').id, backend='sql') == {
+        'total_walk_km': 0.0,
+        'daily_occupancy': [],
+    }
+
+
+def test_stored_itinerary_stats_follow_item_writes():
+    user = get_user_model().objects.create(username='stored', password='pw')
+    iti = services.create_itinerary(user, 'Stored')
+    north = services.create_poi(user, 'North', Point(0, 1))
+    south = services.create_poi(user, 'South', Point(0, 0))
+    services.add_itinerary_item(iti, south, date(2040, 1, 1), time(9, 0), time(10, 0))
+    item = services.add_itinerary_item(iti, north, date(2040, 1, 1), time(11, 0), time(12, 0))
+    assert services.get_itinerary_stats(iti.id, backend='stored') == services.get_itinerary_stats(iti.id, backend='sql')
+    services.update_itinerary_item(item, date=date(2040, 1, 2))
+    assert list(iti.day_stats.values_list('date', 'item_count', 'walk_km')) == [
+        (date(2040, 1, 1), 1, 0.0),
+        (date(2040, 1, 2), 1, 0.0),
+    ]
+    services.update_poi(north, location=Point(0, 2))
+    services.update_itinerary_item(item, date=date(2040, 1, 1))
+    assert services.get_itinerary_stats(iti.id)['total_walk_km'] == pytest.approx(222.39, abs=1e-2)
+    services.remove_itinerary_item(item)
+    assert services.get_itinerary_stats(iti.id) == {
+        'total_walk_km': 0.0,
+        'daily_occupancy': [{'date': '2040-01-01', 'occupancy': 1}],
+    }
+
+
+def test_optimize_itinerary_keeps_booked_items_at_their_time():
+    user = get_user_model().objects.create(username='planner', password='pw')
+    iti = services.create_itinerary(user, 'Pinned')
+    day = date(2040, 5, 22)
+    items = {}
+    for name, lon, start in (
+        ('Z0', 0.0, time(9, 0)),
+        ('Z2', 0.01, time(10, 30)),
+        ('Z1', 0.03, time(12, 0)),
+        ('Z3', 0.02, time(13, 30)),
+    ):
+        poi = services.create_poi(user, name, Point(lon, 0.0))
+        items[name] = services.add_itinerary_item(iti, poi, day, start, time(start.hour + 1, start.minute))
+    schedule = services.create_schedule(items['Z2'].poi, '2040-05-22T10:30Z', '2040-05-22T11:30Z', total_capacity=5)
+    services.create_booking(user, items['Z2'], schedule, 1)
+    services.optimize_itinerary(iti)
+    assert list(iti.items.order_by('order').values_list('poi__name', 'start_time', 'end_time')) == [
+        ('Z0', time(9, 0), time(10, 0)),
+        ('Z2', time(10, 30), time(11, 30)),
+        ('Z3', time(11, 44), time(12, 44)),
+        ('Z1', time(12, 59), time(13, 59)),
+    ]
+
+
+def test_generation_touch_bumps_only_the_object_after_commit(django_capture_on_commit_callbacks):
+    before = generations.get_many(['poi', 'poi:1', 'poi:2'])
+    with django_capture_on_commit_callbacks() as callbacks:
+        generations.touch('poi', 1)
+        assert generations.get_many(['poi', 'poi:1', 'poi:2']) == before
+    for callback in callbacks:
+        callback()
+    after = generations.get_many(['poi', 'poi:1', 'poi:2'])
+    assert (after['poi'], after['poi:1'], after['poi:2']) == (before['poi'], before['poi:1'] + 1, before['poi:2'])
+
+
+def test_sharded_capacity_never_oversells_and_rebalances():
+    user = get_user_model().objects.create(username='bk-sharded', password='pw')
+    poi = services.create_poi(user, 'Stage', Point(0, 3))
+    schedule = services.create_schedule(poi, '2040-01-01T10:00Z', '2040-01-01T12:00Z', total_capacity=10, shard_count=4)
+    assert sorted(schedule.capacity_shards.values_list('remaining', flat=True)) == [2, 2, 3, 3]
+    item = services.add_itinerary_item(
+        services.create_itinerary(user, 'Gig'), poi, date(2040, 1, 1), time(10, 0), time(12, 0)
+    )
+    services.create_booking(user, item, schedule, 3)
+    # No single shard has 5 seats left: the booking is spread over several
+    booking = services.create_booking(user, item, schedule, 5)
+    with pytest.raises(ValidationError):
+        services.create_booking(user, item, schedule, 3)
+    assert services.remaining_seats(schedule) == 2
+    # Reads of sharded schedules sum the shards rather than the remaining_capacity snapshot (still 10)
+    annotated = services.with_remaining_seats(AttractionSchedule.objects.filter(pk=schedule.pk)).get()
+    assert (annotated.remaining_capacity, annotated.seats_left) == (10, 2)
+    assert services.poi_calendar(poi.pk, 2040, 1)[0]['remaining_capacity'] == 2
+    services.cancel_booking(booking)
+    assert services.rebalance_capacity_shards([schedule.pk]) == 1
+    assert sorted(schedule.capacity_shards.values_list('remaining', flat=True)) == [1, 2, 2, 2]
+    schedule.refresh_from_db()
+    assert schedule.remaining_capacity == 7
+    services.set_capacity_shards(schedule, 0)
+    assert schedule.capacity_shards.count() == 0
+    assert AttractionSchedule.objects.get(pk=schedule.pk).remaining_capacity == 7